@@ -3,16 +3,33 @@ Batch class is the base class for all batch classes.
 """
 
 import json
+import time
+import asyncio
 import logging
 import uuid
 import pickle
+import inspect
+import importlib
+import itertools
+import contextvars
 from abc import ABC, abstractmethod
-from typing import List, Any, Dict, Tuple
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Any, Dict, Set, Tuple, Type
 from pathlib import Path
 
-import jsonlines
-from langbatch.batch_storages import DATA_PATH, BatchStorage, FileBatchStorage
-from langbatch.errors import BatchInitializationError, BatchError, BatchValidationError
+from langbatch import json_codec
+from langbatch.batch_storages import BatchStorage, FileBatchStorage, get_default_data_path
+from langbatch.response_caches import ResponseCache, get_response_cache_reference, load_response_cache
+from langbatch.utils import RateLimiter, hash_request_body
+from langbatch.errors import BatchInitializationError, BatchError, BatchStateError, BatchValidationError, BatchResultsError
+
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+
+# langbatch.schemas imports the OpenAI types, it is imported on first use to keep the import of langbatch fast
+
+# set while `Batch.load` initializes a batch, loaded batches are mostly started already and do not keep the validated requests
+_loading_batch = contextvars.ContextVar("_loading_batch", default=False)
 
 class Batch(ABC):
     """
@@ -21,7 +38,21 @@ class Batch(ABC):
     Implementations of this class will be platform specific (OpenAI, Vertex AI, etc.)
     """
     _url: str = ""
+    _provider: str = ""
+    _max_requests: int | None = None # provider limit on the number of requests in a batch
+    _max_bytes: int | None = None # provider limit on the size of a batch file
+    _status_list_page_size: int = 100 # page size of the list endpoint used by get_statuses
+    _max_status_list_pages: int = 10 # pages of the list endpoint read by get_statuses before falling back to get_status
+    _request_schema: Type["BaseModel"] | None = None
+    _keep_validated_requests: bool = False # keep the requests validated in __init__ for _get_validated_requests, for classes converting the requests, except in load
+    _response_cache_chunk_size: int = 1000 # requests looked up in the response cache at once when creating a batch
+    _retryable_error_codes: Set[str] = {
+        "rate_limit_exceeded", "rate_limit_error", "server_error", "api_error", "overloaded_error", 
+        "timeout", "timeout_error", "request_expired"
+    } # error codes of failed requests worth sending again, besides 429 and 5xx status codes
     platform_batch_id: str | None = None
+    started_at: float | None = None # set by BatchHandler when the batch is started, used for turnaround times
+    realtime_results_file: str | None = None # set when the batch is run through the real-time endpoint of the provider, or answered from the response cache
 
     def __init__(self, file: str):
         """
@@ -32,34 +63,222 @@ class Batch(ABC):
         """
         self._file = file
         self.id = str(uuid.uuid4())
+        self._duplicates: Dict[str, List[str]] = {} # custom_id of a sent request -> custom_ids of its duplicates
+        self._packed_inputs: Dict[str, List[str]] = {} # custom_id of a sent request -> custom_ids of the inputs packed in it, in order
+        self._cached_results_file: str | None = None # results of the requests answered from the response cache, kept next to the batch results
+        self._response_cache: ResponseCache | None = None
+        self._responses_cached: bool = False # whether the responses of the results file were added to the response cache
+        self.redrive_attempt: int = 0 # number of times the requests of the batch were re-driven after failing
+        self.source_batch_ids: Dict[str, str] = {} # custom_id of a re-driven request -> id of the batch it was first sent in
+        self.redrive_custom_ids: List[str] = [] # custom_ids of the failed requests waiting to be re-driven by BatchHandler
+        self.redrive_at: float | None = None # time the failed requests are re-driven at
+        self.start_timings: Dict[str, float] = {} # "conversion" and "upload" durations in seconds of the last start
+        self._validated_requests: List[Dict[str, Any]] | None = None # requests validated in __init__, released once converted
 
         self._validate_requests() # Validate the requests in the batch file
 
     @classmethod
-    def _create_batch_file_from_requests(cls, requests) -> Path:
+    def _create_batch_file_from_requests(cls, requests: Iterable[Dict[str, Any]]) -> Path | None:
+        # requests are written as they are consumed, with a running count of the requests and bytes written
+        counts = [0, 0]
+        def progress(count: int, size: int):
+            counts[:] = count, size
+            logging.debug(f"Written {count} requests ({size} bytes) to batch file {file_path}")
+
+        file_path = None
+        try:
+            batches_dir = get_default_data_path() / "created_batches"
+            batches_dir.mkdir(exist_ok=True, parents=True)
+
+            id = str(uuid.uuid4())
+            file_path = batches_dir / f"{id}.jsonl"
+            json_codec.write_jsonl(file_path, requests, progress=progress)
+        except BatchInitializationError:
+            cls._remove_partial_batch_file(file_path)
+            raise
+        except:
+            logging.error(f"Error creating batch file", exc_info=True)
+            cls._remove_partial_batch_file(file_path)
+            return None
+
+        count, size = counts
+        if (cls._max_requests and count > cls._max_requests) or (cls._max_bytes and size > cls._max_bytes):
+            logging.warning(
+                f"Batch file {file_path} with {count} requests ({size} bytes) exceeds the provider limits of {cls.__name__}, "
+                "run it with ShardedBatch"
+            )
+
+        return file_path
+
+    @classmethod
+    def _create_batch_file_from_raw_requests(cls, raw_requests: Iterable[bytes | str]) -> Path | None:
+        file_path = None
         try:
-            batches_dir = Path(DATA_PATH) / "created_batches"
+            batches_dir = get_default_data_path() / "created_batches"
             batches_dir.mkdir(exist_ok=True, parents=True)
 
             id = str(uuid.uuid4())
             file_path = batches_dir / f"{id}.jsonl"
-            with jsonlines.open(file_path, mode='w') as writer:
-                writer.write_all(requests)
+            json_codec.write_jsonl_bytes(file_path, raw_requests)
+        except BatchInitializationError:
+            cls._remove_partial_batch_file(file_path)
+            raise
         except:
             logging.error(f"Error creating batch file", exc_info=True)
+            cls._remove_partial_batch_file(file_path)
             return None
 
         return file_path
 
+    @staticmethod
+    def _remove_partial_batch_file(file_path: Path | None) -> None:
+        # the requests are written as they are consumed, a failure leaves a partially written batch file behind
+        if file_path is not None:
+            file_path.unlink(missing_ok=True)
+
     @classmethod
-    def _create_batch_file(cls, key: str, data: List[Any], request_kwargs: Dict = {}, batch_kwargs: Dict = {}) -> Path | None:
+    def _deduplicate_requests(cls, requests) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]]]:
         """
-        Create the batch file when given a list of items.
-        For Chat Completions, this would be a list of messages.
-        For Embeddings, this would be a list of texts.
+        Remove the requests with identical bodies, keeping the first occurrence.
+        Requests are compared by the hash of their canonicalized body.
+
+        Returns:
+            A tuple containing the unique requests and a mapping from the custom_id of each kept request 
+            to the custom_ids of its duplicates.
         """
-        requests = []
-        try:
+        duplicates = {}
+        unique_requests = list(cls._iter_unique_requests(requests, duplicates))
+        return unique_requests, duplicates
+
+    @classmethod
+    def _iter_unique_requests(cls, requests: Iterable[Dict[str, Any]], duplicates: Dict[str, List[str]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the requests with unique bodies as they are consumed, adding the custom_ids of the duplicates to `duplicates`.
+        Only the hashes of the bodies are kept, not the requests.
+        """
+        seen = {}
+        for request in requests:
+            key = hash_request_body(request["body"])
+            if key in seen:
+                duplicates.setdefault(seen[key], []).append(request["custom_id"])
+            else:
+                seen[key] = request["custom_id"]
+                yield request
+
+    @classmethod
+    def _iter_uncached_requests(
+        cls,
+        requests: Iterable[Dict[str, Any]],
+        response_cache: ResponseCache,
+        cached_results: List[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the requests not found in the response cache as they are consumed, adding the results 
+        of the cached requests to `cached_results`. The cache is looked up in chunks of `_response_cache_chunk_size` requests.
+        """
+        requests = iter(requests)
+        first_request = None
+        sent = False
+        while chunk := list(itertools.islice(requests, cls._response_cache_chunk_size)):
+            if first_request is None:
+                first_request = chunk[0]
+
+            keys = [hash_request_body(request["body"]) for request in chunk]
+            cached_responses = response_cache.get(keys)
+            for request, key in zip(chunk, keys):
+                if key in cached_responses:
+                    cached_results.append({
+                        "id": request["custom_id"],
+                        "custom_id": request["custom_id"],
+                        "response": cached_responses[key],
+                        "error": None
+                    })
+                else:
+                    sent = True
+                    yield request
+
+        if not sent and first_request is not None:
+            # A batch file needs at least one request. The batch is created completed from the 
+            # cached results, so the request is not sent and its cached result is kept
+            yield first_request
+
+    @classmethod
+    def _create_batch_from_requests(
+        cls, 
+        requests, 
+        batch_kwargs: Dict = {}, 
+        deduplicate: bool = False, 
+        response_cache: ResponseCache | None = None,
+        pack: Callable[[Iterable[Dict[str, Any]], Dict[str, List[str]]], Iterator[Dict[str, Any]]] | None = None
+    ):
+        # the requests are streamed through deduplication and the response cache to the batch file,
+        # so they are never all held in memory
+        duplicates = {}
+        if deduplicate:
+            requests = cls._iter_unique_requests(requests, duplicates)
+
+        cached_results = []
+        counts = [0]
+        if response_cache is not None:
+            def count(requests):
+                for request in requests:
+                    counts[0] += 1
+                    yield request
+
+            requests = cls._iter_uncached_requests(count(requests), response_cache, cached_results)
+
+        # the inputs are packed after deduplication and the response cache lookup, which work on the single input requests
+        packed_inputs = {}
+        if pack is not None:
+            requests = pack(requests, packed_inputs)
+
+        file_path = cls._create_batch_file_from_requests(requests)
+
+        if file_path is None:
+            raise BatchInitializationError("Failed to create batch. Check the input data.")
+
+        if duplicates:
+            duplicates_count = sum(len(custom_ids) for custom_ids in duplicates.values())
+            logging.info(f"Removed {duplicates_count} duplicate requests from the batch")
+        if cached_results:
+            logging.info(f"Found {len(cached_results)} requests in the response cache")
+        
+        batch = cls(file_path, **batch_kwargs)
+        batch._duplicates = duplicates
+        batch._packed_inputs = packed_inputs
+        batch._response_cache = response_cache
+        if cached_results:
+            cached_results_file = get_default_data_path() / "results" / f"{batch.id}.cached.jsonl"
+            cached_results_file.parent.mkdir(exist_ok=True, parents=True)
+            json_codec.write_jsonl(cached_results_file, cached_results)
+            if len(cached_results) == counts[0]:
+                # all the requests are answered from the cache, the batch is completed without starting it
+                logging.info(f"All the requests of batch {batch.id} are answered from the response cache")
+                batch.realtime_results_file = str(cached_results_file)
+            else:
+                batch._cached_results_file = str(cached_results_file)
+        return batch
+
+    @classmethod
+    def _create_batch_file(
+        cls, 
+        key: str, 
+        data: Iterable[Any], 
+        request_kwargs: Dict = {}, 
+        batch_kwargs: Dict = {}, 
+        deduplicate: bool = False, 
+        response_cache: ResponseCache | None = None,
+        pack: Callable[[Iterable[Dict[str, Any]], Dict[str, List[str]]], Iterator[Dict[str, Any]]] | None = None
+    ) -> "Batch":
+        """
+        Create the batch file when given an iterable of items.
+        For Chat Completions, this would be an iterable of messages.
+        For Embeddings, this would be an iterable of texts.
+
+        The requests are created and written to the batch file as the items are consumed,
+        so `data` can be a generator over a source larger than the memory.
+        """
+        def iter_requests():
             for item in data:
                 try:
                     body = request_kwargs.copy()  # Copy kwargs to avoid mutation
@@ -67,37 +286,99 @@ class Batch(ABC):
 
                     body[key] = item
                     
-                    request = {
+                    yield {
                         "custom_id": custom_id,
                         "method": "POST",
                         "url": cls._url,
                         "body": body
                     }
-                    requests.append(request)
                 except:
                     logging.warning(f"Error processing item {item}", exc_info= True)
                     continue
-        except:
-            logging.error(f"Error creating requests from data to create batch file", exc_info=True)
-            return None
-        
-        file_path = cls._create_batch_file_from_requests(requests)
-        
+
+        return cls._create_batch_from_requests(iter_requests(), batch_kwargs, deduplicate, response_cache, pack)
+
+    @classmethod
+    def _create_batch_from_arrow(
+        cls,
+        key: str,
+        input_template: Any,
+        data: Any,
+        template: str,
+        key_column: str | None = None,
+        request_kwargs: Dict = {},
+        batch_kwargs: Dict = {},
+        batch_size: int = 65536
+    ) -> "Batch":
+        """
+        Create the batch from the rows of Arrow data, with the template rendered over the record batches.
+        `input_template` is the value of `key` in the request body, with `arrow_utils.INPUT_PLACEHOLDER` 
+        in place of the rendered template. Ex. the messages for Chat Completions, the text for Embeddings.
+        """
+        from langbatch import arrow_utils
+
+        raw_requests = arrow_utils.iter_raw_requests(
+            data, cls._url, request_kwargs, key, input_template, template, key_column, batch_size
+        )
+        return cls.create_from_raw_requests(raw_requests, batch_kwargs)
+
+    @classmethod
+    def create_from_raw_requests(cls, raw_requests: Iterable[bytes | str], batch_kwargs: Dict = {}):
+        """
+        Creates a batch from requests already encoded as JSON, ex. popped from a Redis request queue.
+        The requests are written to the batch file as is, without decoding them. They are parsed only once,
+        when the batch validates the lines of the batch file.
+        Requests should be in correct Batch API request format as per the Batch type, like in `create_from_requests`.
+
+        Deduplication and response caching need the decoded requests, use `create_from_requests` for them.
+
+        Args:
+            raw_requests (Iterable[bytes | str]): The JSON encoded requests.
+            batch_kwargs (Dict, optional): Additional keyword arguments for the batch class. Ex. gcp_project, etc. for VertexAIChatCompletionBatch.
+
+        Returns:
+            An instance of the Batch class.
+
+        Raises:
+            BatchInitializationError: If the batch file could not be created.
+            BatchValidationError: If the requests are invalid.
+
+        Usage:
+        ```python
+        raw_requests = redis_client.lpop("request_queue", count=50000)
+        batch = OpenAIChatCompletionBatch.create_from_raw_requests(raw_requests)
+        ```
+        """
+        file_path = cls._create_batch_file_from_raw_requests(raw_requests)
         if file_path is None:
             raise BatchInitializationError("Failed to create batch. Check the input data.")
-        
+
         return cls(file_path, **batch_kwargs)
 
     @classmethod
-    def create_from_requests(cls, requests, batch_kwargs: Dict = {}):
+    def create_from_requests(
+        cls, 
+        requests: Iterable[Dict[str, Any]], 
+        batch_kwargs: Dict = {}, 
+        deduplicate: bool = False, 
+        response_cache: ResponseCache | None = None
+    ):
         """
-        Creates a batch when given a list of requests. 
+        Creates a batch when given an iterable of requests. 
         These requests should be in correct Batch API request format as per the Batch type.
         Ex. for OpenAIChatCompletionBatch, requests should be a Chat Completion request with custom_id.
 
+        The requests are written to the batch file as they are consumed, so they can be streamed 
+        from a generator, ex. over a large jsonl file, without holding them all in memory.
+
         Args:
-            requests: A list of requests.
+            requests (Iterable[Dict[str, Any]]): The requests, ex. a list or a generator.
             batch_kwargs (Dict, optional): Additional keyword arguments for the batch class. Ex. gcp_project, etc. for VertexAIChatCompletionBatch.
+            deduplicate (bool, optional): Send requests with identical bodies only once. 
+                Results are fanned out to the custom_ids of all the duplicates when reading the results. Defaults to False.
+            response_cache (ResponseCache, optional): Cache to answer the already answered requests from, without sending them to the provider. 
+                The cache is populated with the fresh responses when the results are read. 
+                When all the requests are answered from the cache, the batch is created completed and is not started. Defaults to None.
 
         Returns:
             An instance of the Batch class.
@@ -127,16 +408,15 @@ class Batch(ABC):
                     "max_tokens": 1000
                 }
             }
-        ]
+        ])
+
+        # Stream the requests from a large jsonl file
+        from langbatch import json_codec
+        batch = OpenAIChatCompletionBatch.create_from_requests(json_codec.read_jsonl("path/to/requests.jsonl"))
         ``` 
         """
 
-        file_path = cls._create_batch_file_from_requests(requests)
-
-        if file_path is None:
-            raise BatchInitializationError("Failed to create batch. Check the input data.")
-        
-        return cls(file_path, **batch_kwargs)
+        return cls._create_batch_from_requests(requests, batch_kwargs, deduplicate, response_cache)
 
     @classmethod
     @abstractmethod
@@ -146,10 +426,34 @@ class Batch(ABC):
         """
         pass
 
+    @classmethod
+    def _get_batch_class(cls, meta_data: Dict[str, Any]) -> Type["Batch"]:
+        """
+        Get the class to load the batch with. The batch class saved in the meta data is used 
+        when it is a subclass of the class `load` is called on, so `Batch.load` can load any batch type.
+        """
+        batch_class_path = meta_data.get("batch_class")
+        if batch_class_path:
+            module_name, class_name = batch_class_path.rsplit(".", 1)
+            try:
+                batch_class = getattr(importlib.import_module(module_name), class_name)
+            except (ImportError, AttributeError):
+                raise BatchInitializationError(f"Batch class {batch_class_path} not found")
+
+            if issubclass(batch_class, cls):
+                return batch_class
+
+        if inspect.isabstract(cls):
+            raise BatchInitializationError(
+                f"Batch class is not saved in the meta data. Load the batch with the batch class, ex. OpenAIChatCompletionBatch.load(id)"
+            )
+        return cls
+
     @classmethod
     def load(cls, id: str, storage: BatchStorage = FileBatchStorage(), batch_kwargs: Dict = {}):
         """
         Load a batch from the storage and return a Batch object.
+        When called on `Batch` or an abstract batch class, the batch class saved with the batch is used.
 
         Args:
             id (str): The id of the batch.
@@ -162,6 +466,9 @@ class Batch(ABC):
         Usage:
         ```python
         batch = OpenAIChatCompletionBatch.load("123", storage=FileBatchStorage("./data"))
+
+        # Load a batch of any type
+        batch = Batch.load("123", storage=FileBatchStorage("./data"))
         ```
         """
         data_file, meta_file = storage.load(id)
@@ -174,14 +481,30 @@ class Batch(ABC):
             with open(meta_file, 'rb') as f:
                 meta_data = pickle.load(f)
 
-        init_args = cls._get_init_args(meta_data)
+        batch_class = cls._get_batch_class(meta_data)
+        init_args = batch_class._get_init_args(meta_data)
 
         for key, value in batch_kwargs.items():
             if key not in init_args:
                 init_args[key] = value
 
-        batch = cls(str(data_file), **init_args)
+        token = _loading_batch.set(True)
+        try:
+            batch = batch_class(str(data_file), **init_args)
+        finally:
+            _loading_batch.reset(token)
         batch.platform_batch_id = meta_data['platform_batch_id']
+        batch._duplicates = meta_data.get('duplicates', {})
+        batch._packed_inputs = meta_data.get('packed_inputs', {})
+        batch._cached_results_file = meta_data.get('cached_results_file')
+        batch._response_cache = load_response_cache(meta_data['response_cache']) if meta_data.get('response_cache') else None
+        batch._responses_cached = meta_data.get('responses_cached', False)
+        batch.started_at = meta_data.get('started_at')
+        batch.realtime_results_file = meta_data.get('realtime_results_file')
+        batch.redrive_attempt = meta_data.get('redrive_attempt', 0)
+        batch.source_batch_ids = meta_data.get('source_batch_ids', {})
+        batch.redrive_custom_ids = meta_data.get('redrive_custom_ids', [])
+        batch.redrive_at = meta_data.get('redrive_at')
         batch.id = id
 
         return batch
@@ -211,9 +534,44 @@ class Batch(ABC):
         """
         meta_data = self._create_meta_data()
         meta_data["platform_batch_id"] = self.platform_batch_id
+        meta_data["batch_class"] = f"{type(self).__module__}.{type(self).__qualname__}"
+        meta_data["provider"] = self._provider
+        if self._duplicates:
+            meta_data["duplicates"] = self._duplicates
+        if self._packed_inputs:
+            meta_data["packed_inputs"] = self._packed_inputs
+        if self._cached_results_file is not None:
+            meta_data["cached_results_file"] = self._cached_results_file
+        if self._response_cache is not None:
+            # a reference to recreate the cache with is saved, not the cache itself
+            meta_data["response_cache"] = get_response_cache_reference(self._response_cache)
+        if self._responses_cached:
+            meta_data["responses_cached"] = True
+        if self.started_at is not None:
+            meta_data["started_at"] = self.started_at
+        if self.realtime_results_file is not None:
+            meta_data["realtime_results_file"] = self.realtime_results_file
+        if self.redrive_attempt:
+            meta_data["redrive_attempt"] = self.redrive_attempt
+            meta_data["source_batch_ids"] = self.source_batch_ids
+        if self.redrive_custom_ids:
+            meta_data["redrive_custom_ids"] = self.redrive_custom_ids
+            meta_data["redrive_at"] = self.redrive_at
 
         storage.save(self.id, Path(self._file), meta_data)
 
+    @contextmanager
+    def _record_timing(self, name: str):
+        """
+        Record the duration of a step of starting the batch in `start_timings`, 
+        ex. "conversion" of the requests to the provider format and "upload" of the requests.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.start_timings[name] = self.start_timings.get(name, 0.0) + time.perf_counter() - start_time
+
     @abstractmethod
     def _upload_batch_file(self):
         pass
@@ -252,47 +610,115 @@ class Batch(ABC):
         """
         Get all the requests from the jsonl batch file.
         """
+        try:
+            requests = list(json_codec.read_jsonl(self._file))
+        except:
+            logging.error(f"Error reading requests from batch file", exc_info=True)
+            raise BatchError("Error reading requests from batch file")
+
+        return requests
+
+    def _get_validated_requests(self) -> List[Dict[str, Any]]:
+        """
+        Get all the requests from the jsonl batch file, with the body of each request
+        validated against the request schema of the batch class.
+        The validated bodies can be passed to the request converters as is.
+
+        For classes keeping the validated requests, the requests validated in `__init__` are returned
+        and released, so the requests are validated once from creating the batch to starting it.
+        Loaded batches do not keep them, their requests are validated again here.
+        """
+        if self._validated_requests is not None:
+            requests, self._validated_requests = self._validated_requests, None
+            return requests
+
+        from langbatch.schemas import get_request_adapter
+
+        adapter = get_request_adapter(self._request_schema)
         requests = []
         try:
-            with jsonlines.open(self._file) as reader:
-                for obj in reader:
-                    requests.append(obj)
+            for obj in json_codec.read_jsonl(self._file):
+                requests.append(self._to_validated_request(adapter.validate_python(obj)))
         except:
             logging.error(f"Error reading requests from batch file", exc_info=True)
             raise BatchError("Error reading requests from batch file")
 
         return requests
 
-    @abstractmethod
+    @staticmethod
+    def _to_validated_request(request: Any) -> Dict[str, Any]:
+        return {"custom_id": request.custom_id, "body": request.body}
+
     def _validate_request(self, request):
-        pass
+        """
+        Validate a request body against the request schema of the batch class.
+        Subclasses without a request schema should override this method.
+        """
+        from langbatch.schemas import validate_request_body
+
+        validate_request_body(self._request_schema, request)
 
     def _validate_requests(self) -> None:
         """
         Validate all the requests in the batch file before starting the batch process.
 
-        Depends on the implementation of the _validate_request method in the subclass.
+        When the batch class defines a request schema, the raw lines of the batch file
+        are validated directly with a precompiled TypeAdapter.
+        Otherwise, depends on the implementation of the _validate_request method in the subclass.
         """
+        validated_requests = None
+        if self._request_schema is not None and self._keep_validated_requests and not _loading_batch.get():
+            from langbatch.schemas import get_request_adapter
+
+            # validate_python is used here, since validating from JSON turns string
+            # message contents into lazy iterables for the Iterable fields in the schemas
+            adapter = get_request_adapter(self._request_schema)
+            validated_requests = []
+            validate = lambda line: validated_requests.append(self._to_validated_request(adapter.validate_python(json_codec.loads(line))))
+        elif self._request_schema is not None:
+            from langbatch.schemas import get_request_adapter
+
+            adapter = get_request_adapter(self._request_schema)
+            validate = adapter.validate_json
+        else:
+            validate = lambda line: self._validate_request(json_codec.loads(line)['body'])
+
         invalid_requests = []
-        for request in self._get_requests():
-            valid = True
-            try:
-                self._validate_request(request['body'])
-            except:
-                logging.info(f"Invalid request: {request}", exc_info=True)
-                valid = False
-           
-            if not valid:
-                invalid_requests.append(request['custom_id'])
+        requests_count = 0
+        try:
+            with open(self._file, "rb") as reader:
+                for line in reader:
+                    if not line.strip():
+                        continue
+                    requests_count += 1
+                    try:
+                        validate(line)
+                    except:
+                        logging.info(f"Invalid request: {line}", exc_info=True)
+                        invalid_requests.append(self._get_custom_id(line, requests_count))
+        except:
+            logging.error(f"Error reading requests from batch file", exc_info=True)
+            raise BatchError("Error reading requests from batch file")
 
         if len(invalid_requests) > 0:
             raise BatchValidationError(f"Invalid requests: {invalid_requests}")
         
-        if len(self._get_requests()) == 0:
+        if requests_count == 0:
             raise BatchValidationError("No requests found in the batch file")
+
+        self._validated_requests = validated_requests
+
+    @staticmethod
+    def _get_custom_id(line: bytes, line_number: int) -> str:
+        # malformed lines are reported by their line number among the requests
+        try:
+            custom_id = json_codec.loads(line).get('custom_id')
+        except Exception:
+            custom_id = None
+        return custom_id if custom_id is not None else f"line {line_number}"
     
     def _create_results_file_path(self):
-        results_dir = Path(DATA_PATH) / "results"
+        results_dir = get_default_data_path() / "results"
         results_dir.mkdir(exist_ok=True)
 
         return results_dir / f"{self.id}.jsonl"
@@ -321,7 +747,13 @@ class Batch(ABC):
                     print(obj)
         ```
         """
-        file_path = self._download_results_file()
+        if self.realtime_results_file is not None:
+            file_path = Path(self.realtime_results_file)
+        else:
+            file_path = self._download_results_file()
+
+        if file_path is not None:
+            self._cache_results_file(file_path)
         return file_path
 
     def _prepare_results(
@@ -335,51 +767,200 @@ class Batch(ABC):
         Depends on the implementation of the process_func method in the subclass.
         """
 
-        file_id = self._download_results_file()
+        file_id = self.get_results_file()
+        return self._read_results(file_id, process_func)
+
+    async def _aprepare_results(
+        self, process_func
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] | Tuple[None, None]:
+        """
+        Async version of `_prepare_results`. The results file is downloaded with the async client
+        and processed in a thread, as processing is CPU bound.
+        """
+        file_id = await self.aget_results_file()
+        return await asyncio.to_thread(self._read_results, file_id, process_func)
 
+    def _read_results(
+        self, file_id, process_func
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] | Tuple[None, None]:
         if file_id is None:
             return None, None
 
         try:
-            results = []
-            with jsonlines.open(file_id) as reader:
-                for obj in reader:
-                    results.append(obj)
-
-            successful_results = []
-            unsuccessful_results = []
-            for result in results:
-                if result['response'] is None:
-                    if result['error'] is not None:
-                        error = {
-                            "custom_id": result['custom_id'],
-                            "error": result['error']
-                        }
-                    else:
-                        error = {
-                            "custom_id": result['custom_id'],
-                            "error": "No response from the API"
-                        }
-                    unsuccessful_results.append(error)
-                    continue
+            # results of the requests answered from the response cache are merged with the fresh results
+            results = itertools.chain(self._iter_cached_results(), self._unpack_results(json_codec.read_jsonl(file_id)))
+            return self._split_results(results, process_func)
+        except:
+            logging.error(f"Error preparing results file", exc_info=True)
+            return None, None
 
-                if result['response']['status_code'] == 200:
-                    choices = {
+    def _split_results(
+        self, results: Iterable[Dict[str, Any]], process_func
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Separate results in OpenAI batch results format into successful and unsuccessful results,
+        and fan out the results to the duplicate requests.
+        """
+        successful_results = []
+        unsuccessful_results = []
+        for result in results:
+            if result['response'] is None:
+                if result['error'] is not None:
+                    error = {
                         "custom_id": result['custom_id'],
-                        **process_func(result)
+                        "error": result['error']
                     }
-                    successful_results.append(choices)
                 else:
                     error = {
                         "custom_id": result['custom_id'],
-                        "error": result['error']
+                        "error": "No response from the API"
                     }
-                    unsuccessful_results.append(error)
+                unsuccessful_results.append(error)
+                continue
+
+            if result['response']['status_code'] == 200:
+                choices = {
+                    "custom_id": result['custom_id'],
+                    **process_func(result)
+                }
+                successful_results.append(choices)
+            else:
+                error = {
+                    "custom_id": result['custom_id'],
+                    "error": result['error']
+                }
+                unsuccessful_results.append(error)
+
+        if self._duplicates:
+            successful_results = self._fan_out_duplicates(successful_results)
+            unsuccessful_results = self._fan_out_duplicates(unsuccessful_results)
+
+        return successful_results, unsuccessful_results
+
+    def _iter_results(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the results in OpenAI batch results format as they are read from the results file, 
+        with the results answered from the response cache and the results of the duplicate requests.
+
+        Raises:
+            BatchResultsError: If the results file is not available.
+        """
+        file_id = self.get_results_file()
+        if file_id is None:
+            raise BatchResultsError(f"Results file of batch {self.id} is not available")
+
+        for result in itertools.chain(self._iter_cached_results(), self._unpack_results(json_codec.read_jsonl(file_id))):
+            yield result
+            for custom_id in self._duplicates.get(result["custom_id"], []):
+                yield {**result, "custom_id": custom_id}
+
+    def _iter_cached_results(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over the results of the requests answered from the response cache when creating the batch.
+        """
+        if self._cached_results_file is not None:
+            yield from json_codec.read_jsonl(self._cached_results_file)
+
+    @staticmethod
+    def _result_row(result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Get the status code, token usage and error columns of a result in OpenAI batch results format, for exporting the results.
+        """
+        response = result.get("response") or {}
+        body = response.get("body") or {}
+        usage = body.get("usage") or {}
+        row = {
+            "custom_id": result["custom_id"],
+            "status_code": response.get("status_code"),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "total_tokens": usage.get("total_tokens"),
+            "error_code": None,
+            "error_message": None
+        }
+
+        if row["status_code"] != 200:
+            error = result.get("error") or body.get("error") or "No response from the API"
+            if isinstance(error, dict):
+                row["error_code"] = str(error["code"]) if error.get("code") is not None else None
+                row["error_message"] = error.get("message")
+            else:
+                row["error_message"] = str(error)
+        return row
+
+    def _export_results(self, path: str | Path, rows: Iterable[Dict[str, Any]], schema: Any, format: str, batch_size: int) -> Path:
+        from langbatch import arrow_utils
+
+        count = arrow_utils.write_rows(path, rows, schema, format, batch_size)
+        logging.info(f"Exported {count} results of batch {self.id} to {path}")
+        return Path(path)
+
+    def _get_request_hashes(self) -> Dict[str, str]:
+        """
+        Get the hash of the request body of each request in the batch file, by custom_id.
+        The requests answered from the cache are not in the batch file.
+        """
+        return {
+            request["custom_id"]: hash_request_body(request["body"])
+            for request in self._unpack_requests(json_codec.read_jsonl(self._file))
+        }
+
+    def _cache_results_file(self, file_id):
+        """
+        Add the successful responses of the results file to the response cache, once for the batch.
+        The results are read in chunks of `_response_cache_chunk_size`.
+        """
+        if self._response_cache is None or self._responses_cached:
+            return
 
-            return successful_results, unsuccessful_results
+        try:
+            request_hashes = self._get_request_hashes()
+            results = self._unpack_results(json_codec.read_jsonl(file_id))
+            while chunk := list(itertools.islice(results, self._response_cache_chunk_size)):
+                self._cache_responses(chunk, request_hashes)
+            self._responses_cached = True
         except:
-            logging.error(f"Error preparing results file", exc_info=True)
-            return None, None
+            logging.warning(f"Error updating the response cache for batch {self.id}", exc_info=True)
+
+    def _cache_responses(self, results: Iterable[Dict[str, Any]], request_hashes: Dict[str, str]):
+        """
+        Add the successful responses of the results in OpenAI batch results format to the response cache,
+        keyed by the hash of the request body from `_get_request_hashes`.
+        Failing to update the cache does not fail reading the results.
+        """
+        try:
+            # results answered from the cache are not in the batch file and are skipped
+            self._response_cache.set({
+                request_hashes[result['custom_id']]: result['response'] for result in results
+                if result['response'] is not None and result['response']['status_code'] == 200
+                and result['custom_id'] in request_hashes
+            })
+        except:
+            logging.warning(f"Error updating the response cache for batch {self.id}", exc_info=True)
+
+    def _unpack_requests(self, requests: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        """
+        Split the requests with packed inputs into a request per input, with the custom_id of the input.
+        Batch types without input packing return the requests as is.
+        """
+        return requests
+
+    def _unpack_results(self, results: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        """
+        Split the results of the requests with packed inputs into a result per input, with the custom_id of the input.
+        Batch types without input packing return the results as is.
+        """
+        return results
+
+    def _fan_out_duplicates(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Add a copy of the result for each duplicate request removed when creating the batch.
+        """
+        fanned_out_results = []
+        for result in results:
+            fanned_out_results.append(result)
+            for custom_id in self._duplicates.get(result["custom_id"], []):
+                fanned_out_results.append({**result, "custom_id": custom_id})
+        return fanned_out_results
     
     # return results list
     @abstractmethod
@@ -395,6 +976,304 @@ class Batch(ABC):
     def retry(self):
         pass
 
+    # Async counterparts of the batch operations.
+    # Implementations with async provider clients override these, 
+    # others run the synchronous operations in a thread.
+    async def astart(self):
+        """
+        Async version of `start`.
+
+        Usage:
+        ```python
+        batch = OpenAIChatCompletionBatch(file)
+        await batch.astart()
+        ```
+        """
+        await asyncio.to_thread(self.start)
+
+    async def aget_status(self) -> str:
+        """
+        Async version of `get_status`.
+
+        Usage:
+        ```python
+        status = await batch.aget_status()
+        ```
+        """
+        return await asyncio.to_thread(self.get_status)
+
+    @classmethod
+    def get_statuses(cls, batches: List["Batch"]) -> Dict[str, str]:
+        """
+        Get the statuses of multiple batches of this class. Providers with a list endpoint 
+        (OpenAI, Anthropic, Bedrock) get the statuses of many batches in a few paginated list calls,
+        instead of a call per batch. Batches not found in the listed pages are retrieved with `get_status`.
+
+        Returns:
+            Dict[str, str]: Status by batch id. Batches whose status could not be retrieved are left out.
+
+        Usage:
+        ```python
+        statuses = OpenAIChatCompletionBatch.get_statuses(batches)
+        completed_batches = [batch for batch in batches if statuses.get(batch.id) == "completed"]
+        ```
+        """
+        # batches with their results available locally are completed without calling the provider
+        statuses = {batch.id: "completed" for batch in batches if batch.realtime_results_file is not None}
+        batches = [batch for batch in batches if batch.platform_batch_id is not None and batch.id not in statuses]
+        try:
+            statuses.update(cls._list_statuses(batches))
+        except:
+            logging.warning(f"Error listing batch statuses, getting them one by one", exc_info=True)
+
+        for batch in batches:
+            if batch.id not in statuses:
+                try:
+                    statuses[batch.id] = batch.get_status()
+                except:
+                    logging.error(f"Error getting status of batch {batch.id}", exc_info=True)
+        return statuses
+
+    @classmethod
+    async def aget_statuses(cls, batches: List["Batch"], max_concurrency: int | None = None) -> Dict[str, str]:
+        """
+        Async version of `get_statuses`.
+
+        Args:
+            batches (List[Batch]): The batches.
+            max_concurrency (int, optional): Maximum number of concurrent `aget_status` calls 
+                for the batches not found by the list endpoint. Defaults to no limit.
+        """
+        statuses = {batch.id: "completed" for batch in batches if batch.realtime_results_file is not None}
+        batches = [batch for batch in batches if batch.platform_batch_id is not None and batch.id not in statuses]
+        try:
+            statuses.update(await cls._alist_statuses(batches))
+        except:
+            logging.warning(f"Error listing batch statuses, getting them one by one", exc_info=True)
+
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        async def get_status(batch: "Batch") -> str:
+            if semaphore is None:
+                return await batch.aget_status()
+            async with semaphore:
+                return await batch.aget_status()
+
+        remaining = [batch for batch in batches if batch.id not in statuses]
+        results = await asyncio.gather(*(get_status(batch) for batch in remaining), return_exceptions=True)
+        for batch, result in zip(remaining, results):
+            if isinstance(result, BaseException):
+                logging.error(f"Error getting status of batch {batch.id}: {result}")
+            else:
+                statuses[batch.id] = result
+        return statuses
+
+    @classmethod
+    def _list_statuses(cls, batches: List["Batch"]) -> Dict[str, str]:
+        """
+        Get the statuses of the started batches with the list endpoint of the provider.
+        Returns the statuses of the batches found, by batch id. Implemented by the providers with a list endpoint.
+        """
+        return {}
+
+    @classmethod
+    async def _alist_statuses(cls, batches: List["Batch"]) -> Dict[str, str]:
+        if cls._list_statuses.__func__ is Batch._list_statuses.__func__:
+            return {}
+        return await asyncio.to_thread(cls._list_statuses, batches)
+
+    @staticmethod
+    def _group_by_client(
+            batches: List["Batch"], 
+            get_client: Callable[["Batch"], Any], 
+            get_key: Callable[[Any], Any] = id
+        ) -> List[Tuple[Any, List["Batch"]]]:
+        """
+        Group the batches by client, with the client of the first batch of each group.
+        Clients with the same key, ex. the same base url and credentials, list the same batches.
+        """
+        groups = {}
+        for batch in batches:
+            client = get_client(batch)
+            groups.setdefault(get_key(client), (client, []))[1].append(batch)
+        return list(groups.values())
+
+    @staticmethod
+    def _status_list_cutoff(batches: List["Batch"]) -> float | None:
+        """
+        Creation time before which the listed batches are older than all the given batches,
+        so the remaining pages of the list endpoint do not need to be read. 
+        None when the start time of a batch is not known.
+        """
+        started_at = [batch.started_at for batch in batches]
+        if not started_at or any(value is None for value in started_at):
+            return None
+        # margin for the clock difference with the provider
+        return min(started_at) - 3600
+
+    @staticmethod
+    def _collect_listed_statuses(
+            wanted: Dict[str, str],
+            items: List[Tuple[str, str, float]],
+            statuses: Dict[str, str],
+            cutoff: float | None
+        ) -> bool:
+        """
+        Add the statuses of the wanted batches (platform batch id -> batch id) found in a page of a list endpoint
+        to statuses. Items are (platform batch id, status, creation time), newest first.
+        Returns True when the remaining pages do not need to be read.
+        """
+        for platform_batch_id, status, created_at in items:
+            batch_id = wanted.pop(platform_batch_id, None)
+            if batch_id is not None:
+                statuses[batch_id] = status
+        if not wanted:
+            return True
+        return cutoff is not None and len(items) > 0 and items[-1][2] < cutoff
+
+    async def acancel(self) -> bool:
+        """
+        Async version of `cancel`.
+
+        Usage:
+        ```python
+        await batch.acancel()
+        ```
+        """
+        return await asyncio.to_thread(self.cancel)
+
+    async def ais_retryable_failure(self) -> bool:
+        """
+        Async version of `is_retryable_failure`.
+        """
+        return await asyncio.to_thread(self.is_retryable_failure)
+
+    async def aretry(self):
+        """
+        Async version of `retry`.
+
+        Usage:
+        ```python
+        if await batch.ais_retryable_failure():
+            await batch.aretry()
+        ```
+        """
+        await asyncio.to_thread(self.retry)
+
+    async def _adownload_results_file(self):
+        return await asyncio.to_thread(self._download_results_file)
+
+    async def aget_results_file(self):
+        """
+        Async version of `get_results_file`.
+
+        Usage:
+        ```python
+        if await batch.aget_status() == "completed":
+            results_file = await batch.aget_results_file()
+        ```
+        """
+        if self.realtime_results_file is not None:
+            file_path = Path(self.realtime_results_file)
+        else:
+            file_path = await self._adownload_results_file()
+
+        if file_path is not None:
+            await asyncio.to_thread(self._cache_results_file, file_path)
+        return file_path
+
+    async def aget_results(self):
+        """
+        Async version of `get_results`.
+
+        Usage:
+        ```python
+        successful_results, unsuccessful_results = await batch.aget_results()
+        ```
+        """
+        return await asyncio.to_thread(self.get_results)
+
+    # Real-time execution of the requests of the batch.
+    # Implementations supporting it override `_asend_request` to send one request to the
+    # synchronous endpoint of the provider and return its result in OpenAI batch results format.
+    async def _asend_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError(f"Real-time execution is not supported for {type(self).__name__}")
+
+    @classmethod
+    def supports_realtime(cls) -> bool:
+        """
+        Check if the requests of the batch class can be run through the real-time endpoint of the provider.
+        """
+        return cls._asend_request is not Batch._asend_request
+
+    async def arun_realtime(self, max_concurrency: int = 16, requests_per_minute: int | None = None) -> Path:
+        """
+        Run the requests of the batch through the real-time (synchronous) endpoint of the provider 
+        instead of creating a batch job. Useful for small or urgent batches, as results are available 
+        in seconds instead of hours, at the real-time price of the provider.
+
+        Results are written to a results file in OpenAI batch results format, 
+        so `get_results` and `get_results_file` work the same as for a completed batch job.
+        Failed requests are written as unsuccessful results.
+
+        Args:
+            max_concurrency (int, optional): Maximum number of concurrent requests. Defaults to 16.
+            requests_per_minute (int, optional): Maximum number of requests sent per minute. Defaults to None (no limit).
+
+        Returns:
+            Path: The path to the results file.
+
+        Usage:
+        ```python
+        batch = OpenAIChatCompletionBatch("path/to/file.jsonl")
+        await batch.arun_realtime(max_concurrency=8, requests_per_minute=500)
+
+        successful_results, unsuccessful_results = batch.get_results()
+        ```
+        """
+        if self.platform_batch_id is not None or self.realtime_results_file is not None:
+            raise BatchStateError("Batch already started")
+
+        if not self.supports_realtime():
+            raise NotImplementedError(f"Real-time execution is not supported for {type(self).__name__}")
+
+        requests = await asyncio.to_thread(self._get_requests)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        rate_limiter = RateLimiter(requests_per_minute)
+
+        async def send(request: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                await rate_limiter.acquire()
+                try:
+                    return await self._asend_request(request)
+                except Exception as e:
+                    logging.info(f"Real-time request {request['custom_id']} failed: {e}")
+                    return {
+                        "id": None,
+                        "custom_id": request["custom_id"],
+                        "response": None,
+                        "error": {"code": getattr(e, "status_code", None), "message": str(e)}
+                    }
+
+        results = await asyncio.gather(*(send(request) for request in requests))
+
+        file_path = self._create_results_file_path()
+        await asyncio.to_thread(json_codec.write_jsonl, file_path, results)
+        self.realtime_results_file = str(file_path)
+
+        return file_path
+
+    def run_realtime(self, max_concurrency: int = 16, requests_per_minute: int | None = None) -> Path:
+        """
+        Synchronous version of `arun_realtime`.
+
+        Usage:
+        ```python
+        batch.run_realtime()
+        successful_results, unsuccessful_results = batch.get_results()
+        ```
+        """
+        return asyncio.run(self.arun_realtime(max_concurrency, requests_per_minute))
+
     def get_unsuccessful_requests(self) -> List[Dict[str, Any]]:
         """
         Retrieve the unsuccessful requests from the batch.
@@ -422,6 +1301,49 @@ class Batch(ABC):
         
         return self.get_requests_by_custom_ids(custom_ids)
 
+    def get_retryable_requests(self) -> List[Dict[str, Any]]:
+        """
+        Retrieve the unsuccessful requests of the batch that failed with a transient error 
+        and are worth sending again: rate limits (429), server errors (5xx) and timeouts.
+
+        Returns:
+            A list of requests that failed with a transient error.
+
+        Usage:
+        ```python
+        if batch.get_status() == "completed":
+            requests = batch.get_retryable_requests()
+            retry_batch = OpenAIChatCompletionBatch.create_from_requests(requests)
+        ```
+        """
+        custom_ids = [result["custom_id"] for result in self._iter_results() if self._is_retryable_result(result)]
+        return self.get_requests_by_custom_ids(custom_ids)
+
+    @classmethod
+    def _is_retryable_result(cls, result: Dict[str, Any]) -> bool:
+        """
+        Check if a result in OpenAI batch results format failed with a transient error.
+        Failures without a status code or an error code, ex. missing responses and connection errors, are treated as timeouts.
+        """
+        response = result.get("response") or {}
+        status_code = response.get("status_code")
+        if status_code == 200:
+            return False
+
+        error = result.get("error") or (response.get("body") or {}).get("error")
+        code = error.get("code") if isinstance(error, dict) else None
+        if status_code is None and code is None:
+            return True
+
+        for value in (status_code, code):
+            if isinstance(value, str) and value.isdigit():
+                value = int(value)
+            if isinstance(value, int) and (value == 429 or 500 <= value < 600):
+                return True
+            if isinstance(value, str) and value in cls._retryable_error_codes:
+                return True
+        return False
+
     def get_requests_by_custom_ids(self, custom_ids: List[str]) -> List[Dict[str, Any]]:
         """
         Retrieve the requests from the batch file by custom ids.
@@ -445,9 +1367,13 @@ class Batch(ABC):
                 print(request["custom_id"])
         ```
         """
+        custom_ids = set(custom_ids)
         requests = []
-        with jsonlines.open(self._file) as reader:
-            for request in reader:
-                if request["custom_id"] in custom_ids:
-                    requests.append(request)
+        for request in self._unpack_requests(json_codec.read_jsonl(self._file)):
+            if request["custom_id"] in custom_ids:
+                requests.append(request)
+            # duplicates of the request are not in the batch file
+            for custom_id in self._duplicates.get(request["custom_id"], []):
+                if custom_id in custom_ids:
+                    requests.append({**request, "custom_id": custom_id})
         return requests
\ No newline at end of file
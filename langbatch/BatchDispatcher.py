@@ -1,10 +1,15 @@
+import os
 import asyncio
 import time
 import logging
-from typing import Dict, Literal
+from contextlib import nullcontext
+from typing import Any, Dict, List, Literal, Type
 from langbatch.Batch import Batch
 from langbatch.BatchHandler import BatchHandler
+from langbatch.metrics import Metrics
 from langbatch.request_queues import RequestQueue
+from langbatch.response_caches import ResponseCache
+from langbatch.utils import hash_request_body
 from langbatch.errors import BatchInitializationError
 
 logger = logging.getLogger(__name__)
@@ -12,7 +17,9 @@ logger = logging.getLogger(__name__)
 class BatchDispatcher:
     """
     Batch dispatcher creates batches from requests in the queue and dispatches them to the batch handler.
-    It periodically checks the queue size and time threshold, and creates a batch and dispatches it to the batch handler.
+    It creates a batch as soon as the queue reaches the queue threshold, or when the oldest request in the queue
+    reaches the time threshold. For queues that do not track when requests are added, the time threshold is measured from the last batch.
+    Between the checks, it waits for the queue to notify it of added requests, for at most `time_interval` seconds.
 
     Usage:
     ```python
@@ -26,7 +33,71 @@ class BatchDispatcher:
         request_kwargs=request_kwargs
     )
 
+    # Send identical requests in a batch only once
+    batch_dispatcher = BatchDispatcher(
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs=request_kwargs,
+        deduplicate=True
+    )
+
+    # Skip the requests that are already answered
+    batch_dispatcher = BatchDispatcher(
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs=request_kwargs,
+        response_cache=SQLiteResponseCache(ttl=3600 * 24 * 7)
+    )
+
+    # Keep requests sharing a system prompt or few-shot prefix in the same batch,
+    # looking at up to 4 batches worth of queued requests at a time
+    batch_dispatcher = BatchDispatcher(
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs=request_kwargs,
+        group_by_prefix=True,
+        grouping_window=4
+    )
+
+    # Dispatch to a batch handler shared by multiple batch types
+    batch_dispatcher = BatchDispatcher(
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs=request_kwargs,
+        batch_type=AnthropicChatCompletionBatch,
+        batch_kwargs={"cache_prompt_prefix": True}
+    )
+
+    # Run batches of less than 100 requests through the real-time endpoint of the provider
+    batch_dispatcher = BatchDispatcher(
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs=request_kwargs,
+        realtime_threshold=100,
+        realtime_concurrency=8,
+        realtime_requests_per_minute=500
+    )
+
+    # Create up to 8 batches at a time from a large backlog, dispatched in the order of their requests in the queue
+    batch_dispatcher = BatchDispatcher(
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs=request_kwargs,
+        creation_concurrency=8
+    )
+
+    # Report dispatch latencies and batch sizes to a metrics exporter, defaults to the metrics of the batch handler
+    batch_dispatcher = BatchDispatcher(
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs=request_kwargs,
+        metrics=CallbackMetrics(lambda event: print(event))
+    )
+
     asyncio.create_task(batch_dispatcher.run())
+
+    # Run urgent requests in real time, without waiting for the queue
+    await batch_dispatcher.dispatch_urgent(urgent_requests)
     ```
     """
 
@@ -38,7 +109,18 @@ class BatchDispatcher:
             time_threshold: int = 3600 * 2, 
             time_interval: int = 600, 
             requests_type: Literal["partial", "full"] = "partial", 
-            request_kwargs: Dict = {}
+            request_kwargs: Dict = {},
+            deduplicate: bool = False,
+            response_cache: ResponseCache | None = None,
+            group_by_prefix: bool = False,
+            grouping_window: int = 4,
+            batch_type: Type[Batch] | None = None,
+            batch_kwargs: Dict | None = None,
+            realtime_threshold: int | None = None,
+            realtime_concurrency: int = 16,
+            realtime_requests_per_minute: int | None = None,
+            metrics: Metrics | None = None,
+            creation_concurrency: int = 1
         ):
         self.batch_handler = batch_handler
         self.queue = queue
@@ -46,13 +128,31 @@ class BatchDispatcher:
         self.time_threshold = time_threshold
         self.time_interval = time_interval
         self.last_batch_time = time.time()
+        self._first_request_time: float | None = None # time the dispatcher was woken by the first request in the empty queue
         self.requests_type = requests_type
         self.request_kwargs = request_kwargs
+        self.deduplicate = deduplicate
+        self.response_cache = response_cache
+        self.group_by_prefix = group_by_prefix
+        self.grouping_window = grouping_window
+        # Defaults to the batch type and batch kwargs of the batch handler
+        self.batch_type = batch_type or batch_handler.batch_type
+        self.batch_kwargs = batch_kwargs if batch_kwargs is not None else batch_handler.batch_kwargs
+        # Batches with fewer requests than the threshold are run through the real-time endpoint of the provider,
+        # falling back to a batch job for providers without real-time support
+        self.realtime_threshold = realtime_threshold
+        self.realtime_concurrency = realtime_concurrency
+        self.realtime_requests_per_minute = realtime_requests_per_minute
+        self.metrics = metrics or batch_handler.metrics
+        # When the queue has requests for multiple batches, up to creation_concurrency batches are created
+        # and validated at a time in worker threads, and dispatched in the order of their requests
+        self.creation_concurrency = max(1, creation_concurrency)
 
     async def run(self):
         """
         Start the batch dispatcher as a asynchronous background task.
-        Periodically checks the queue size and time threshold, and creates a batch and dispatches it to the batch handler.
+        Creates batches from the queue as soon as the queue threshold or the time threshold is reached,
+        and dispatches them to the batch handler.
 
         Examples:
             ```python
@@ -62,7 +162,33 @@ class BatchDispatcher:
         while True:
             logger.info("Running batch dispatcher")
             await self._check_batch_conditions()
-            await asyncio.sleep(self.time_interval)
+            await self._wait_for_batch_conditions()
+
+    def _get_time_threshold_deadline(self) -> float:
+        """
+        Get the time at which the oldest request in the queue reaches the time threshold.
+        For queues that do not track when requests are added, measured from the last batch,
+        or from the first request in the empty queue after an idle period, so a lone request does not make a batch of its own.
+        """
+        oldest_request_time = self.queue.oldest_request_time()
+        if oldest_request_time is None:
+            return max(self.last_batch_time, self._first_request_time or 0) + self.time_threshold
+        return oldest_request_time + self.time_threshold
+
+    async def _wait_for_batch_conditions(self):
+        """
+        Wait until the queue reaches the queue threshold or the time threshold is reached, for at most `time_interval` seconds.
+        With an empty queue, waits for the first request, as the time threshold only applies to queued requests.
+        """
+        queue_size = await asyncio.to_thread(len, self.queue)
+        if queue_size == 0:
+            if await self.queue.wait_for_requests(1, self.time_interval):
+                self._first_request_time = time.time()
+            return
+
+        deadline = await asyncio.to_thread(self._get_time_threshold_deadline)
+        timeout = min(self.time_interval, max(0, deadline - time.time()))
+        await self.queue.wait_for_requests(self.queue_threshold, timeout)
 
     async def _check_batch_conditions(self):
         logger.info("Checking queue for batch creation")
@@ -70,32 +196,168 @@ class BatchDispatcher:
             current_time = time.time()
             queue_size = len(self.queue)
             has_threshold_requests = queue_size >= self.queue_threshold
-            reached_time_threshold = (current_time - self.last_batch_time) >= self.time_threshold
+            reached_time_threshold = current_time >= self._get_time_threshold_deadline()
             if has_threshold_requests or (reached_time_threshold and queue_size > 0):
-                logger.info("Creating and dispatching batch")
-                await self._create_and_dispatch_batch()
+                batches_count = min(self.creation_concurrency, queue_size // self.queue_threshold)
+                if self.group_by_prefix:
+                    logger.info("Creating and dispatching batches grouped by prompt prefix")
+                    await self._create_and_dispatch_grouped_batches(queue_size)
+                elif batches_count > 1:
+                    logger.info(f"Creating and dispatching {batches_count} batches")
+                    requests = await asyncio.to_thread(self._get_requests, batches_count * self.queue_threshold)
+                    await self._create_and_dispatch_batches(self._split_requests(requests))
+                else:
+                    logger.info("Creating and dispatching batch")
+                    await self._create_and_dispatch_batch()
             else:
                 logger.info("No batch conditions met, waiting for next check")
                 break
 
-    async def _create_and_dispatch_batch(self):
+    def _get_requests(self, count: int) -> List[Any]:
+        # "full" requests are written to the batch file as the JSON bytes stored in the queue,
+        # unless deduplication or the response cache need the decoded requests
+        if self.requests_type == "full" and not self.deduplicate and self.response_cache is None:
+            return self.queue.get_raw_requests(count)
+        return self.queue.get_requests(count)
+
+    def _get_prefix_key(self, request: Any) -> str | None:
+        """
+        Get the hash of the prefix shared by the requests for provider side prompt caching: 
+        model, tools and the messages before the last message.
+        """
+        if self.requests_type == "partial":
+            body, messages = self.request_kwargs, request
+        else:
+            body = request.get("body", {})
+            messages = body.get("messages")
+
+        if not isinstance(messages, list) or len(messages) < 2:
+            return None
+
+        return hash_request_body({
+            "model": body.get("model"),
+            "tools": body.get("tools"),
+            "messages": messages[:-1]
+        })
+
+    def _group_requests_by_prefix(self, requests: List[Any]) -> List[Any]:
+        """
+        Reorder the requests so that the requests with the same prefix are next to each other.
+        Groups are kept in the order of their first request in the queue.
+        """
+        groups = {}
+        for request in requests:
+            groups.setdefault(self._get_prefix_key(request), []).append(request)
+
+        return [request for group in groups.values() for request in group]
+
+    async def _create_and_dispatch_grouped_batches(self, queue_size: int):
+        batches_count = max(1, min(self.grouping_window, queue_size // self.queue_threshold))
+        requests = await asyncio.to_thread(self.queue.get_requests, batches_count * self.queue_threshold)
+        requests = await asyncio.to_thread(self._group_requests_by_prefix, requests)
+        await self._create_and_dispatch_batches(self._split_requests(requests))
+
+    def _split_requests(self, requests: List[Any]) -> List[List[Any]]:
+        return [requests[i:i + self.queue_threshold] for i in range(0, len(requests), self.queue_threshold)]
+
+    async def _create_and_dispatch_batches(self, blocks: List[List[Any]]):
+        """
+        Create the batches of the request blocks concurrently, up to `creation_concurrency` at a time,
+        and dispatch them in the order of the blocks. Each batch is dispatched as soon as 
+        the batches before it are dispatched, or failed to be created.
+        """
+        creation_slots = asyncio.Semaphore(self.creation_concurrency)
+        turns = [asyncio.Event() for _ in blocks]
+
+        async def create_and_dispatch(index: int, requests: List[Any]):
+            previous_dispatched = turns[index - 1] if index > 0 else None
+            try:
+                await self._create_and_dispatch_batch(requests, creation_slots, previous_dispatched)
+            finally:
+                # batches that failed to be created also wait for their turn, to keep the order of the next batches
+                if previous_dispatched is not None:
+                    await previous_dispatched.wait()
+                turns[index].set()
+
+        results = await asyncio.gather(
+            *(create_and_dispatch(index, requests) for index, requests in enumerate(blocks)), 
+            return_exceptions=True
+        )
+        # errors are raised after all the batches are dispatched, so the requests of the other batches are not lost
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def _create_and_dispatch_batch(
+            self, 
+            requests: List[Any] | None = None, 
+            creation_slots: asyncio.Semaphore | None = None, 
+            previous_dispatched: asyncio.Event | None = None
+        ):
         try:
             logger.info("Creating batch")
-            requests = await asyncio.to_thread(self.queue.get_requests, self.queue_threshold)
-            batch_class = self.batch_handler.batch_type
-            batch_kwargs = self.batch_handler.batch_kwargs
-            if self.requests_type == "partial":
-                batch = await asyncio.to_thread(batch_class.create, requests, self.request_kwargs, batch_kwargs)
-            else:
-                batch = await asyncio.to_thread(batch_class.create_from_requests, requests, batch_kwargs)
-            self.last_batch_time = time.time()
-            await self._dispatch_batch(batch)
+            with self.metrics.span("langbatch.dispatch"), self.metrics.timer("langbatch_dispatch_latency_seconds"):
+                if requests is None:
+                    requests = await asyncio.to_thread(self._get_requests, self.queue_threshold)
+                async with creation_slots or nullcontext():
+                    batch = await self._create_batch(requests)
+                if previous_dispatched is not None:
+                    await previous_dispatched.wait()
+                self.last_batch_time = time.time()
+                realtime = self.realtime_threshold is not None and len(requests) < self.realtime_threshold
+                await self._dispatch_batch(batch, realtime)
         except BatchInitializationError as e:
             logger.warning(f"Failed to create batch: {str(e)}")
 
-    async def _dispatch_batch(self, batch: Batch):
+    async def dispatch_urgent(self, requests: List[Any]):
+        """
+        Create a batch from the given requests and run it through the real-time endpoint of the provider right away,
+        bypassing the queue. Falls back to dispatching a batch job for providers without real-time support.
+
+        Args:
+            requests (List[Any]): Requests in the format of the requests in the queue.
+
+        Examples:
+            ```python
+            await batch_dispatcher.dispatch_urgent([
+                [{"role": "user", "content": "What is the capital of France?"}]
+            ])
+            ```
+        """
+        batch = await self._create_batch(requests)
+        await self._dispatch_batch(batch, realtime=True)
+
+    async def _create_batch(self, requests: List[Any]) -> Batch:
+        return await self._create_batch_of_type(requests, self.batch_type, self.batch_kwargs, self.request_kwargs)
+
+    async def _create_batch_of_type(
+            self, 
+            requests: List[Any], 
+            batch_type: Type[Batch], 
+            batch_kwargs: Dict, 
+            request_kwargs: Dict
+        ) -> Batch:
+        if self.requests_type == "partial":
+            batch = await asyncio.to_thread(batch_type.create, requests, request_kwargs, batch_kwargs, self.deduplicate, self.response_cache)
+        elif len(requests) > 0 and isinstance(requests[0], (bytes, str)):
+            batch = await asyncio.to_thread(batch_type.create_from_raw_requests, requests, batch_kwargs)
+        else:
+            batch = await asyncio.to_thread(batch_type.create_from_requests, requests, batch_kwargs, self.deduplicate, self.response_cache)
+
+        labels = {"provider": batch._provider}
+        self.metrics.observe("langbatch_batch_requests", len(requests), labels)
+        self.metrics.observe("langbatch_batch_bytes", os.path.getsize(batch._file), labels)
+        return batch
+
+    async def _dispatch_batch(self, batch: Batch, realtime: bool = False):
         logger.info(f"Dispatching batch {batch.id}")
+        if realtime and batch.supports_realtime():
+            run = await self.batch_handler.run_realtime_batch(batch, self.realtime_concurrency, self.realtime_requests_per_minute)
+            if run:
+                logger.info(f"Batch {batch.id} completed in real time")
+                return
+
         await asyncio.to_thread(batch.save, self.batch_handler.batch_storage)
         
-        await self.batch_handler.add_batch(batch.id)
+        await self.batch_handler.add_batch(batch.id, batch._provider)
         logger.info(f"Batch {batch.id} dispatched successfully")
\ No newline at end of file
@@ -1,11 +1,15 @@
+import json
+import time
 import logging
-from typing import Dict, Callable, Type
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Callable, List, Tuple, Type
 from enum import Enum
 import asyncio
 
 from langbatch.Batch import Batch
 from langbatch.batch_storages import BatchStorage, FileBatchStorage
 from langbatch.batch_queues import BatchQueue, FileBatchQueue
+from langbatch.metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +34,24 @@ class BatchHandler:
     * cancelling non retryable failed batches
     ```
 
+    Batch operations use the async methods of the batches (`astart`, `aget_statuses`, `aretry`), 
+    which use the async provider clients where available, so many batches can be handled 
+    on one event loop without occupying a thread per operation. The statuses of the processing batches 
+    are retrieved with the list endpoints of the providers where available, in a few calls per cycle 
+    instead of a call per batch.
+
+    Failed requests of completed batches can be re-driven: requests failed with transient errors (rate limits, 
+    server errors and timeouts) are collected across the completed batches, and sent again in new batches 
+    after a backoff, up to `max_redrive_attempts` times. 
+    `batch.source_batch_ids` of the new batches maps the custom_id of each request to the id of the batch it was first sent in.
+
+    Batches of different providers can be handled by one handler. Batches are loaded with the 
+    batch class saved in their meta data, and each provider is handled in its own task with its own 
+    limits, so a slow provider does not block handling the batches of the others.
+
+    Queue depths, time spent by the batches in each status, poll latencies, start, conversion and upload durations,
+    and batch and retry counts are reported to the `metrics` exporter, see `langbatch.metrics.METRICS`.
+
     Examples:
         ```python
         # Create a batch handler process
@@ -53,17 +75,83 @@ class BatchHandler:
             batch_storage=custom_batch_storage
         )
         asyncio.create_task(batch_handler.run())
+
+        # Handle batches of multiple providers with per provider limits
+        batch_handler = BatchHandler(
+            batch_process_func=process_batch,
+            max_workers=4,
+            max_starts=4,
+            provider_limits={"anthropic": {"max_workers": 8, "max_starts": 10}}
+        )
+        asyncio.create_task(batch_handler.run())
+
+        # Dispatch batches of different types to the same handler
+        openai_dispatcher = BatchDispatcher(batch_handler, openai_queue, batch_type=OpenAIChatCompletionBatch)
+        anthropic_dispatcher = BatchDispatcher(batch_handler, anthropic_queue, batch_type=AnthropicChatCompletionBatch)
+
+        # Re-drive the failed requests of the completed batches up to 3 times, 
+        # waiting 10 minutes before the first attempt and doubling the wait for each attempt
+        batch_handler = BatchHandler(
+            batch_process_func=process_batch,
+            batch_type=OpenAIChatCompletionBatch,
+            redrive_failed_requests=True,
+            max_redrive_attempts=3,
+            redrive_backoff=600
+        )
+
+        def process_batch(batch):
+            successful_results, unsuccessful_results = batch.get_results()
+            for result in successful_results:
+                original_batch_id = batch.source_batch_ids.get(result["custom_id"], batch.id)
+
+        # Export metrics and traces to Prometheus
+        metrics = PrometheusMetrics()
+        metrics.serve(9090)
+        batch_handler = BatchHandler(
+            batch_process_func=process_batch,
+            batch_type=OpenAIChatCompletionBatch,
+            metrics=metrics
+        )
         ```
     """
     def __init__(
             self, 
             batch_process_func: Callable, 
-            batch_type: Type[Batch], 
+            batch_type: Type[Batch] = Batch, 
             batch_queue: BatchQueue = None,
             batch_storage: BatchStorage = None,
             wait_time: int = 3600,
-            batch_kwargs: Dict = {}
+            batch_kwargs: Dict = {},
+            max_workers: int = 4,
+            max_starts: int = 4,
+            provider_limits: Dict[str, Dict[str, int]] = {},
+            redrive_failed_requests: bool = False,
+            max_redrive_attempts: int = 3,
+            redrive_backoff: int = 600,
+            metrics: Metrics | None = None
         ):
+        """
+        Initialize the BatchHandler.
+
+        Args:
+            batch_process_func (Callable): The function to process the completed batches.
+            batch_type (Type[Batch], optional): The batch class used to load the batches. Defaults to Batch, 
+                which loads each batch with the batch class saved in its meta data.
+            batch_queue (BatchQueue, optional): The queue of the pending and processing batches. Defaults to FileBatchQueue("batch_queue.json").
+            batch_storage (BatchStorage, optional): The storage of the batches. Defaults to FileBatchStorage().
+            wait_time (int, optional): Time in seconds between the handling cycles. Defaults to 3600.
+            batch_kwargs (Dict, optional): Additional keyword arguments passed when loading the batches.
+            max_workers (int, optional): Maximum number of concurrent operations per provider. Defaults to 4.
+            max_starts (int, optional): Maximum number of batches started or retried per provider in a handling cycle. Defaults to 4.
+            provider_limits (Dict[str, Dict[str, int]], optional): `max_workers` and `max_starts` overrides by provider. 
+                Ex. {"anthropic": {"max_workers": 8, "max_starts": 10}}
+            redrive_failed_requests (bool, optional): Send the requests of the completed batches failed with transient errors (429, 5xx, timeouts) again in new batches. Defaults to False.
+            max_redrive_attempts (int, optional): Maximum number of times a request is re-driven. Defaults to 3.
+            redrive_backoff (int, optional): Time in seconds to wait before the first re-drive of the failed requests, 
+                doubled for each further attempt. Defaults to 600.
+            metrics (Metrics, optional): The exporter of the metrics and traces, ex. PrometheusMetrics, OpenTelemetryMetrics 
+                or CallbackMetrics. Defaults to no metrics.
+        """
         self.batch_process_func = batch_process_func
         self.batch_type = batch_type
         self.batch_queue = batch_queue or FileBatchQueue("batch_queue.json")
@@ -71,13 +159,27 @@ class BatchHandler:
         self.wait_time = wait_time
         self.batch_kwargs = batch_kwargs
         self.batch_storage = batch_storage or FileBatchStorage()
+        self.max_workers = max_workers
+        self.max_starts = max_starts
+        self.provider_limits = provider_limits
+        self.redrive_failed_requests = redrive_failed_requests
+        self.max_redrive_attempts = max_redrive_attempts
+        self.redrive_backoff = redrive_backoff
+        self.metrics = metrics or Metrics()
+        self._provider_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._provider_tasks: Dict[str, asyncio.Task] = {}
+        self._batch_providers: Dict[str, str] = {} # batch id -> provider, to avoid loading the pending batches every cycle
+        self._turnaround_times: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=20))
+        self._batch_statuses: Dict[str, Tuple[str, float]] = {} # batch id -> last seen status and the time it was first seen
+        self._redrive_at: Dict[str, float] = {} # batch id -> re-drive time, to avoid loading the waiting batches every cycle
 
-    async def add_batch(self, batch_id: str):
+    async def add_batch(self, batch_id: str, provider: str | None = None):
         """
         Add a batch to the queue.
 
         Parameters:
             batch_id: The ID of the batch to add.
+            provider: The provider of the batch. Optional, found when the batch is loaded otherwise.
 
         Examples:
             ```python
@@ -85,17 +187,32 @@ class BatchHandler:
             ```
         """
         self.queues["pending"].append(batch_id)
+        if provider is not None:
+            self._batch_providers[batch_id] = provider
+        self._batch_statuses[batch_id] = ("pending", time.time())
         self._save_queues()
         logger.info(f"Added batch {batch_id} to pending queue")
 
     async def start_batch(self, batch: Batch):
         if batch.id in self.queues["pending"]:
+            labels = {"provider": batch._provider}
             try:
-                await asyncio.to_thread(batch.start)
+                batch.start_timings = {}
+                with self.metrics.span("langbatch.start_batch", {"batch_id": batch.id, **labels}), self.metrics.timer("langbatch_start_seconds", labels):
+                    # batches answered from the response cache are completed without starting them
+                    if batch.realtime_results_file is None:
+                        await batch.astart()
+                batch.started_at = time.time()
+                self._record_status(batch.id, batch._provider, None)
+                for step, duration in batch.start_timings.items():
+                    self.metrics.observe(f"langbatch_{step}_seconds", duration, labels)
+                self.metrics.increment("langbatch_batches_total", labels={**labels, "event": "started"})
+
                 await asyncio.to_thread(batch.save, self.batch_storage)
                 self.queues["processing"].append(batch.id)
                 logger.info(f"Moved batch {batch.id} from pending to processing queue")
             except:
+                self.metrics.increment("langbatch_batches_total", labels={**labels, "event": "start_failed"})
                 logger.error(f"Error starting batch {batch.id}", exc_info=True)
             finally:
                 self.queues["pending"].remove(batch.id)
@@ -109,11 +226,18 @@ class BatchHandler:
             logger.info(f"Processing completed batch {batch.id}")
             if batch.id in self.queues["processing"]:
                 try:
-                    await asyncio.to_thread(self.batch_process_func, batch)
+                    if batch.started_at is not None:
+                        self._turnaround_times[batch._provider].append(time.time() - batch.started_at)
+                    with self.metrics.span("langbatch.process_batch", {"batch_id": batch.id, "provider": batch._provider}):
+                        await asyncio.to_thread(self.batch_process_func, batch)
                     logger.info(f"Processed batch {batch.id}")
                 except:
                     logger.error(f"Error processing completed batch {batch.id}", exc_info=True)
+                if self.redrive_failed_requests:
+                    await self._collect_failed_requests(batch)
                 self.queues["processing"].remove(batch.id)
+                self._record_status(batch.id, batch._provider, None)
+                self.metrics.increment("langbatch_batches_total", labels={"provider": batch._provider, "event": "completed"})
                 self._save_queues()
                 logger.info(f"Removed completed batch {batch.id} from processing queue")
             else:
@@ -121,11 +245,43 @@ class BatchHandler:
         except:
             logger.error(f"Error processing completed batch {batch.id}", exc_info=True)
 
+    async def run_realtime_batch(self, batch: Batch, max_concurrency: int = 16, requests_per_minute: int | None = None) -> bool:
+        """
+        Run the batch through the real-time endpoint of the provider and process it right away,
+        instead of adding it to the pending queue.
+
+        Parameters:
+            batch: The batch to run.
+            max_concurrency: Maximum number of concurrent requests.
+            requests_per_minute: Maximum number of requests sent per minute.
+
+        Returns:
+            bool: True if the batch was run, False if it could not be run in real time and should be added to the queue.
+
+        Examples:
+            ```python
+            if not await batch_handler.run_realtime_batch(batch):
+                await batch_handler.add_batch(batch.id)
+            ```
+        """
+        try:
+            logger.info(f"Running batch {batch.id} in real time")
+            await batch.arun_realtime(max_concurrency, requests_per_minute)
+            await asyncio.to_thread(batch.save, self.batch_storage)
+        except:
+            logger.warning(f"Error running batch {batch.id} in real time", exc_info=True)
+            return False
+
+        self.queues["processing"].append(batch.id)
+        self._save_queues()
+        await self.process_completed_batch(batch)
+        return True
+
     async def retry_batch(self, batch: Batch):
         if batch.id in self.queues["processing"]:
             try:
                 logger.info(f"Retrying batch {batch.id}")
-                await asyncio.to_thread(batch.retry)
+                await batch.aretry()
             except:
                 logger.error(f"Error retrying batch {batch.id}", exc_info=True)
                 await self.cancel_batch(batch.id)
@@ -136,13 +292,152 @@ class BatchHandler:
         for queue in self.queues.values():
             if batch_id in queue:
                 queue.remove(batch_id)
+                provider = self._batch_providers.get(batch_id, "")
+                self._record_status(batch_id, provider, None)
+                self.metrics.increment("langbatch_batches_total", labels={"provider": provider, "event": "cancelled"})
                 self._save_queues()
                 logger.info(f"Cancelled and removed batch {batch_id} from queue")
                 return
         logger.warning(f"Batch {batch_id} not found in any queue for cancellation")
 
+    async def _collect_failed_requests(self, batch: Batch):
+        """
+        Add the completed batch to the re-drive queue, if its requests failed with transient errors.
+        The custom_ids of the failed requests and the re-drive time are saved with the batch in the batch storage,
+        and the requests are read from the batch when re-driven.
+        """
+        if batch.redrive_attempt >= self.max_redrive_attempts:
+            logger.warning(f"Failed requests of batch {batch.id} reached the maximum re-drive attempts")
+            return
+
+        try:
+            failed_requests = await asyncio.to_thread(batch.get_retryable_requests)
+            if not failed_requests:
+                return
+
+            batch.redrive_custom_ids = [request["custom_id"] for request in failed_requests]
+            batch.redrive_at = time.time() + self.redrive_backoff * 2 ** batch.redrive_attempt
+            await asyncio.to_thread(batch.save, self.batch_storage)
+        except:
+            logger.error(f"Error collecting failed requests of batch {batch.id}", exc_info=True)
+            return
+
+        self.queues.setdefault("redrive", []).append(batch.id)
+        self._redrive_at[batch.id] = batch.redrive_at
+        self._save_queues()
+        logger.info(f"Added {len(failed_requests)} failed requests of batch {batch.id} to the re-drive queue")
+
+    async def _redrive_failed_requests(self):
+        """
+        Coalesce the failed requests that are ready to be re-driven into new batches, 
+        grouped by batch class, init arguments and attempt, and add them to the pending queue.
+        """
+        now = time.time()
+        batch_ids = self.queues.get("redrive", [])
+        ready_batches = []
+        for batch_id in batch_ids:
+            # Waiting batches are loaded only when they are ready, except the first time to find their re-drive time
+            if self._redrive_at.get(batch_id, 0) > now:
+                continue
+            source_batch = await self._load_batch(batch_id)
+            if source_batch is None:
+                continue
+            self._redrive_at[batch_id] = source_batch.redrive_at or 0
+            if self._redrive_at[batch_id] <= now:
+                ready_batches.append(source_batch)
+        if not ready_batches:
+            return
+
+        groups = {}
+        for source_batch in ready_batches:
+            requests = await asyncio.to_thread(source_batch.get_requests_by_custom_ids, source_batch.redrive_custom_ids)
+
+            batch_class = type(source_batch)
+            init_args = batch_class._get_init_args(source_batch._create_meta_data())
+            key = (batch_class, json.dumps(init_args, sort_keys=True, default=str), source_batch.redrive_attempt + 1)
+            group = groups.setdefault(key, {"init_args": init_args, "requests": [], "source_batch_ids": {}})
+            group["requests"].extend(requests)
+            for request in requests:
+                # Keep the id of the batch the request was first sent in
+                group["source_batch_ids"][request["custom_id"]] = source_batch.source_batch_ids.get(request["custom_id"], source_batch.id)
+
+        for (batch_class, _, attempt), group in groups.items():
+            batch_kwargs = dict(group["init_args"])
+            for key, value in self.batch_kwargs.items():
+                if key not in batch_kwargs:
+                    batch_kwargs[key] = value
+
+            requests = group["requests"]
+            batch_size = batch_class._max_requests or len(requests)
+            for i in range(0, len(requests), batch_size):
+                chunk = requests[i:i + batch_size]
+                try:
+                    batch = await asyncio.to_thread(batch_class.create_from_requests, chunk, batch_kwargs)
+                    batch.redrive_attempt = attempt
+                    batch.source_batch_ids = {request["custom_id"]: group["source_batch_ids"][request["custom_id"]] for request in chunk}
+                    await asyncio.to_thread(batch.save, self.batch_storage)
+                except:
+                    logger.error(f"Error creating re-drive batch", exc_info=True)
+                    continue
+                await self.add_batch(batch.id, batch._provider)
+                self.metrics.increment("langbatch_redriven_requests_total", len(chunk), {"attempt": str(attempt)})
+                logger.info(f"Re-driving {len(chunk)} failed requests in batch {batch.id}, attempt {attempt}")
+
+        ready_batch_ids = {source_batch.id for source_batch in ready_batches}
+        self.queues["redrive"] = [batch_id for batch_id in batch_ids if batch_id not in ready_batch_ids]
+        for batch_id in ready_batch_ids:
+            self._redrive_at.pop(batch_id, None)
+        self._save_queues()
+
+    def get_provider_stats(self, provider: str) -> Dict[str, Any]:
+        """
+        Get the stats of the batches of the provider:
+        ```
+        * pending: number of pending batches
+        * processing: number of processing batches
+        * start_delay: estimated time in seconds until a newly added batch is started, based on the per cycle start limit
+        * turnaround_time: average time in seconds from start to completion of the recently completed batches, None if not observed yet
+        ```
+
+        Usage:
+        ```python
+        stats = batch_handler.get_provider_stats("openai")
+        print(stats["pending"], stats["processing"], stats["turnaround_time"])
+        ```
+        """
+        pending = sum(1 for batch_id in self.queues["pending"] if self._batch_providers.get(batch_id) == provider)
+        processing = sum(1 for batch_id in self.queues["processing"] if self._batch_providers.get(batch_id) == provider)
+        turnaround_times = self._turnaround_times.get(provider)
+        return {
+            "pending": pending,
+            "processing": processing,
+            "start_delay": (pending // max(1, self._get_limit(provider, "max_starts"))) * self.wait_time,
+            "turnaround_time": sum(turnaround_times) / len(turnaround_times) if turnaround_times else None
+        }
+
     def _save_queues(self):
         self.batch_queue.save(self.queues)
+        for state, queue in self.queues.items():
+            self.metrics.set_gauge("langbatch_queue_depth", len(queue), {"state": state})
+
+    def _record_status(self, batch_id: str, provider: str, status: str | None, since: float | None = None):
+        """
+        Record the status of the batch, reporting the time spent in the previous status when it changes.
+        Status None ends the tracking of the batch.
+        """
+        now = time.time()
+        previous = self._batch_statuses.get(batch_id)
+        if previous is not None and previous[0] == status:
+            return
+
+        if previous is not None:
+            previous_status, previous_since = previous
+            self.metrics.observe("langbatch_batch_status_seconds", now - previous_since, {"provider": provider, "status": previous_status})
+
+        if status is None:
+            self._batch_statuses.pop(batch_id, None)
+        else:
+            self._batch_statuses[batch_id] = (status, since if previous is None and since is not None else now)
 
     async def run(self):
         """
@@ -154,65 +449,176 @@ class BatchHandler:
         asyncio.create_task(batch_handler.run())
         ```
         """
-        while True:
-            logger.info("Handling batches")
-            retried_batches = 0
-            for batch_id in self.queues["processing"]:
-                if self.batch_storage:
-                    batch = self.batch_type.load(
-                        batch_id, 
-                        storage = self.batch_storage,
-                        batch_kwargs = self.batch_kwargs
-                    )
-                else:
-                    batch = self.batch_type.load(batch_id, batch_kwargs = self.batch_kwargs)
-                status = BatchStatus(await asyncio.to_thread(batch.get_status))
-                
-                if status == BatchStatus.COMPLETED:
-                    await self.process_completed_batch(batch)
-                elif status in [BatchStatus.FAILED, BatchStatus.EXPIRED]:
-                    if retried_batches < 4:
-                        retried = await self._handle_failed_or_expired_batch(batch, status)
-                        if retried:
-                            retried_batches += 1
-                elif status in [BatchStatus.CANCELLING, BatchStatus.CANCELLED]:
-                    await self.cancel_batch(batch_id)
-                elif status not in [BatchStatus.VALIDATING, BatchStatus.IN_PROGRESS, BatchStatus.FINALIZING]:
-                    logger.error(f"Unknown status {status.value} for batch {batch_id}")
-                    await self.cancel_batch(batch_id)
-
-            if retried_batches < 4:
-                started_batches = 0
-                for batch_id in self.queues["pending"]:
-                    if self.batch_storage:
-                        batch = self.batch_type.load(
-                            batch_id, 
-                            storage=self.batch_storage, 
-                            batch_kwargs=self.batch_kwargs
-                        )
-                    else:
-                        batch = self.batch_type.load(batch_id, batch_kwargs=self.batch_kwargs)
-                    await self.start_batch(batch)
-                    started_batches += 1
-
-                    if (started_batches + retried_batches) == 4:
-                        break
-
-            await asyncio.sleep(self.wait_time)
+        try:
+            while True:
+                logger.info("Handling batches")
+                try:
+                    await self._handle_batches()
+                except:
+                    logger.error("Error handling batches", exc_info=True)
+
+                await asyncio.sleep(self.wait_time)
+        finally:
+            for task in self._provider_tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._provider_tasks.values(), return_exceptions=True)
+
+    def _get_limit(self, provider: str, name: str) -> int:
+        return self.provider_limits.get(provider, {}).get(name, getattr(self, name))
+
+    def _get_semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._provider_semaphores:
+            self._provider_semaphores[provider] = asyncio.Semaphore(self._get_limit(provider, "max_workers"))
+        return self._provider_semaphores[provider]
+
+    async def _load_batch(self, batch_id: str) -> Batch | None:
+        try:
+            return await asyncio.to_thread(
+                self.batch_type.load,
+                batch_id,
+                storage=self.batch_storage,
+                batch_kwargs=self.batch_kwargs
+            )
+        except:
+            logger.error(f"Error loading batch {batch_id}", exc_info=True)
+            return None
+
+    async def _handle_batches(self):
+        if self.redrive_failed_requests:
+            try:
+                await self._redrive_failed_requests()
+            except:
+                logger.error("Error re-driving failed requests", exc_info=True)
+
+        # Group the batches by provider, keeping the queue order.
+        # Pending batches are loaded only when they are started, except the first time to find their provider.
+        # The batches are loaded concurrently in the worker threads.
+        processing_ids = list(self.queues["processing"])
+        pending_ids = list(self.queues["pending"])
+        unknown_pending_ids = [batch_id for batch_id in pending_ids if batch_id not in self._batch_providers]
+        loaded_batches = await asyncio.gather(*(self._load_batch(batch_id) for batch_id in processing_ids + unknown_pending_ids))
+        loaded = dict(zip(processing_ids + unknown_pending_ids, loaded_batches))
+
+        batches = defaultdict(lambda: {"processing": [], "pending": []})
+        for batch_id in processing_ids:
+            batch = loaded[batch_id]
+            if batch is not None:
+                self._batch_providers[batch_id] = batch._provider
+                batches[batch._provider]["processing"].append(batch)
+
+        for batch_id in pending_ids:
+            if batch_id not in loaded:
+                batches[self._batch_providers[batch_id]]["pending"].append(batch_id)
+                continue
+
+            batch = loaded[batch_id]
+            if batch is not None:
+                self._batch_providers[batch_id] = batch._provider
+                batches[batch._provider]["pending"].append(batch)
+
+        queued_batch_ids = set(self.queues["processing"]) | set(self.queues["pending"])
+        self._batch_providers = {
+            batch_id: provider for batch_id, provider in self._batch_providers.items() if batch_id in queued_batch_ids
+        }
+
+        for provider, provider_batches in batches.items():
+            task = self._provider_tasks.get(provider)
+            if task is not None and not task.done():
+                logger.info(f"Batches of provider {provider} are still being handled, skipping this cycle")
+                continue
+
+            task = asyncio.create_task(
+                self._handle_provider_batches(provider, provider_batches["processing"], provider_batches["pending"])
+            )
+            # the tasks of the providers outlive the cycle, so their errors are logged when they finish
+            task.add_done_callback(lambda task, provider=provider: self._log_provider_task_error(provider, task))
+            self._provider_tasks[provider] = task
+
+    def _log_provider_task_error(self, provider: str, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error(f"Error handling batches of provider {provider}", exc_info=error)
+
+    async def _handle_provider_batches(self, provider: str, processing: List[Batch], pending: List[Batch | str]):
+        semaphore = self._get_semaphore(provider)
+        max_starts = self._get_limit(provider, "max_starts")
+
+        async def get_statuses(batches: List[Batch]) -> Dict[str, str]:
+            # statuses of the batches of a class are retrieved together, with the list endpoint of the provider where available
+            labels = {"provider": provider}
+            with self.metrics.span("langbatch.poll", {"batches": len(batches), **labels}), self.metrics.timer("langbatch_poll_seconds", labels):
+                return await batches[0].__class__.aget_statuses(batches, max_concurrency=self._get_limit(provider, "max_workers"))
+
+        async def process_completed_batch(batch: Batch):
+            async with semaphore:
+                await self.process_completed_batch(batch)
+
+        # Batches processed by the previous cycle of the provider after they were loaded are skipped
+        processing = [batch for batch in processing if batch.id in self.queues["processing"]]
+        batches_by_class = defaultdict(list)
+        for batch in processing:
+            batches_by_class[batch.__class__].append(batch)
+
+        statuses = {}
+        for batches in batches_by_class.values():
+            statuses.update(await get_statuses(batches))
+
+        retried_batches = 0
+        completed_batches = []
+        for batch in processing:
+            try:
+                status = BatchStatus(statuses[batch.id])
+            except (KeyError, ValueError) as e:
+                logger.error(f"Error getting status of batch {batch.id}: {e!r}")
+                continue
+
+            # the first status of a batch is counted from its start
+            self._record_status(batch.id, provider, status.value, since=batch.started_at)
+            if status == BatchStatus.COMPLETED:
+                completed_batches.append(batch)
+            elif status in [BatchStatus.FAILED, BatchStatus.EXPIRED]:
+                if retried_batches < max_starts:
+                    retried = await self._handle_failed_or_expired_batch(batch, status)
+                    if retried:
+                        retried_batches += 1
+            elif status in [BatchStatus.CANCELLING, BatchStatus.CANCELLED]:
+                await self.cancel_batch(batch.id)
+            elif status not in [BatchStatus.VALIDATING, BatchStatus.IN_PROGRESS, BatchStatus.FINALIZING]:
+                logger.error(f"Unknown status {status.value} for batch {batch.id}")
+                await self.cancel_batch(batch.id)
+
+        await asyncio.gather(*(process_completed_batch(batch) for batch in completed_batches))
+
+        # Start the pending batches within the per cycle limit of the provider
+        started_batches = 0
+        for batch in pending:
+            if (started_batches + retried_batches) >= max_starts:
+                break
+            if isinstance(batch, str):
+                batch = await self._load_batch(batch)
+                if batch is None:
+                    continue
+            async with semaphore:
+                await self.start_batch(batch)
+            started_batches += 1
 
     async def _handle_failed_or_expired_batch(self, batch: 'Batch', status: BatchStatus):
         try:
             if status == BatchStatus.FAILED:
-                retryable = await batch.is_retryable_failure()
+                retryable = await batch.ais_retryable_failure()
                 if retryable:
-                    await asyncio.to_thread(self.retry_batch, batch)
+                    self.metrics.increment("langbatch_retries_total", labels={"provider": batch._provider, "status": status.value})
+                    await self.retry_batch(batch)
                     return True
                 else:
                     logger.warning(f"Batch {batch.id} failed due to non token-limit error")
-                    await asyncio.to_thread(self.cancel_batch, batch.id)
+                    await self.cancel_batch(batch.id)
                     return False
             elif status == BatchStatus.EXPIRED:
-                await asyncio.to_thread(self.retry_batch, batch)
+                self.metrics.increment("langbatch_retries_total", labels={"provider": batch._provider, "status": status.value})
+                await self.retry_batch(batch)
                 return True
         except Exception as e:
             logger.error(f"Error handling {status.value} batch {batch.id}: {e}")
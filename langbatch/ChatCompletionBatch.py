@@ -1,6 +1,10 @@
-from typing import Iterable, List, Dict, Any, Tuple
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, List, Dict, Any, Tuple
 from langbatch.Batch import Batch
+from langbatch.response_caches import ResponseCache
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 
 class ChatCompletionBatch(Batch):
     """
@@ -16,14 +20,17 @@ class ChatCompletionBatch(Batch):
         super().__init__(file)
 
     @classmethod
-    def create(cls, data: List[Iterable[ChatCompletionMessageParam]], request_kwargs: Dict = {}, batch_kwargs: Dict = {}) -> "ChatCompletionBatch":
+    def create(cls, data: Iterable[Iterable["ChatCompletionMessageParam"]], request_kwargs: Dict = {}, batch_kwargs: Dict = {}, deduplicate: bool = False, response_cache: ResponseCache | None = None) -> "ChatCompletionBatch":
         """
-        Create a chat completion batch when given a list of messages.
+        Create a chat completion batch when given an iterable of messages.
+        The requests are written to the batch file as the messages are consumed, so `data` can be a generator.
 
         Args:
-            data (List[Iterable[ChatCompletionMessageParam]]): A list of messages to be sent to the API.
+            data (Iterable[Iterable[ChatCompletionMessageParam]]): The messages to be sent to the API, ex. a list or a generator.
             request_kwargs (Dict): Additional keyword arguments for the API call. Ex. model, messages, etc.
             batch_kwargs (Dict): Additional keyword arguments for the batch class. Ex. gcp_project, etc. for VertexAIChatCompletionBatch.
+            deduplicate (bool): Send identical requests only once. Results are fanned out to all the duplicates when reading the results. Defaults to False.
+            response_cache (ResponseCache): Cache to answer the already answered requests from, instead of sending them again. Defaults to None.
 
         Returns:
             An instance of the ChatCompletionBatch class.
@@ -52,7 +59,100 @@ class ChatCompletionBatch(Batch):
             })
         ```
         """
-        return cls._create_batch_file("messages", data, request_kwargs, batch_kwargs)
+        return cls._create_batch_file("messages", data, request_kwargs, batch_kwargs, deduplicate, response_cache)
+
+    @classmethod
+    def create_from_arrow(
+        cls,
+        data: Any,
+        template: str,
+        key_column: str | None = None,
+        system_prompt: str | None = None,
+        request_kwargs: Dict = {},
+        batch_kwargs: Dict = {},
+        batch_size: int = 65536
+    ) -> "ChatCompletionBatch":
+        """
+        Create a chat completion batch from the rows of Arrow data, with a user message per row.
+        The messages are rendered from the template over whole record batches with Arrow compute kernels, 
+        and the requests are written to the batch file as the record batches are read. Requires pyarrow.
+
+        Args:
+            data: A pyarrow Table, RecordBatch, RecordBatchReader, Dataset or an iterable of RecordBatches.
+            template (str): The user message template, with `str.format` style column fields. Ex. "Summarize the review: {review}".
+                Null values are rendered as empty strings.
+            key_column (str, optional): Column to use as the custom_ids of the requests. Its values should be unique. 
+                Defaults to None, for random custom_ids.
+            system_prompt (str, optional): System message added before the user message of every request. Defaults to None.
+            request_kwargs (Dict): Additional keyword arguments for the API call. Ex. model, max_tokens, etc.
+            batch_kwargs (Dict): Additional keyword arguments for the batch class. Ex. gcp_project, etc. for VertexAIChatCompletionBatch.
+            batch_size (int, optional): Maximum number of rows read at once from datasets and tables. Defaults to 65536.
+
+        Returns:
+            An instance of the ChatCompletionBatch class.
+
+        Raises:
+            BatchInitializationError: If the template or the columns are invalid, or the batch file could not be created.
+            BatchValidationError: If the requests are invalid.
+
+        Usage:
+        ```python
+        import pyarrow as pa
+
+        table = pa.table({"id": ["review-1", "review-2"], "review": ["Great product", "Not worth it"]})
+        batch = OpenAIChatCompletionBatch.create_from_arrow(
+            table,
+            template="Classify the sentiment of the review: {review}",
+            key_column="id",
+            system_prompt="You are a helpful assistant.",
+            request_kwargs={"model": "gpt-4o-mini"})
+        ```
+        """
+        from langbatch.arrow_utils import INPUT_PLACEHOLDER
+
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt is not None else []
+        messages.append({"role": "user", "content": INPUT_PLACEHOLDER})
+        return cls._create_batch_from_arrow("messages", messages, data, template, key_column, request_kwargs, batch_kwargs, batch_size)
+
+    @classmethod
+    def create_from_parquet(
+        cls,
+        path: Any,
+        template: str,
+        key_column: str | None = None,
+        system_prompt: str | None = None,
+        request_kwargs: Dict = {},
+        batch_kwargs: Dict = {},
+        batch_size: int = 65536
+    ) -> "ChatCompletionBatch":
+        """
+        Create a chat completion batch from the rows of Parquet files, like `create_from_arrow`.
+        Only the columns used in the template and the key column are read. Requires pyarrow.
+
+        Args:
+            path: Path to a Parquet file, a directory of Parquet files or a list of Parquet file paths.
+            template (str): The user message template, with `str.format` style column fields. Ex. "Summarize the review: {review}".
+            key_column (str, optional): Column to use as the custom_ids of the requests. Defaults to None, for random custom_ids.
+            system_prompt (str, optional): System message added before the user message of every request. Defaults to None.
+            request_kwargs (Dict): Additional keyword arguments for the API call. Ex. model, max_tokens, etc.
+            batch_kwargs (Dict): Additional keyword arguments for the batch class.
+            batch_size (int, optional): Maximum number of rows read at once. Defaults to 65536.
+
+        Returns:
+            An instance of the ChatCompletionBatch class.
+
+        Usage:
+        ```python
+        batch = OpenAIChatCompletionBatch.create_from_parquet(
+            "reviews.parquet",
+            template="Classify the sentiment of the review: {review}",
+            key_column="id",
+            request_kwargs={"model": "gpt-4o-mini"})
+        ```
+        """
+        from langbatch.arrow_utils import parquet_dataset
+
+        return cls.create_from_arrow(parquet_dataset(path), template, key_column, system_prompt, request_kwargs, batch_kwargs, batch_size)
         
     def get_results(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] | Tuple[None, None]:
         """
@@ -69,4 +169,60 @@ class ChatCompletionBatch(Batch):
         ```
         """
         process_func = lambda result: {"choices": result['response']['body']['choices']}
-        return self._prepare_results(process_func)
\ No newline at end of file
+        return self._prepare_results(process_func)
+
+    async def aget_results(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] | Tuple[None, None]:
+        """
+        Async version of `get_results`.
+
+        Usage:
+        ```python
+        successful_results, unsuccessful_results = await batch.aget_results()
+        ```
+        """
+        process_func = lambda result: {"choices": result['response']['body']['choices']}
+        return await self._aprepare_results(process_func)
+
+    def export_results(self, path: str | Path, format: str = "parquet", batch_size: int = 10000) -> Path:
+        """
+        Export the results of the chat completion batch to a Parquet or Arrow IPC file with typed columns:
+        custom_id, status_code, content, finish_reason, prompt_tokens, completion_tokens, total_tokens, error_code and error_message.
+        content and finish_reason are of the first choice. Failed requests have null content and the error columns set.
+
+        The results file is streamed into record batches, so the results of millions of requests can be exported 
+        and queried with Arrow based tools without loading them as Python objects. Requires pyarrow.
+
+        Args:
+            path (str | Path): The path to the exported file.
+            format (str, optional): "parquet" or "arrow" for an Arrow IPC file. Defaults to "parquet".
+            batch_size (int, optional): Number of results per record batch. Defaults to 10000.
+
+        Returns:
+            Path: The path to the exported file.
+
+        Raises:
+            BatchResultsError: If the results file is not available.
+
+        Usage:
+        ```python
+        batch.export_results("results.parquet")
+
+        import duckdb
+        duckdb.sql("SELECT finish_reason, sum(total_tokens) FROM 'results.parquet' GROUP BY finish_reason")
+        ```
+        """
+        from langbatch.arrow_utils import results_schema
+
+        def result_row(result: Dict[str, Any]) -> Dict[str, Any]:
+            row = self._result_row(result)
+            row["content"] = row["finish_reason"] = row["completion_tokens"] = None
+            if row["status_code"] == 200:
+                body = result["response"]["body"]
+                choices = body.get("choices") or [{}]
+                row["content"] = (choices[0].get("message") or {}).get("content")
+                row["finish_reason"] = choices[0].get("finish_reason")
+                row["completion_tokens"] = (body.get("usage") or {}).get("completion_tokens")
+            return row
+
+        rows = map(result_row, self._iter_results())
+        return self._export_results(path, rows, results_schema(), format, batch_size)
@@ -1,5 +1,22 @@
-from typing import List, Dict, Any, Tuple
+import uuid
+import array
+import base64
+import itertools
+import functools
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Tuple
 from langbatch.Batch import Batch
+from langbatch.errors import BatchInitializationError
+from langbatch.response_caches import ResponseCache
+
+def estimate_tokens(input: Any) -> int:
+    """
+    Upper bound of the number of tokens of an embedding input, without a tokenizer.
+    Texts are counted by their UTF-8 encoded length, as a token spans at least a byte, token arrays by their length.
+    """
+    if isinstance(input, str):
+        return len(input.encode())
+    return len(input)
 
 class EmbeddingBatch(Batch):
     """
@@ -7,6 +24,9 @@ class EmbeddingBatch(Batch):
     Utilizes OpenAI Embedding API format as the standard request format.
     """
     _url: str = "/v1/embeddings" 
+    _max_inputs_per_request: int = 1 # inputs accepted in a request by the provider, more than 1 allows packing the inputs
+    _max_tokens_per_request: int | None = None # tokens accepted in a request by the provider, summed over the inputs
+    _max_tokens_per_input: int | None = None # tokens accepted for an input by the provider
 
     def __init__(self, file) -> None:
         """
@@ -15,14 +35,38 @@ class EmbeddingBatch(Batch):
         super().__init__(file)
 
     @classmethod
-    def create(cls, data: List[str], request_kwargs: Dict = {}, batch_kwargs: Dict = {}) -> "EmbeddingBatch":
+    def create(
+        cls,
+        data: Iterable[str],
+        request_kwargs: Dict = {},
+        batch_kwargs: Dict = {},
+        deduplicate: bool = False,
+        response_cache: ResponseCache | None = None,
+        pack_inputs: bool = False,
+        max_inputs_per_request: int | None = None,
+        max_tokens_per_request: int | None = None,
+        token_counter: Callable[[Any], int] = estimate_tokens
+    ) -> "EmbeddingBatch":
         """
-        Create an embedding batch when given a list of texts.
+        Create an embedding batch when given an iterable of texts.
+        The requests are written to the batch file as the texts are consumed, so `data` can be a generator.
+
+        With `pack_inputs`, consecutive texts are sent together in a request with an array of inputs,
+        within the input count and token limits of a request. Each text keeps its own custom_id, 
+        and the results are unpacked to a result per text when reading them.
 
         Args:
-            data (List[str]): A list of texts to be embedded.
+            data (Iterable[str]): The texts to be embedded, ex. a list or a generator.
             request_kwargs (Dict): Additional keyword arguments for the API call. Ex. model, encoding_format, etc.
             batch_kwargs (Dict): Additional keyword arguments for the batch class.
+            deduplicate (bool): Send identical texts only once. Results are fanned out to all the duplicates when reading the results. Defaults to False.
+            response_cache (ResponseCache): Cache to answer the already embedded texts from, instead of sending them again. Defaults to None.
+            pack_inputs (bool): Pack multiple texts in a request. Defaults to False.
+            max_inputs_per_request (int, optional): Maximum number of texts in a packed request. Defaults to the provider limit of the batch class.
+            max_tokens_per_request (int, optional): Maximum number of tokens of the texts in a packed request. Defaults to the provider limit of the batch class.
+            token_counter (Callable[[Any], int], optional): Counts the tokens of a text for `max_tokens_per_request`. 
+                Defaults to an upper bound from the encoded length of the text, pass a tokenizer based counter for exact counts.
+                Texts over the per input token limit of the provider are sent in a request of their own, so they can not fail the other texts.
 
         Returns:
             An instance of the EmbeddingBatch class.
@@ -37,9 +81,196 @@ class EmbeddingBatch(Batch):
             "Hello LangBatch"
         ], 
             request_kwargs={"model": "text-embedding-3-small"})
+
+        # Pack up to 2048 texts in a request
+        batch = OpenAIEmbeddingBatch.create(texts, request_kwargs={"model": "text-embedding-3-small"}, pack_inputs=True)
+
+        # Stream the texts from a large file
+        with open("path/to/texts.txt") as f:
+            batch = OpenAIEmbeddingBatch.create(
+                (line.strip() for line in f),
+                request_kwargs={"model": "text-embedding-3-small"})
         ```
         """
-        return cls._create_batch_file("input", data, request_kwargs, batch_kwargs)
+        pack = None
+        if pack_inputs:
+            max_inputs = max_inputs_per_request or cls._max_inputs_per_request
+            if max_inputs > cls._max_inputs_per_request:
+                raise BatchInitializationError(
+                    f"{cls.__name__} accepts at most {cls._max_inputs_per_request} inputs per request, got max_inputs_per_request={max_inputs}"
+                )
+            pack = functools.partial(
+                cls._pack_requests,
+                max_inputs=max_inputs,
+                max_tokens=max_tokens_per_request or cls._max_tokens_per_request,
+                max_tokens_per_input=cls._max_tokens_per_input,
+                token_counter=token_counter
+            )
+
+        return cls._create_batch_file("input", data, request_kwargs, batch_kwargs, deduplicate, response_cache, pack)
+
+    @classmethod
+    def _pack_requests(
+        cls,
+        requests: Iterable[Dict[str, Any]],
+        packed_inputs: Dict[str, List[str]],
+        max_inputs: int,
+        max_tokens: int | None,
+        token_counter: Callable[[Any], int],
+        max_tokens_per_input: int | None = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Group consecutive single input requests into requests with an array of inputs, within the input count and token limits.
+        Inputs over `max_tokens_per_input` are not packed, the provider rejects the whole request of an oversized input.
+        The custom_ids of the inputs of each packed request are added to `packed_inputs`, in the order of the inputs.
+        The requests should have the same body apart from the input, like the requests created by `create`.
+        """
+        def packed_request(group):
+            custom_id = str(uuid.uuid4())
+            packed_inputs[custom_id] = [request["custom_id"] for request in group]
+            return {
+                **group[0],
+                "custom_id": custom_id,
+                "body": {**group[0]["body"], "input": [request["body"]["input"] for request in group]}
+            }
+
+        group = []
+        group_tokens = 0
+        for request in requests:
+            tokens = token_counter(request["body"]["input"]) if max_tokens or max_tokens_per_input else 0
+            if max_tokens_per_input and tokens > max_tokens_per_input:
+                yield request
+                continue
+            if group and (len(group) >= max_inputs or (max_tokens and group_tokens + tokens > max_tokens)):
+                yield packed_request(group)
+                group = []
+                group_tokens = 0
+            group.append(request)
+            group_tokens += tokens
+
+        if group:
+            yield packed_request(group)
+
+    def _unpack_requests(self, requests: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for request in requests:
+            custom_ids = self._packed_inputs.get(request["custom_id"])
+            if custom_ids is None:
+                yield request
+                continue
+
+            for custom_id, input in zip(custom_ids, request["body"]["input"]):
+                yield {**request, "custom_id": custom_id, "body": {**request["body"], "input": input}}
+
+    def _unpack_results(self, results: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for result in results:
+            custom_ids = self._packed_inputs.get(result["custom_id"])
+            if custom_ids is None:
+                yield result
+                continue
+
+            response = result.get("response")
+            if response is None or response.get("status_code") != 200:
+                # all the inputs of a failed request fail with its error
+                for custom_id in custom_ids:
+                    yield {**result, "custom_id": custom_id}
+                continue
+
+            body = response["body"]
+            for item in body["data"]:
+                index = item["index"]
+                unpacked_body = {
+                    **body,
+                    "data": [{**item, "index": 0}],
+                    # the usage of the request is kept on its first input only, so the usage of the results adds up
+                    "usage": body.get("usage") if index == 0 else None
+                }
+                yield {**result, "custom_id": custom_ids[index], "response": {**response, "body": unpacked_body}}
+
+    @classmethod
+    def create_from_arrow(
+        cls,
+        data: Any,
+        template: str,
+        key_column: str | None = None,
+        request_kwargs: Dict = {},
+        batch_kwargs: Dict = {},
+        batch_size: int = 65536
+    ) -> "EmbeddingBatch":
+        """
+        Create an embedding batch from the rows of Arrow data, with a text per row.
+        The texts are rendered from the template over whole record batches with Arrow compute kernels, 
+        and the requests are written to the batch file as the record batches are read. Requires pyarrow.
+
+        Args:
+            data: A pyarrow Table, RecordBatch, RecordBatchReader, Dataset or an iterable of RecordBatches.
+            template (str): The text template, with `str.format` style column fields. Ex. "{title}: {abstract}" or "{text}".
+                Null values are rendered as empty strings.
+            key_column (str, optional): Column to use as the custom_ids of the requests. Its values should be unique. 
+                Defaults to None, for random custom_ids.
+            request_kwargs (Dict): Additional keyword arguments for the API call. Ex. model, encoding_format, etc.
+            batch_kwargs (Dict): Additional keyword arguments for the batch class.
+            batch_size (int, optional): Maximum number of rows read at once from datasets and tables. Defaults to 65536.
+
+        Returns:
+            An instance of the EmbeddingBatch class.
+
+        Raises:
+            BatchInitializationError: If the template or the columns are invalid, or the batch file could not be created.
+            BatchValidationError: If the requests are invalid.
+
+        Usage:
+        ```python
+        import pyarrow as pa
+
+        table = pa.table({"id": ["doc-1", "doc-2"], "text": ["Hello world", "Hello LangBatch"]})
+        batch = OpenAIEmbeddingBatch.create_from_arrow(
+            table,
+            template="{text}",
+            key_column="id",
+            request_kwargs={"model": "text-embedding-3-small"})
+        ```
+        """
+        from langbatch.arrow_utils import INPUT_PLACEHOLDER
+
+        return cls._create_batch_from_arrow("input", INPUT_PLACEHOLDER, data, template, key_column, request_kwargs, batch_kwargs, batch_size)
+
+    @classmethod
+    def create_from_parquet(
+        cls,
+        path: Any,
+        template: str,
+        key_column: str | None = None,
+        request_kwargs: Dict = {},
+        batch_kwargs: Dict = {},
+        batch_size: int = 65536
+    ) -> "EmbeddingBatch":
+        """
+        Create an embedding batch from the rows of Parquet files, like `create_from_arrow`.
+        Only the columns used in the template and the key column are read. Requires pyarrow.
+
+        Args:
+            path: Path to a Parquet file, a directory of Parquet files or a list of Parquet file paths.
+            template (str): The text template, with `str.format` style column fields. Ex. "{text}".
+            key_column (str, optional): Column to use as the custom_ids of the requests. Defaults to None, for random custom_ids.
+            request_kwargs (Dict): Additional keyword arguments for the API call. Ex. model, encoding_format, etc.
+            batch_kwargs (Dict): Additional keyword arguments for the batch class.
+            batch_size (int, optional): Maximum number of rows read at once. Defaults to 65536.
+
+        Returns:
+            An instance of the EmbeddingBatch class.
+
+        Usage:
+        ```python
+        batch = OpenAIEmbeddingBatch.create_from_parquet(
+            "documents/",
+            template="{text}",
+            key_column="id",
+            request_kwargs={"model": "text-embedding-3-small"})
+        ```
+        """
+        from langbatch.arrow_utils import parquet_dataset
+
+        return cls.create_from_arrow(parquet_dataset(path), template, key_column, request_kwargs, batch_kwargs, batch_size)
     
     def get_results(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] | Tuple[None, None]:
         """
@@ -56,4 +287,71 @@ class EmbeddingBatch(Batch):
         ```
         """
         process_func = lambda result: {"embedding": result['response']['body']['data'][0]['embedding']}
-        return self._prepare_results(process_func)
\ No newline at end of file
+        return self._prepare_results(process_func)
+
+    async def aget_results(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]] | Tuple[None, None]:
+        """
+        Async version of `get_results`.
+
+        Usage:
+        ```python
+        successful_results, unsuccessful_results = await batch.aget_results()
+        ```
+        """
+        process_func = lambda result: {"embedding": result['response']['body']['data'][0]['embedding']}
+        return await self._aprepare_results(process_func)
+
+    def export_results(self, path: str | Path, format: str = "parquet", batch_size: int = 10000, dimensions: int | None = None) -> Path:
+        """
+        Export the results of the embedding batch to a Parquet or Arrow IPC file with typed columns:
+        custom_id, status_code, embedding, prompt_tokens, total_tokens, error_code and error_message.
+        The embedding column is a fixed size list of float32. Failed requests have a null embedding and the error columns set.
+
+        The results file is streamed into record batches, so the results of millions of requests can be exported 
+        and queried with Arrow based tools without loading them as Python objects. Requires pyarrow.
+
+        Args:
+            path (str | Path): The path to the exported file.
+            format (str, optional): "parquet" or "arrow" for an Arrow IPC file. Defaults to "parquet".
+            batch_size (int, optional): Number of results per record batch. Defaults to 10000.
+            dimensions (int, optional): Size of the embeddings. Defaults to the size of the first embedding in the results.
+
+        Returns:
+            Path: The path to the exported file.
+
+        Raises:
+            BatchResultsError: If the results file is not available.
+
+        Usage:
+        ```python
+        batch.export_results("embeddings.parquet")
+
+        import pyarrow.parquet as pq
+        table = pq.read_table("embeddings.parquet", columns=["custom_id", "embedding"])
+        ```
+        """
+        from langbatch.arrow_utils import results_schema
+
+        def result_row(result: Dict[str, Any]) -> Dict[str, Any]:
+            row = self._result_row(result)
+            row["embedding"] = None
+            if row["status_code"] == 200:
+                embedding = result["response"]["body"]["data"][0]["embedding"]
+                if isinstance(embedding, str):
+                    # embeddings requested with encoding_format "base64" are little endian float32 arrays
+                    embedding = array.array("f", base64.b64decode(embedding)).tolist()
+                row["embedding"] = embedding
+            return row
+
+        rows = map(result_row, self._iter_results())
+        if dimensions is None:
+            # the rows are buffered until the first embedding to get the size of the embeddings
+            buffered_rows = []
+            for row in rows:
+                buffered_rows.append(row)
+                if row["embedding"] is not None:
+                    dimensions = len(row["embedding"])
+                    break
+            rows = itertools.chain(buffered_rows, rows)
+
+        return self._export_results(path, rows, results_schema(dimensions or 0), format, batch_size)
@@ -0,0 +1,224 @@
+import uuid
+import logging
+from typing import Any, Dict, List, Set
+
+from langbatch import json_codec
+from langbatch.Batch import Batch
+from langbatch.BatchDispatcher import BatchDispatcher
+from langbatch.factory import chat_completion_batch_type
+
+logger = logging.getLogger(__name__)
+
+class ProviderRoute:
+    """
+    A provider that RoutingBatchDispatcher can send batches to.
+    The batch class and its clients are created with the factory, from the given kwargs or the environment variables.
+
+    Usage:
+    ```python
+    # Primary provider, limited to 10 queued batches
+    openai_route = ProviderRoute("openai", model="gpt-4o-mini", price=0.075, max_queued_batches=10)
+
+    # Secondary provider
+    anthropic_route = ProviderRoute(
+        "anthropic",
+        model="claude-3-5-haiku-20241022",
+        price=0.4,
+        max_queued_requests=100000,
+        expected_turnaround=3600
+    )
+    ```
+    """
+    def __init__(
+            self,
+            provider: str,
+            model: str | None = None,
+            price: float = 1.0,
+            max_queued_batches: int | None = None,
+            max_queued_requests: int | None = None,
+            expected_turnaround: float = 3600 * 24,
+            request_kwargs: Dict = {},
+            name: str | None = None,
+            **kwargs
+        ):
+        """
+        Initialize the ProviderRoute.
+
+        Args:
+            provider (str): The provider, one of the providers supported by `chat_completion_batch`:
+                "openai", "azure", "anthropic", "vertex_ai", "bedrock".
+            model (str, optional): The model to use with the provider. Set as the model of the requests.
+            price (float, optional): Price of the provider, in any unit used consistently for all the routes. Ex. price per 1M input tokens. Defaults to 1.0.
+            max_queued_batches (int, optional): Maximum number of batches sent to the route by the dispatcher that are being created, dispatched, pending or processing. Defaults to None (no limit).
+            max_queued_requests (int, optional): Maximum number of requests in the queued batches sent to the provider by the dispatcher. Defaults to None (no limit).
+            expected_turnaround (float, optional): Turnaround time in seconds assumed until turnaround times of the provider are observed. Defaults to 24 hours.
+            request_kwargs (Dict, optional): Request parameters overridden for the provider.
+            name (str, optional): Name of the route. Defaults to the provider.
+            **kwargs: Additional arguments for the batch class, ex. client, gcp_project, etc.
+        """
+        self.provider = provider
+        self.name = name or provider
+        self.price = price
+        self.max_queued_batches = max_queued_batches
+        self.max_queued_requests = max_queued_requests
+        self.expected_turnaround = expected_turnaround
+        self.request_kwargs = {"model": model, **request_kwargs} if model else request_kwargs
+        self.batch_type, self.batch_kwargs = chat_completion_batch_type(provider, model, **kwargs)
+
+class RoutingBatchDispatcher(BatchDispatcher):
+    """
+    Batch dispatcher that sends each batch to one of multiple providers.
+    Routes whose queue is full are skipped, so overflow spills to the next provider.
+    Among the other routes, the route with the lowest score is picked:
+    ```
+    score = cost_weight * price / lowest price + latency_weight * expected latency / lowest expected latency
+
+    expected latency = estimated time until the batch is started by the handler
+                        + average observed turnaround time of the provider (or expected_turnaround)
+    ```
+    Ties go to the route given first.
+
+    Usage:
+    ```python
+    batch_dispatcher = RoutingBatchDispatcher(
+        routes=[
+            ProviderRoute("openai", model="gpt-4o-mini", price=0.075, max_queued_batches=10),
+            ProviderRoute("anthropic", model="claude-3-5-haiku-20241022", price=0.4)
+        ],
+        batch_handler=batch_handler,
+        queue=request_queue,
+        request_kwargs={"temperature": 0.7},
+        cost_weight=1.0,
+        latency_weight=0.5
+    )
+    asyncio.create_task(batch_dispatcher.run())
+    ```
+    """
+    def __init__(
+            self,
+            routes: List[ProviderRoute],
+            *args,
+            cost_weight: float = 1.0,
+            latency_weight: float = 1.0,
+            **kwargs
+        ):
+        """
+        Initialize the RoutingBatchDispatcher.
+
+        Args:
+            routes (List[ProviderRoute]): The providers to route the batches to, in order of preference.
+            cost_weight (float, optional): Weight of the price in the route score. Defaults to 1.0.
+            latency_weight (float, optional): Weight of the expected latency in the route score. Defaults to 1.0.
+            *args, **kwargs: Arguments of BatchDispatcher.
+        """
+        super().__init__(*args, **kwargs)
+        if not routes:
+            raise ValueError("At least one route is required")
+
+        self.routes = routes
+        self.cost_weight = cost_weight
+        self.latency_weight = latency_weight
+        self._route_providers: Dict[str, str] = {} # route name -> provider of its batches
+        self._route_batches: Dict[str, Dict[str, int]] = {route.name: {} for route in routes} # route name -> batch or reservation id -> requests count
+        # reservations of the batches being created and ids of the created batches waiting to be dispatched,
+        # counted on their route although they are not in the handler queues yet
+        self._in_flight: Set[str] = set()
+
+    def _get_route_stats(self, route: ProviderRoute) -> Dict[str, Any]:
+        queued_batch_ids = set(self.batch_handler.queues["pending"]) | set(self.batch_handler.queues["processing"])
+        route_batches = self._route_batches[route.name]
+        for batch_id in list(route_batches):
+            if batch_id not in queued_batch_ids and batch_id not in self._in_flight:
+                del route_batches[batch_id]
+
+        provider = self._route_providers.get(route.name)
+        if provider is not None:
+            stats = self.batch_handler.get_provider_stats(provider)
+        else:
+            stats = {"pending": 0, "processing": 0, "start_delay": 0, "turnaround_time": None}
+
+        turnaround_time = stats["turnaround_time"] or route.expected_turnaround
+        return {
+            # counted per route, routes of the same provider have their own limits
+            "queued_batches": len(route_batches),
+            "queued_requests": sum(route_batches.values()),
+            "latency": stats["start_delay"] + turnaround_time
+        }
+
+    def _is_saturated(self, route: ProviderRoute, stats: Dict[str, Any], requests_count: int) -> bool:
+        if route.max_queued_batches is not None and stats["queued_batches"] >= route.max_queued_batches:
+            return True
+        if route.max_queued_requests is not None and stats["queued_requests"] + requests_count > route.max_queued_requests:
+            return True
+        return False
+
+    def _select_route(self, requests_count: int, reservation_id: str | None = None) -> ProviderRoute:
+        """
+        Pick the route of a batch of `requests_count` requests.
+        With a `reservation_id`, the requests are counted on the picked route right away,
+        so the batches created concurrently see the capacity taken by each other.
+        """
+        route_stats = [(route, self._get_route_stats(route)) for route in self.routes]
+        candidates = [
+            (route, stats) for route, stats in route_stats
+            if not self._is_saturated(route, stats, requests_count)
+        ]
+        if not candidates:
+            logger.warning("All routes are saturated, routing to the route with the best score")
+            candidates = route_stats
+
+        min_price = min(route.price for route, _ in candidates)
+        min_latency = min(stats["latency"] for _, stats in candidates)
+
+        def score(candidate):
+            route, stats = candidate
+            cost_score = route.price / min_price if min_price > 0 else float(route.price > 0)
+            latency_score = stats["latency"] / min_latency if min_latency > 0 else 1.0
+            return self.cost_weight * cost_score + self.latency_weight * latency_score
+
+        # min returns the first of the routes with the lowest score
+        route, _ = min(candidates, key=score)
+        if reservation_id is not None:
+            self._route_batches[route.name][reservation_id] = requests_count
+            self._in_flight.add(reservation_id)
+        return route
+
+    def _release_reservation(self, route: ProviderRoute, reservation_id: str):
+        self._route_batches[route.name].pop(reservation_id, None)
+        self._in_flight.discard(reservation_id)
+
+    async def _create_batch(self, requests: List[Any]) -> Batch:
+        requests_count = len(requests)
+        reservation_id = str(uuid.uuid4())
+        route = self._select_route(requests_count, reservation_id)
+        logger.info(f"Routing batch of {requests_count} requests to {route.name}")
+
+        try:
+            batch = await self._create_batch_for_route(requests, route)
+        finally:
+            self._release_reservation(route, reservation_id)
+
+        # counted until it is dispatched, while it waits for the batches before it
+        self._route_providers[route.name] = batch._provider
+        self._route_batches[route.name][batch.id] = requests_count
+        self._in_flight.add(batch.id)
+        return batch
+
+    async def _dispatch_batch(self, batch: Batch, realtime: bool = False):
+        try:
+            await super()._dispatch_batch(batch, realtime)
+        finally:
+            self._in_flight.discard(batch.id)
+
+    async def _create_batch_for_route(self, requests: List[Any], route: ProviderRoute) -> Batch:
+
+        if self.requests_type == "partial":
+            request_kwargs = {**self.request_kwargs, **route.request_kwargs}
+        else:
+            request_kwargs = self.request_kwargs
+            if route.request_kwargs:
+                if len(requests) > 0 and isinstance(requests[0], (bytes, str)):
+                    requests = [json_codec.loads(request) for request in requests]
+                requests = [{**request, "body": {**request["body"], **route.request_kwargs}} for request in requests]
+
+        return await self._create_batch_of_type(requests, route.batch_type, route.batch_kwargs, request_kwargs)
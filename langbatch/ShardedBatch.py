@@ -0,0 +1,337 @@
+"""
+ShardedBatch runs a batch file larger than the provider limits as multiple provider batches.
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Type
+
+from langbatch.Batch import Batch
+from langbatch.batch_storages import BatchStorage, FileBatchStorage, get_default_data_path
+from langbatch.errors import BatchStartError
+
+logger = logging.getLogger(__name__)
+
+class ShardedBatch:
+    """
+    ShardedBatch splits a batch file into shards within the request count and byte size limits
+    of the provider, and runs each shard as a separate batch. The shards are started concurrently,
+    and the status and results of the shards are aggregated.
+
+    Usage:
+    ```python
+    batch = ShardedBatch("path/to/large_file.jsonl", OpenAIChatCompletionBatch)
+    batch.start()
+
+    if batch.get_status() == "completed":
+        successful_results, unsuccessful_results = batch.get_results()
+
+    # With custom limits and batch kwargs
+    batch = ShardedBatch(
+        "path/to/large_file.jsonl",
+        AnthropicChatCompletionBatch,
+        batch_kwargs={"client": client},
+        max_requests=10000
+    )
+
+    # From the factory functions
+    batch = chat_completion_batch("path/to/large_file.jsonl", "openai", shard=True)
+
+    # The id is derived from the shards, so it is the same after loading the batch
+    batch.save()
+    batch = ShardedBatch.load(batch.shard_ids)
+    ```
+    """
+    max_workers: int = 8
+
+    def __init__(
+            self,
+            file: str,
+            batch_type: Type[Batch],
+            batch_kwargs: Dict = {},
+            max_requests: int | None = None,
+            max_bytes: int | None = None
+        ):
+        """
+        Initialize the ShardedBatch. Splits the file into shards and initializes a batch for each shard.
+
+        Args:
+            file (str): The path to the batch file in OpenAI batch format.
+            batch_type (Type[Batch]): The batch class of the shards.
+            batch_kwargs (Dict, optional): Additional keyword arguments for the batch class.
+            max_requests (int, optional): Maximum number of requests in a shard. Defaults to the provider limit of the batch class.
+            max_bytes (int, optional): Maximum size of a shard file in bytes. Defaults to the provider limit of the batch class.
+        """
+        self.batch_type = batch_type
+        self.max_requests = max_requests or batch_type._max_requests
+        self.max_bytes = max_bytes or batch_type._max_bytes
+
+        shard_files = self._split_file(file, self.max_requests, self.max_bytes)
+        self.shards: List[Batch] = [batch_type(str(shard_file), **batch_kwargs) for shard_file in shard_files]
+        self.id = self._get_id(self.shard_ids)
+        logger.info(f"Split batch file {file} into {len(self.shards)} shards")
+
+    @staticmethod
+    def _get_id(shard_ids: List[str]) -> str:
+        # derived from the ids of the shards, so the loaded sharded batch keeps its id and results file
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, "langbatch:sharded_batch:" + ",".join(shard_ids)))
+
+    @classmethod
+    def exceeds_limits(cls, file: str, batch_type: Type[Batch]) -> bool:
+        """
+        Check if the file exceeds the request count or byte size limits of the provider of the batch class.
+        """
+        return cls._needs_split(file, batch_type._max_requests, batch_type._max_bytes)
+
+    @classmethod
+    def _split_file(cls, file: str, max_requests: int | None, max_bytes: int | None) -> List[Path]:
+        if not cls._needs_split(file, max_requests, max_bytes):
+            return [Path(file)]
+
+        shards_dir = get_default_data_path() / "created_batches"
+        shards_dir.mkdir(exist_ok=True, parents=True)
+
+        shard_files = []
+        writer = None
+        count = size = 0
+        try:
+            with open(file, "rb") as reader:
+                for line in reader:
+                    if not line.strip():
+                        continue
+                    if not line.endswith(b"\n"):
+                        line += b"\n"
+
+                    if writer is None or (max_requests and count >= max_requests) or (max_bytes and size + len(line) > max_bytes):
+                        if writer is not None:
+                            writer.close()
+                        shard_file = shards_dir / f"{uuid.uuid4()}.jsonl"
+                        shard_files.append(shard_file)
+                        writer = open(shard_file, "wb")
+                        count = size = 0
+
+                    # lines are copied as is, without parsing the requests
+                    writer.write(line)
+                    count += 1
+                    size += len(line)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        return shard_files
+
+    @classmethod
+    def _needs_split(cls, file: str, max_requests: int | None, max_bytes: int | None) -> bool:
+        if max_bytes is not None and os.path.getsize(file) > max_bytes:
+            return True
+        if max_requests is not None:
+            count = 0
+            with open(file, "rb") as reader:
+                for line in reader:
+                    if line.strip():
+                        count += 1
+                        if count > max_requests:
+                            return True
+        return False
+
+    @property
+    def shard_ids(self) -> List[str]:
+        return [shard.id for shard in self.shards]
+
+    def _run_on_shards(self, func, shards: List[Batch] | None = None) -> List[Any]:
+        shards = self.shards if shards is None else shards
+        if len(shards) == 1:
+            return [func(shards[0])]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(shards))) as executor:
+            return list(executor.map(func, shards))
+
+    def start(self):
+        """
+        Start the batches of all the shards concurrently.
+        Shards that failed to start can be started again by calling `start` again.
+
+        Usage:
+        ```python
+        batch.start()
+        ```
+        """
+        def start_shard(shard: Batch):
+            if shard.platform_batch_id is not None:
+                return None
+            try:
+                shard.start()
+            except Exception as e:
+                logger.error(f"Error starting shard {shard.id}", exc_info=True)
+                return e
+
+        errors = [error for error in self._run_on_shards(start_shard) if error is not None]
+        if errors:
+            raise BatchStartError(f"{len(errors)} of {len(self.shards)} shards failed to start: {errors[0]}")
+
+    async def astart(self):
+        """
+        Async version of `start`.
+        """
+        shards = [shard for shard in self.shards if shard.platform_batch_id is None]
+        results = await asyncio.gather(*(shard.astart() for shard in shards), return_exceptions=True)
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise BatchStartError(f"{len(errors)} of {len(self.shards)} shards failed to start: {errors[0]}")
+
+    def get_shard_statuses(self) -> List[str]:
+        """
+        Get the status of the batch of each shard.
+        """
+        return self._run_on_shards(lambda shard: shard.get_status())
+
+    @staticmethod
+    def _aggregate_status(statuses: List[str]) -> str:
+        unique_statuses = set(statuses)
+        if len(unique_statuses) == 1:
+            return statuses[0]
+
+        for status in ["failed", "expired", "cancelling", "cancelled"]:
+            if status in unique_statuses:
+                return status
+        return "in_progress"
+
+    def get_status(self) -> str:
+        """
+        Get the aggregate status of the shards.
+        Same as the status of the shards when all of them have the same status. Otherwise, "failed", "expired",
+        "cancelling" or "cancelled" when any of the shards has that status, in that order, and "in_progress" if none.
+
+        Usage:
+        ```python
+        if batch.get_status() == "completed":
+            successful_results, unsuccessful_results = batch.get_results()
+        ```
+        """
+        return self._aggregate_status(self.get_shard_statuses())
+
+    async def aget_status(self) -> str:
+        """
+        Async version of `get_status`.
+        """
+        statuses = await asyncio.gather(*(shard.aget_status() for shard in self.shards))
+        return self._aggregate_status(list(statuses))
+
+    def is_retryable_failure(self) -> bool:
+        """
+        Check if all the failed shards can be retried.
+        """
+        failed_shards = [
+            shard for shard, status in zip(self.shards, self.get_shard_statuses())
+            if status in ["failed", "expired"]
+        ]
+        return len(failed_shards) > 0 and all(self._run_on_shards(lambda shard: shard.is_retryable_failure(), failed_shards))
+
+    def retry(self):
+        """
+        Retry the batches of the failed and expired shards.
+        """
+        failed_shards = [
+            shard for shard, status in zip(self.shards, self.get_shard_statuses())
+            if status in ["failed", "expired"]
+        ]
+        self._run_on_shards(lambda shard: shard.retry(), failed_shards)
+
+    def iter_results(self) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """
+        Iterate over the results of the shards, one shard at a time,
+        so only the results of one shard are held in memory.
+
+        Yields:
+            A tuple containing the successful and unsuccessful results of a shard.
+
+        Usage:
+        ```python
+        for successful_results, unsuccessful_results in batch.iter_results():
+            for result in successful_results:
+                print(result["choices"])
+        ```
+        """
+        for shard in self.shards:
+            successful_results, unsuccessful_results = shard.get_results()
+            yield successful_results or [], unsuccessful_results or []
+
+    def get_results(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Retrieve the merged results of all the shards.
+
+        Returns:
+            A tuple containing the successful and unsuccessful results of all the shards.
+        """
+        successful_results = []
+        unsuccessful_results = []
+        for shard_successful_results, shard_unsuccessful_results in self.iter_results():
+            successful_results.extend(shard_successful_results)
+            unsuccessful_results.extend(shard_unsuccessful_results)
+        return successful_results, unsuccessful_results
+
+    def get_results_file(self) -> Path | None:
+        """
+        Get a results file in OpenAI batch results format with the results of all the shards.
+        """
+        results_files = self._run_on_shards(lambda shard: shard.get_results_file())
+        results_files = [results_file for results_file in results_files if results_file is not None]
+        if not results_files:
+            return None
+
+        results_dir = get_default_data_path() / "results"
+        results_dir.mkdir(exist_ok=True)
+        file_path = results_dir / f"{self.id}.jsonl"
+        with open(file_path, "wb") as writer:
+            for results_file in results_files:
+                with open(results_file, "rb") as reader:
+                    for line in reader:
+                        if not line.endswith(b"\n"):
+                            line += b"\n"
+                        writer.write(line)
+
+        return file_path
+
+    def get_unsuccessful_requests(self) -> List[Dict[str, Any]]:
+        """
+        Retrieve the unsuccessful requests of all the shards.
+        """
+        requests = []
+        for shard in self.shards:
+            requests.extend(shard.get_unsuccessful_requests())
+        return requests
+
+    def save(self, storage: BatchStorage = FileBatchStorage()):
+        """
+        Save the batches of the shards to the storage. Load them back with `ShardedBatch.load(batch.shard_ids)`.
+        """
+        for shard in self.shards:
+            shard.save(storage)
+
+    @classmethod
+    def load(cls, shard_ids: List[str], storage: BatchStorage = FileBatchStorage(), batch_kwargs: Dict = {}) -> "ShardedBatch":
+        """
+        Load a sharded batch from the batches of its shards.
+
+        Usage:
+        ```python
+        batch.save()
+        shard_ids = batch.shard_ids
+
+        batch = ShardedBatch.load(shard_ids)
+        ```
+        """
+        shards = [Batch.load(shard_id, storage=storage, batch_kwargs=batch_kwargs) for shard_id in shard_ids]
+
+        batch = cls.__new__(cls)
+        batch.id = cls._get_id(shard_ids)
+        batch.batch_type = type(shards[0])
+        batch.max_requests = batch.batch_type._max_requests
+        batch.max_bytes = batch.batch_type._max_bytes
+        batch.shards = shards
+        return batch
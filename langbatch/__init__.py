@@ -1,6 +1,10 @@
 import logging
+
+# The pipeline modules import the provider modules and their SDKs on first use,
+# so `import langbatch` does not load the SDKs
 from langbatch.BatchDispatcher import BatchDispatcher
 from langbatch.BatchHandler import BatchHandler
+from langbatch.RoutingBatchDispatcher import RoutingBatchDispatcher, ProviderRoute
 from langbatch.factory import chat_completion_batch, embedding_batch
 
 logging.basicConfig(
@@ -9,4 +13,4 @@ logging.basicConfig(
     datefmt='%d-%m-%y %H:%M:%S'
 )
 
-__all__ = ["chat_completion_batch", "embedding_batch"]
\ No newline at end of file
+__all__ = ["chat_completion_batch", "embedding_batch"]
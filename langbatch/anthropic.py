@@ -1,10 +1,16 @@
-from typing import Any, Dict, Optional
-import jsonlines
-from anthropic import Anthropic
+import asyncio
+import logging
+import itertools
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from anthropic import Anthropic, AsyncAnthropic
 from anthropic.types.beta.message_create_params import MessageCreateParamsNonStreaming
 from anthropic.types.beta.messages.batch_create_params import Request
 
+from langbatch import json_codec
 from langbatch.Batch import Batch
+from langbatch.batch_storages import get_default_data_path
+from langbatch.clients import get_anthropic_client, get_async_anthropic_client
 from langbatch.ChatCompletionBatch import ChatCompletionBatch
 from langbatch.schemas import AnthropicChatCompletionRequest
 from langbatch.claude_utils import convert_request, convert_response
@@ -19,58 +25,118 @@ anthropic_state_map = {
     'expired': 'expired',
 }
 
+def _get_client_key(client: Anthropic | AsyncAnthropic):
+    return (type(client), str(client.base_url), client.api_key, client.auth_token)
+
 class AnthropicBatch(Batch):
     """
     AnthropicBatch is a class for Anthropic batch processing.
     Implements the Batch class for Anthropic API.
     """
+    _keep_validated_requests: bool = True # the requests are converted to the provider format when starting the batch
     _url: str = "https://api.anthropic.com/v1/messages/batches"
+    _provider: str = "anthropic"
+    _max_requests: int = 100000
+    _max_bytes: int = 256 * 1024 * 1024
 
-    def __init__(self, file: str, client: Optional[Anthropic] = None) -> None:
+    def __init__(
+            self, 
+            file: str, 
+            client: Optional[Anthropic] = None, 
+            cache_prompt_prefix: bool = False,
+            async_client: Optional[AsyncAnthropic] = None
+        ) -> None:
         """
         Initialize the AnthropicBatch class.
 
         Args:
             file (str): The path to the jsonl file in OpenAI batch format.
-            client (Anthropic): The Anthropic client.
+            client (Anthropic, optional): The Anthropic client. Defaults to the shared Anthropic client from the client registry,
+                configured from the environment variables like Anthropic().
+            cache_prompt_prefix (bool, optional): Add prompt caching breakpoints for the system prompt 
+                and the messages before the last message of each request. Defaults to False.
+            async_client (AsyncAnthropic, optional): The async Anthropic client used by the async methods (`astart`, `aget_status`, etc.). 
+                Defaults to the shared AsyncAnthropic client with the same configuration as `client`.
 
         Usage:
         ```python
         batch = AnthropicChatCompletionBatch(
             "path/to/file.jsonl"
         )
+
+        # With prompt caching for requests sharing a system prompt or few-shot examples
+        batch = AnthropicChatCompletionBatch(
+            "path/to/file.jsonl",
+            cache_prompt_prefix=True
+        )
         ```
         """
         super().__init__(file)
-        self._client = client or Anthropic()
+        self._client = client or get_anthropic_client()
+        self.cache_prompt_prefix = cache_prompt_prefix
+        self._async_client = async_client
+
+    def _get_async_client(self) -> AsyncAnthropic:
+        if self._async_client is None:
+            # shared client of the running event loop with the same configuration
+            return get_async_anthropic_client(
+                api_key=self._client.api_key,
+                auth_token=self._client.auth_token,
+                base_url=self._client.base_url,
+                timeout=self._client.timeout,
+                max_retries=self._client.max_retries
+            )
+        return self._async_client
     
     def _create_meta_data(self) -> Dict[str, Any]:
-        return {}
+        return {"cache_prompt_prefix": self.cache_prompt_prefix}
 
     def _upload_batch_file(self):
         pass
 
-    def _get_init_args(self):
-        return {}
+    @classmethod
+    def _get_init_args(cls, meta_data) -> Dict[str, Any]:
+        return {"cache_prompt_prefix": meta_data.get("cache_prompt_prefix", False)}
 
     def _prepare_data(self):
-        requests = self._get_requests()
+        requests = self._get_validated_requests()
         return [self._convert_request(request) for request in requests]
     
     def _create_batch(self):
-        data = self._prepare_data()
-        response = self._client.beta.messages.batches.create(
-            requests=data,
-        )
+        with self._record_timing("conversion"):
+            data = self._prepare_data()
+        with self._record_timing("upload"):
+            response = self._client.beta.messages.batches.create(
+                requests=data,
+            )
+        self.platform_batch_id = response.id
+
+    async def _acreate_batch(self):
+        # Converting the requests is CPU bound, so it is done in a thread
+        with self._record_timing("conversion"):
+            data = await asyncio.to_thread(self._prepare_data)
+        with self._record_timing("upload"):
+            response = await self._get_async_client().beta.messages.batches.create(
+                requests=data,
+            )
         self.platform_batch_id = response.id
 
     def start(self):
-        if self.platform_batch_id is not None:
+        if self.platform_batch_id is not None or self.realtime_results_file is not None:
             raise BatchStateError("Batch already started")
         
         self._create_batch()
+
+    async def astart(self):
+        if self.platform_batch_id is not None or self.realtime_results_file is not None:
+            raise BatchStateError("Batch already started")
+
+        await self._acreate_batch()
     
     def get_status(self):
+        if self.realtime_results_file is not None:
+            return "completed"
+
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
         
@@ -79,19 +145,198 @@ class AnthropicBatch(Batch):
         )
         return anthropic_state_map[response.processing_status]
 
+    async def aget_status(self) -> str:
+        if self.realtime_results_file is not None:
+            return "completed"
+
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        response = await self._get_async_client().beta.messages.batches.retrieve(
+            self.platform_batch_id
+        )
+        return anthropic_state_map[response.processing_status]
+
+    @staticmethod
+    def _map_listed_statuses(processing_statuses: Dict[str, str]) -> Dict[str, str]:
+        # statuses missing in the map are left out, and retrieved one by one
+        return {
+            batch_id: anthropic_state_map[status] 
+            for batch_id, status in processing_statuses.items() if status in anthropic_state_map
+        }
+
+    @classmethod
+    def _list_statuses(cls, batches: List[Batch]) -> Dict[str, str]:
+        processing_statuses = {}
+        for client, group in cls._group_by_client(batches, lambda batch: batch._client, _get_client_key):
+            wanted = {batch.platform_batch_id: batch.id for batch in group}
+            cutoff = cls._status_list_cutoff(group)
+
+            page = client.beta.messages.batches.list(limit=cls._status_list_page_size)
+            pages = 1
+            while True:
+                items = [(item.id, item.processing_status, item.created_at.timestamp()) for item in page.data]
+                done = cls._collect_listed_statuses(wanted, items, processing_statuses, cutoff)
+                if done or pages >= cls._max_status_list_pages or not page.has_next_page():
+                    break
+                page = page.get_next_page()
+                pages += 1
+        return cls._map_listed_statuses(processing_statuses)
+
+    @classmethod
+    async def _alist_statuses(cls, batches: List[Batch]) -> Dict[str, str]:
+        processing_statuses = {}
+        for client, group in cls._group_by_client(batches, lambda batch: batch._get_async_client(), _get_client_key):
+            wanted = {batch.platform_batch_id: batch.id for batch in group}
+            cutoff = cls._status_list_cutoff(group)
+
+            page = await client.beta.messages.batches.list(limit=cls._status_list_page_size)
+            pages = 1
+            while True:
+                items = [(item.id, item.processing_status, item.created_at.timestamp()) for item in page.data]
+                done = cls._collect_listed_statuses(wanted, items, processing_statuses, cutoff)
+                if done or pages >= cls._max_status_list_pages or not page.has_next_page():
+                    break
+                page = await page.get_next_page()
+                pages += 1
+        return cls._map_listed_statuses(processing_statuses)
+
     def _download_results_file(self):
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
         
         file_path = self._create_results_file_path()
-        with jsonlines.open(file_path, mode='w') as writer:
-            for result in self._client.beta.messages.batches.results(
-                self.platform_batch_id
-            ):
-                writer.write(self._convert_response(result.to_dict()))
+        results = self._client.beta.messages.batches.results(
+            self.platform_batch_id
+        )
+        json_codec.write_jsonl(
+            file_path, 
+            (self._convert_response(result.to_dict()) for result in results)
+        )
 
         return file_path
 
+    async def _adownload_results_file(self):
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        file_path = self._create_results_file_path()
+        results = await self._get_async_client().beta.messages.batches.results(
+            self.platform_batch_id
+        )
+        # Results are streamed, write them as they arrive instead of holding all of them in memory
+        with open(file_path, "wb") as file:
+            async for result in results:
+                file.write(json_codec.dumps_bytes(self._convert_response(result.to_dict())))
+                file.write(b"\n")
+
+        return file_path
+
+    def get_request_counts(self) -> Dict[str, int]:
+        """
+        Get the number of requests of the batch by state: "processing", "succeeded", "errored", "canceled" and "expired".
+        Useful to track the progress of a batch that is in progress.
+
+        Usage:
+        ```python
+        request_counts = batch.get_request_counts()
+        print(f"{request_counts['processing']} requests are still processing")
+        ```
+        """
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        response = self._client.beta.messages.batches.retrieve(
+            self.platform_batch_id
+        )
+        return response.request_counts.to_dict()
+
+    async def aget_request_counts(self) -> Dict[str, int]:
+        """
+        Async version of `get_request_counts`.
+        """
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        response = await self._get_async_client().beta.messages.batches.retrieve(
+            self.platform_batch_id
+        )
+        return response.request_counts.to_dict()
+
+    def _get_checkpoint_path(self) -> Path:
+        results_dir = get_default_data_path() / "results"
+        results_dir.mkdir(exist_ok=True, parents=True)
+
+        return results_dir / f"{self.id}.seen"
+
+    def _read_checkpoint(self) -> Set[str]:
+        checkpoint_path = self._get_checkpoint_path()
+        if not checkpoint_path.exists():
+            return set()
+
+        with open(checkpoint_path, "r") as reader:
+            return {line.rstrip("\n") for line in reader if line.strip()}
+
+    def _iter_partial_results(
+        self, process_func, chunk_size: int
+    ) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        response = self._client.beta.messages.batches.retrieve(
+            self.platform_batch_id
+        )
+        if response.results_url is None:
+            logging.info(
+                f"Results of batch {self.id} are not available yet, "
+                f"{response.request_counts.processing} requests are processing"
+            )
+            return
+
+        seen_custom_ids = self._read_checkpoint()
+        results = self._client.beta.messages.batches.results(
+            self.platform_batch_id
+        )
+        converted_results = (self._convert_response(result.to_dict()) for result in results)
+        new_results = (
+            result for result in itertools.chain(self._iter_cached_results(), converted_results)
+            if result["custom_id"] not in seen_custom_ids
+        )
+
+        # the requests are hashed once for the response cache, not for each chunk
+        request_hashes = None
+        if self._response_cache is not None:
+            try:
+                request_hashes = self._get_request_hashes()
+            except:
+                logging.warning(f"Error reading the requests of batch {self.id} for the response cache", exc_info=True)
+                request_hashes = {}
+        checkpoint_path = self._get_checkpoint_path()
+        while True:
+            chunk = list(itertools.islice(new_results, chunk_size))
+            if not chunk:
+                break
+
+            if self._response_cache is not None:
+                self._cache_responses(chunk, request_hashes)
+            yield self._split_results(chunk, process_func)
+
+            # custom_ids are checkpointed once the consumer asks for the next chunk,
+            # so a chunk is given again if the consumer fails while processing it
+            with open(checkpoint_path, "a") as writer:
+                writer.writelines(f"{result['custom_id']}\n" for result in chunk)
+            seen_custom_ids.update(result["custom_id"] for result in chunk)
+
+    async def _asend_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        anthropic_request = await asyncio.to_thread(self._convert_request, request)
+        message = await self._get_async_client().beta.messages.create(**anthropic_request["params"])
+
+        # Converted the same way as a succeeded result of a batch
+        return self._convert_response({
+            "custom_id": request["custom_id"],
+            "result": {"type": "succeeded", "message": message.to_dict()}
+        })
+
     def _get_errors(self):
         # Implement error retrieval logic for Anthropic API
         batch = self._client.beta.messages.batches.retrieve(self.platform_batch_id)
@@ -101,18 +346,29 @@ class AnthropicBatch(Batch):
             return None
     
     def is_retryable_failure(self) -> bool:
+        # statuses are mapped with anthropic_state_map, "errored" batches are reported as "failed"
         status = self.get_status()
-        if status == "errored" or status == "expired":
+        if status == "failed" or status == "expired":
             return True
         else:
             return False
 
+    async def ais_retryable_failure(self) -> bool:
+        status = await self.aget_status()
+        return status == "failed" or status == "expired"
+
     def retry(self):
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
         
         self._create_batch()
 
+    async def aretry(self):
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        await self._acreate_batch()
+
 class AnthropicChatCompletionBatch(AnthropicBatch, ChatCompletionBatch):
     """
     AnthropicChatCompletionBatch is a class for Anthropic chat completion batches.
@@ -123,9 +379,11 @@ class AnthropicChatCompletionBatch(AnthropicBatch, ChatCompletionBatch):
     batch.start()
     ```
     """
+    _request_schema = AnthropicChatCompletionRequest
+
     def _convert_request(self, req: dict) -> Request:
         custom_id = req["custom_id"]
-        request = convert_request(req)
+        request = convert_request(req, cache_prefix=self.cache_prompt_prefix)
 
         anthropic_request = Request(
             custom_id=custom_id,
@@ -136,5 +394,31 @@ class AnthropicChatCompletionBatch(AnthropicBatch, ChatCompletionBatch):
     def _convert_response(self, response) -> dict:
         return convert_response(response)
 
-    def _validate_request(self, request):
-        AnthropicChatCompletionRequest(**request)
+    def iter_partial_results(
+        self, chunk_size: int = 1000
+    ) -> Iterator[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """
+        Iterate over the results of the batch that were not given before, in chunks.
+        The results are streamed from the API and the custom_ids of the given results are checkpointed,
+        so calling it again, even after loading the batch in another process, only gives the new results.
+        Gives nothing while the results of the batch are not available yet.
+
+        Args:
+            chunk_size (int, optional): Maximum number of results in a chunk. Defaults to 1000.
+
+        Yields:
+            A tuple containing the successful and unsuccessful results of a chunk.
+
+        Usage:
+        ```python
+        while batch.get_status() not in ["completed", "failed", "cancelled", "expired"]:
+            print(batch.get_request_counts())
+            time.sleep(60)
+
+        for successful_results, unsuccessful_results in batch.iter_partial_results():
+            for result in successful_results:
+                print(result["choices"])
+        ```
+        """
+        process_func = lambda result: {"choices": result['response']['body']['choices']}
+        return self._iter_partial_results(process_func, chunk_size)
@@ -0,0 +1,215 @@
+"""
+Utilities to create batches from Arrow and Parquet data and to export their results to Parquet and Arrow files.
+pyarrow is an optional dependency, imported on first use.
+"""
+
+import uuid
+import string
+import itertools
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from langbatch import json_codec
+from langbatch.errors import BatchInitializationError
+
+_custom_id_placeholder = "__langbatch_custom_id__"
+INPUT_PLACEHOLDER = "__langbatch_input__" # replaced with the rendered template in the input of the requests
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        raise ImportError("pyarrow package is required for Arrow and Parquet data. Run: pip install langbatch[arrow]")
+    return pyarrow
+
+def parse_template(template: str) -> List[Tuple[str, str | None]]:
+    """
+    Parse a prompt template with `str.format` style column fields, ex. "Summarize the review: {review}".
+
+    Returns:
+        A list of (literal text, column name or None) pieces.
+    """
+    pieces = []
+    for literal, field, format_spec, conversion in string.Formatter().parse(template):
+        if field is not None and (field == "" or format_spec or conversion):
+            raise BatchInitializationError(f"Invalid template field {{{field}}}, fields should be column names without format specs")
+        pieces.append((literal, field))
+
+    if not any(field for _, field in pieces):
+        raise BatchInitializationError("Template should have at least one column field, ex. {text}")
+    return pieces
+
+def render_template(record_batch, pieces: List[Tuple[str, str | None]]):
+    """
+    Render the template over the rows of the record batch with Arrow compute kernels, without a Python loop over the rows.
+    Null values are rendered as empty strings.
+    """
+    pa = import_pyarrow()
+    arrays = []
+    for literal, field in pieces:
+        if literal:
+            arrays.append(pa.scalar(literal, pa.string()))
+        if field:
+            arrays.append(pa.compute.cast(record_batch.column(field), pa.string()))
+
+    return pa.compute.binary_join_element_wise(*arrays, "", null_handling="replace", null_replacement="")
+
+def parquet_dataset(path: Any):
+    """
+    Open a Parquet file, a directory of Parquet files or a list of Parquet files as a dataset, to read only the needed columns from.
+    """
+    import_pyarrow()
+    import pyarrow.dataset as ds
+    return ds.dataset(path, format="parquet")
+
+def iter_record_batches(data: Any, columns: List[str], batch_size: int) -> Iterator[Any]:
+    """
+    Iterate over the record batches of a Table, RecordBatch, RecordBatchReader, Dataset or an iterable of RecordBatches.
+    Only the given columns are read from datasets, ex. Parquet files.
+    """
+    pa = import_pyarrow()
+    import pyarrow.dataset as ds
+
+    if isinstance(data, ds.Dataset):
+        batches = data.to_batches(columns=columns, batch_size=batch_size)
+    elif isinstance(data, pa.Table):
+        batches = data.select(columns).to_batches(max_chunksize=batch_size)
+    elif isinstance(data, pa.RecordBatch):
+        batches = [data]
+    else:
+        # RecordBatchReader or an iterable of record batches
+        batches = data
+
+    for record_batch in batches:
+        if record_batch.num_rows > 0:
+            yield record_batch
+
+def request_line_parts(url: str, body: dict, input_key: str, input_template: Any) -> Tuple[bytes, bytes, bytes]:
+    """
+    Encode the request once with placeholders for the custom_id and the input, and split it around them.
+    A request line is then `prefix + custom_id + middle + input + suffix`, with only the custom_id and the input encoded per row.
+    """
+    request = {
+        "custom_id": _custom_id_placeholder,
+        "method": "POST",
+        "url": url,
+        "body": {**body, input_key: input_template}
+    }
+    line = json_codec.dumps_bytes(request)
+    prefix, _, rest = line.partition(json_codec.dumps_bytes(_custom_id_placeholder))
+    middle, _, suffix = rest.partition(json_codec.dumps_bytes(INPUT_PLACEHOLDER))
+    if not rest or not suffix:
+        raise BatchInitializationError("Failed to encode the request template")
+    return prefix, middle, suffix
+
+def iter_raw_requests(
+        data: Any,
+        url: str,
+        body: dict,
+        input_key: str,
+        input_template: Any,
+        template: str,
+        key_column: str | None = None,
+        batch_size: int = 65536
+    ) -> Iterator[bytes]:
+    """
+    Get the JSON encoded requests for the rows of the Arrow data, with the template rendered over the record batches.
+    The input of each request is `input_template` with the rendered template in place of the input placeholder.
+
+    The template and the columns are checked before returning, the rows are read as the requests are consumed.
+    """
+    pa = import_pyarrow()
+    pieces = parse_template(template)
+    columns = list(dict.fromkeys([field for _, field in pieces if field] + ([key_column] if key_column else [])))
+
+    schema = getattr(data, "schema", None)
+    if schema is not None:
+        missing_columns = [column for column in columns if column not in schema.names]
+        if missing_columns:
+            raise BatchInitializationError(f"Columns {missing_columns} not found in the data")
+
+    prefix, middle, suffix = request_line_parts(url, body, input_key, input_template)
+    dumps = json_codec.dumps_bytes
+
+    def raw_requests():
+        seen_custom_ids = set()
+        for record_batch in iter_record_batches(data, columns, batch_size):
+            inputs = render_template(record_batch, pieces).to_pylist()
+            if key_column:
+                keys = record_batch.column(key_column)
+                if keys.null_count:
+                    raise BatchInitializationError(f"Key column {key_column} has null values")
+                custom_ids = pa.compute.cast(keys, pa.string()).to_pylist()
+                # the keys are the custom_ids of the requests, they should be unique across the record batches
+                seen_count = len(seen_custom_ids)
+                seen_custom_ids.update(custom_ids)
+                if len(seen_custom_ids) - seen_count < len(custom_ids):
+                    raise BatchInitializationError(f"Key column {key_column} has duplicate values")
+            else:
+                custom_ids = [str(uuid.uuid4()) for _ in range(len(inputs))]
+
+            for custom_id, input in zip(custom_ids, inputs):
+                yield prefix + dumps(custom_id) + middle + dumps(input) + suffix
+
+    return raw_requests()
+
+def results_schema(embedding_dimensions: int | None = None):
+    """
+    Schema of the exported results. Chat completion results have the content and finish reason of the first choice, 
+    embedding results have the embedding of the first input as a fixed size list of float32 of `embedding_dimensions` values.
+    """
+    pa = import_pyarrow()
+    fields = [
+        ("custom_id", pa.string()),
+        ("status_code", pa.int32()),
+    ]
+    if embedding_dimensions is None:
+        fields += [
+            ("content", pa.string()),
+            ("finish_reason", pa.string()),
+            ("prompt_tokens", pa.int64()),
+            ("completion_tokens", pa.int64()),
+        ]
+    else:
+        fields += [
+            ("embedding", pa.list_(pa.float32(), embedding_dimensions)),
+            ("prompt_tokens", pa.int64()),
+        ]
+    fields += [
+        ("total_tokens", pa.int64()),
+        ("error_code", pa.string()),
+        ("error_message", pa.string()),
+    ]
+    return pa.schema(fields)
+
+def write_rows(path: str | Path, rows: Iterable[Dict[str, Any]], schema: Any, format: str = "parquet", batch_size: int = 10000) -> int:
+    """
+    Write the rows to a Parquet or Arrow IPC file as record batches of `batch_size` rows, without holding all the rows in memory.
+
+    Args:
+        path (str | Path): The path to the file.
+        rows (Iterable[Dict[str, Any]]): The rows, with the columns of the schema as keys.
+        schema (pyarrow.Schema): The schema of the file.
+        format (str, optional): "parquet" or "arrow". Defaults to "parquet".
+        batch_size (int, optional): Number of rows per record batch. Defaults to 10000.
+
+    Returns:
+        int: The number of rows written.
+    """
+    pa = import_pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, schema)
+    elif format == "arrow":
+        writer = pa.ipc.new_file(path, schema)
+    else:
+        raise ValueError(f"Invalid format: {format}. Supported formats: parquet, arrow")
+
+    count = 0
+    rows = iter(rows)
+    with writer:
+        while chunk := list(itertools.islice(rows, batch_size)):
+            writer.write_batch(pa.RecordBatch.from_pylist(chunk, schema=schema))
+            count += len(chunk)
+    return count
@@ -7,7 +7,23 @@ import pickle
 from langbatch.utils import get_data_path
 from langbatch.errors import BatchStorageError
 
-DATA_PATH = get_data_path()
+_data_path: Path | None = None
+
+def get_default_data_path() -> Path:
+    """
+    Get the default data path, from the LANGBATCH_DATA_PATH environment variable or the 'langbatch_data' directory.
+    Resolved on first use instead of at import, since resolving it checks that the directory is writable.
+    """
+    global _data_path
+    if _data_path is None:
+        _data_path = get_data_path()
+    return _data_path
+
+def __getattr__(name: str):
+    # DATA_PATH is kept as a lazily resolved module attribute for backwards compatibility
+    if name == "DATA_PATH":
+        return get_default_data_path()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def _is_json_serializable(obj: Any) -> bool:
     try:
@@ -91,15 +107,30 @@ class FileBatchStorage(BatchStorage):
     ```
     """
 
-    def __init__(self, directory: str = DATA_PATH):
+    def __init__(self, directory: str | None = None):
         """
         Initialize the FileBatchStorage. Will create or use a directory named 'saved_batches' in the given directory to save the batches.
 
         Args:
-            directory (str): The directory to save the batches. Defaults to the DATA_PATH.
+            directory (str, optional): The directory to save the batches. Defaults to the default data path,
+                resolved when the storage is first used.
         """
-        self.saved_batches_directory = Path(directory) / "saved_batches"
-        self.saved_batches_directory.mkdir(exist_ok=True, parents=True)
+        self._saved_batches_directory: Path | None = None
+        if directory is not None:
+            self._saved_batches_directory = self._create_directory(directory)
+
+    @staticmethod
+    def _create_directory(directory: str | Path) -> Path:
+        saved_batches_directory = Path(directory) / "saved_batches"
+        saved_batches_directory.mkdir(exist_ok=True, parents=True)
+        return saved_batches_directory
+
+    @property
+    def saved_batches_directory(self) -> Path:
+        # the default storages of Batch.save and Batch.load are created at import, without touching the disk
+        if self._saved_batches_directory is None:
+            self._saved_batches_directory = self._create_directory(get_default_data_path())
+        return self._saved_batches_directory
 
     def save(self, id: str, data_file: Path, meta_data: Dict[str, Any]):
         # Check if metadata can be JSON serialized
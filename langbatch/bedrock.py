@@ -1,10 +1,11 @@
-from typing import Any, Dict
+from typing import Any, Dict, List
+from datetime import datetime, timezone
 from pathlib import Path
-import jsonlines
-import boto3
 import botocore
 
+from langbatch import json_codec
 from langbatch.Batch import Batch
+from langbatch.clients import get_bedrock_client, get_s3_client, _hash_secret
 from langbatch.ChatCompletionBatch import ChatCompletionBatch
 from langbatch.schemas import AnthropicChatCompletionRequest, OpenAIChatCompletionRequest
 from langbatch.nova_utils import convert_response_nova, convert_request_nova
@@ -24,12 +25,19 @@ bedrock_state_map = {
     'Expired': 'expired',
 }
 
+def _get_client_key(client):
+    # clients of the same region and credentials list the same jobs
+    credentials = client._get_credentials()
+    return (client.meta.region_name, _hash_secret(credentials.access_key if credentials is not None else None))
+
 class BedrockBatch(Batch):
     """
     BedrockBatch is a class for Bedrock batch processing.
     Implements the Batch class for Bedrock API.
     """
+    _keep_validated_requests: bool = True # the requests are converted to the provider format when starting the batch
     _url: str = ""
+    _provider: str = "bedrock"
 
     def __init__(self, file: str, model: str, input_bucket: str, output_bucket: str, region: str, service_role: str) -> None:
         """
@@ -50,8 +58,8 @@ class BedrockBatch(Batch):
         ```
         """
         super().__init__(file)
-        self._client = boto3.client(service_name='bedrock', region_name=region)
-        self._s3_client = boto3.resource('s3')
+        self._client = get_bedrock_client(region)
+        self._s3_client = get_s3_client()
 
         self.model = model
         self.input_bucket = input_bucket
@@ -82,20 +90,22 @@ class BedrockBatch(Batch):
         return meta_data
 
     def _prepare_data(self):
-        requests = self._get_requests()
+        requests = self._get_validated_requests()
         return [self._convert_request(request) for request in requests]
     
     def _upload_batch_file(self):
-        data = self._prepare_data()
+        with self._record_timing("conversion"):
+            data = self._prepare_data()
 
-        file_path = Path(f"{self.id}_prepared_data.jsonl")
-        with jsonlines.open(file_path, mode='w') as writer:
-            writer.write_all(data)
+            file_path = Path(f"{self.id}_prepared_data.jsonl")
+            json_codec.write_jsonl(file_path, data)
 
-        self._s3_client.Bucket(self.input_bucket).upload_file(
-            str(file_path),
-            f'{self.id}/input.jsonl'
-        )
+        with self._record_timing("upload"):
+            self._s3_client.upload_file(
+                str(file_path),
+                self.input_bucket,
+                f'{self.id}/input.jsonl'
+            )
 
         file_path.unlink(missing_ok=True)
     
@@ -111,12 +121,15 @@ class BedrockBatch(Batch):
         self.platform_batch_id = job['jobArn']
 
     def start(self):
-        if self.platform_batch_id is not None:
+        if self.platform_batch_id is not None or self.realtime_results_file is not None:
             raise BatchStateError("Batch already started")
         
         self._create_batch()
     
     def get_status(self):
+        if self.realtime_results_file is not None:
+            return "completed"
+
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
         
@@ -125,6 +138,30 @@ class BedrockBatch(Batch):
         )
         return bedrock_state_map[job['status']]
 
+    @classmethod
+    def _list_statuses(cls, batches: List[Batch]) -> Dict[str, str]:
+        statuses = {}
+        for client, group in cls._group_by_client(batches, lambda batch: batch._client, _get_client_key):
+            wanted = {batch.platform_batch_id: batch.id for batch in group}
+            cutoff = cls._status_list_cutoff(group)
+
+            kwargs = {"maxResults": cls._status_list_page_size, "sortBy": "CreationTime", "sortOrder": "Descending"}
+            if cutoff is not None:
+                # only the jobs submitted after the cutoff are listed
+                kwargs["submitTimeAfter"] = datetime.fromtimestamp(cutoff, tz=timezone.utc)
+
+            for _ in range(cls._max_status_list_pages):
+                response = client.list_model_invocation_jobs(**kwargs)
+                items = [
+                    (job["jobArn"], bedrock_state_map[job["status"]], job["submitTime"].timestamp())
+                    for job in response.get("invocationJobSummaries", []) if job["status"] in bedrock_state_map
+                ]
+                done = cls._collect_listed_statuses(wanted, items, statuses, cutoff)
+                if done or not response.get("nextToken"):
+                    break
+                kwargs["nextToken"] = response["nextToken"]
+        return statuses
+
     def _download_results_file(self):
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
@@ -133,23 +170,19 @@ class BedrockBatch(Batch):
         s3_path = f"{self.id}/{job_id}/input.jsonl.out"
 
         try:
-            self._s3_client.Bucket(self.output_bucket).download_file(s3_path, f"{job_id}_results.jsonl")
+            self._s3_client.download_file(self.output_bucket, s3_path, f"{job_id}_results.jsonl")
         except botocore.exceptions.ClientError as e:
             if e.response['Error']['Code'] == "404":
                 return None
             raise BatchResultsError("Failed to download results file from S3")
         
-        data = []
-        file_path = Path(f"{job_id}_results.jsonl")
-        with jsonlines.open(file_path, mode='r') as reader:
-            for line in reader:
-                data.append(line)
-        file_path.unlink(missing_ok=True)
-
+        downloaded_file_path = Path(f"{job_id}_results.jsonl")
         file_path = self._create_results_file_path()
-        with jsonlines.open(file_path, mode='w') as writer:
-            for result in data:
-                writer.write(self._convert_response(result))
+        json_codec.write_jsonl(
+            file_path, 
+            (self._convert_response(result) for result in json_codec.read_jsonl(downloaded_file_path))
+        )
+        downloaded_file_path.unlink(missing_ok=True)
 
         return file_path
 
@@ -188,6 +221,8 @@ class BedrockNovaChatCompletionBatch(BedrockBatch, ChatCompletionBatch):
     batch.start()
     ```
     """
+    _request_schema = AnthropicChatCompletionRequest
+
     def _convert_request(self, req: dict):
         custom_id = req["custom_id"]
         request = convert_request_nova(req)
@@ -197,9 +232,6 @@ class BedrockNovaChatCompletionBatch(BedrockBatch, ChatCompletionBatch):
     def _convert_response(self, response) -> dict:
         return convert_response_nova(response, self.model)
 
-    def _validate_request(self, request):
-        AnthropicChatCompletionRequest(**request)
-
 class BedrockClaudeChatCompletionBatch(BedrockBatch, ChatCompletionBatch):
     """
     BedrockClaudeChatCompletionBatch is a class for Bedrock chat completion batches with Claude models.
@@ -217,6 +249,8 @@ class BedrockClaudeChatCompletionBatch(BedrockBatch, ChatCompletionBatch):
     batch.start()
     ```
     """
+    _request_schema = AnthropicChatCompletionRequest
+
     def _convert_request(self, req: dict):
         custom_id = req["custom_id"]
         request = convert_request(req)
@@ -236,6 +270,3 @@ class BedrockClaudeChatCompletionBatch(BedrockBatch, ChatCompletionBatch):
             "error": error
         }
         return output
-
-    def _validate_request(self, request):
-        AnthropicChatCompletionRequest(**request)
@@ -1,8 +1,9 @@
 from typing import Any, Dict, List, Optional
 from langbatch.utils import get_web_image
-from langbatch.schemas import AnthropicChatCompletionRequest
+from langbatch.schemas import AnthropicChatCompletionRequest, validate_request_body
 import time
 import json
+from langbatch import json_codec
 
 def convert_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     converted_messages = []
@@ -27,7 +28,7 @@ def convert_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                     "type": "tool_use",
                     "id": tool_call["id"],
                     "name": tool_call["function"]["name"],
-                    "input": json.loads(tool_call["function"]["arguments"])
+                    "input": json_codec.loads(tool_call["function"]["arguments"])
                 }
                 converted_tool_calls.append(converted_tool_call)
                 tool_call_ids.append(tool_call["id"])
@@ -125,8 +126,24 @@ def convert_tool_choice(tools_given: bool, tool_choice: Optional[Dict[str, Any]]
     
     return tool_choice_obj
 
-def convert_request(req: dict):
-    request = AnthropicChatCompletionRequest(**req["body"])
+def add_cache_control(system: Optional[str], messages: List[Dict[str, Any]]):
+    """
+    Add prompt caching breakpoints for the prefix shared by the requests:
+    the system prompt and the messages before the last message.
+    """
+    cache_control = {"type": "ephemeral"}
+    if system:
+        system = [{"type": "text", "text": system, "cache_control": cache_control}]
+
+    if len(messages) > 1:
+        content = messages[-2]["content"]
+        if len(content) > 0:
+            content[-1] = {**content[-1], "cache_control": cache_control}
+
+    return system, messages
+
+def convert_request(req: dict, cache_prefix: bool = False):
+    request = validate_request_body(AnthropicChatCompletionRequest, req["body"])
 
     messages = []
     system = None
@@ -143,6 +160,8 @@ def convert_request(req: dict):
             messages.append(message)
 
     messages = convert_messages(messages)
+    if cache_prefix:
+        system, messages = add_cache_control(system, messages)
 
     req = {
         "model": request.model,
@@ -185,7 +204,7 @@ def convert_response_message(message):
                     'id': item['id'],
                     'function': {
                         'name': item['name'],
-                        'arguments': json.dumps(item['input'])
+                        'arguments': json.dumps(item['input']) # stdlib separators, the arguments are part of the returned results
                     }
                 })
             else:
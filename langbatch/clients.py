@@ -0,0 +1,285 @@
+"""
+Process-wide registry of the provider clients, shared by the batches of the same provider, region and credentials.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable
+
+import httpx
+from openai import OpenAI, AzureOpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from openai import DEFAULT_TIMEOUT, DEFAULT_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+def _hash_secret(value: Any) -> str | None:
+    # credentials are part of the client keys, only their hashes are kept
+    if value is None:
+        return None
+    return hashlib.sha256(str(value).encode()).hexdigest()
+
+class ClientRegistry:
+    """
+    ClientRegistry keeps one client per provider, region and credentials for the process,
+    so the batches reuse the clients, their resolved credentials and their pooled keep-alive connections,
+    instead of creating new clients for every batch, ex. every time BatchHandler loads the batches.
+
+    Async clients are kept per event loop, as their connections are bound to the event loop they were opened on.
+
+    The batches and the factory functions get their default clients from the registry returned by `get_client_registry`.
+
+    Usage:
+    ```python
+    from langbatch.clients import get_client_registry, get_openai_client
+
+    # Batches created without a client share the client of the registry
+    batch = OpenAIChatCompletionBatch("path/to/file.jsonl")
+    assert batch._client is get_openai_client()
+
+    # Limit the connections of the clients created from now on
+    registry = get_client_registry()
+    registry.limits = httpx.Limits(max_connections=50, max_keepalive_connections=20)
+    registry.max_pool_connections = 20
+
+    # Drop the clients, ex. after rotating the credentials
+    registry.clear()
+    ```
+    """
+
+    def __init__(self, limits: httpx.Limits | None = None, max_pool_connections: int = 50):
+        """
+        Initialize the ClientRegistry.
+
+        Args:
+            limits (httpx.Limits, optional): Connection pool limits of the OpenAI and Anthropic clients. Defaults to the limits of the SDKs.
+            max_pool_connections (int, optional): Connection pool size of the boto3 clients. Defaults to 50.
+        """
+        self.limits = limits
+        self.max_pool_connections = max_pool_connections
+        self._clients: Dict[Hashable, Any] = {}
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Get the client with the key, created with the factory function if it is not in the registry.
+        """
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        # the client is created outside the lock, as creating it can be slow, ex. resolving the boto3 credentials
+        client = factory()
+        with self._lock:
+            existing_client = self._clients.get(key)
+            if existing_client is None:
+                self._clients[key] = client
+                logger.debug(f"Created {key[0]} client")
+                return client
+
+        # another thread created the client first
+        close = getattr(client, "close", None)
+        if callable(close):
+            close()
+        return existing_client
+
+    def get_async(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Get the async client with the key for the running event loop, created with the factory function if it is not in the registry.
+
+        Raises:
+            RuntimeError: If there is no running event loop, as the client would not be closed.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            raise RuntimeError("Async clients can only be created in a running event loop")
+
+        with self._lock:
+            client = self._loop_clients.setdefault(loop, {}).get(key)
+        if client is not None:
+            return client
+
+        # the event loop runs in a single thread, so no other client is created for it meanwhile
+        client = factory()
+        with self._lock:
+            self._loop_clients.setdefault(loop, {})[key] = client
+        logger.debug(f"Created async {key[0]} client")
+        return client
+
+    def clear(self):
+        """
+        Remove all the clients from the registry. Batches keep the clients they already have.
+        """
+        with self._lock:
+            self._clients.clear()
+            self._loop_clients.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._clients) + sum(len(clients) for clients in self._loop_clients.values())
+
+_registry = ClientRegistry()
+
+def get_client_registry() -> ClientRegistry:
+    """
+    Get the process-wide client registry.
+    """
+    return _registry
+
+def _http_client_kwargs(http_client_class: type) -> Dict[str, Any]:
+    if _registry.limits is None:
+        return {}
+    return {"http_client": http_client_class(limits=_registry.limits)}
+
+def _client_options(timeout, max_retries, default_timeout, default_max_retries) -> Dict[str, Any]:
+    # the defaults are left out, so the clients configured from another client share the same key
+    options = {}
+    if timeout is not None and timeout != default_timeout:
+        options["timeout"] = timeout
+    if max_retries is not None and max_retries != default_max_retries:
+        options["max_retries"] = max_retries
+    return options
+
+def _base_url(base_url, env_var: str, default: str) -> str:
+    return str(base_url or os.environ.get(env_var) or default).rstrip("/")
+
+def _openai_args(api_key, base_url, organization, project) -> Dict[str, Any]:
+    # resolved from the same environment variables as the OpenAI client
+    return {
+        "api_key": api_key or os.environ.get("OPENAI_API_KEY"),
+        "base_url": _base_url(base_url, "OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        "organization": organization or os.environ.get("OPENAI_ORG_ID"),
+        "project": project or os.environ.get("OPENAI_PROJECT_ID"),
+    }
+
+def get_openai_client(
+        api_key: str | None = None,
+        base_url: str | None = None,
+        organization: str | None = None,
+        project: str | None = None,
+        timeout: Any = None,
+        max_retries: int | None = None
+    ) -> OpenAI:
+    """
+    Get the shared OpenAI client for the credentials. Arguments not given are read from the environment variables, like `OpenAI()`.
+    """
+    args = _openai_args(api_key, base_url, organization, project)
+    options = _client_options(timeout, max_retries, DEFAULT_TIMEOUT, DEFAULT_MAX_RETRIES)
+    key = ("openai", args["base_url"], args["organization"], args["project"], _hash_secret(args["api_key"]), repr(sorted(options.items())))
+    return _registry.get(key, lambda: OpenAI(**args, **options, **_http_client_kwargs(DefaultHttpxClient)))
+
+def get_async_openai_client(
+        api_key: str | None = None,
+        base_url: str | None = None,
+        organization: str | None = None,
+        project: str | None = None,
+        timeout: Any = None,
+        max_retries: int | None = None
+    ) -> AsyncOpenAI:
+    """
+    Get the shared AsyncOpenAI client for the credentials and the running event loop.
+    """
+    args = _openai_args(api_key, base_url, organization, project)
+    options = _client_options(timeout, max_retries, DEFAULT_TIMEOUT, DEFAULT_MAX_RETRIES)
+    key = ("openai", args["base_url"], args["organization"], args["project"], _hash_secret(args["api_key"]), repr(sorted(options.items())))
+    return _registry.get_async(key, lambda: AsyncOpenAI(**args, **options, **_http_client_kwargs(DefaultAsyncHttpxClient)))
+
+def get_azure_openai_client(
+        azure_endpoint: str,
+        api_version: str,
+        api_key: str | None = None,
+        azure_ad_token_provider: Callable[[], str] | None = None
+    ) -> AzureOpenAI:
+    """
+    Get the shared AzureOpenAI client for the endpoint and credentials.
+    """
+    # the token provider itself is part of the key, the key keeps it alive so it can not be mistaken for another provider
+    key = ("azure_openai", azure_endpoint, api_version, _hash_secret(api_key), azure_ad_token_provider)
+    return _registry.get(key, lambda: AzureOpenAI(
+        azure_endpoint=azure_endpoint,
+        api_version=api_version,
+        api_key=api_key,
+        azure_ad_token_provider=azure_ad_token_provider,
+        **_http_client_kwargs(DefaultHttpxClient)
+    ))
+
+def _anthropic_args(api_key, auth_token, base_url) -> Dict[str, Any]:
+    return {
+        "api_key": api_key or os.environ.get("ANTHROPIC_API_KEY"),
+        "auth_token": auth_token or os.environ.get("ANTHROPIC_AUTH_TOKEN"),
+        "base_url": _base_url(base_url, "ANTHROPIC_BASE_URL", "https://api.anthropic.com"),
+    }
+
+def get_anthropic_client(
+        api_key: str | None = None,
+        auth_token: str | None = None,
+        base_url: str | None = None,
+        timeout: Any = None,
+        max_retries: int | None = None
+    ):
+    """
+    Get the shared Anthropic client for the credentials. Arguments not given are read from the environment variables, like `Anthropic()`.
+    """
+    import anthropic
+    from anthropic import Anthropic, DefaultHttpxClient as AnthropicHttpxClient
+
+    args = _anthropic_args(api_key, auth_token, base_url)
+    options = _client_options(timeout, max_retries, anthropic.DEFAULT_TIMEOUT, anthropic.DEFAULT_MAX_RETRIES)
+    key = ("anthropic", args["base_url"], _hash_secret(args["api_key"]), _hash_secret(args["auth_token"]), repr(sorted(options.items())))
+    return _registry.get(key, lambda: Anthropic(**args, **options, **_http_client_kwargs(AnthropicHttpxClient)))
+
+def get_async_anthropic_client(
+        api_key: str | None = None,
+        auth_token: str | None = None,
+        base_url: str | None = None,
+        timeout: Any = None,
+        max_retries: int | None = None
+    ):
+    """
+    Get the shared AsyncAnthropic client for the credentials and the running event loop.
+    """
+    import anthropic
+    from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient as AnthropicAsyncHttpxClient
+
+    args = _anthropic_args(api_key, auth_token, base_url)
+    options = _client_options(timeout, max_retries, anthropic.DEFAULT_TIMEOUT, anthropic.DEFAULT_MAX_RETRIES)
+    key = ("anthropic", args["base_url"], _hash_secret(args["api_key"]), _hash_secret(args["auth_token"]), repr(sorted(options.items())))
+    return _registry.get_async(key, lambda: AsyncAnthropic(**args, **options, **_http_client_kwargs(AnthropicAsyncHttpxClient)))
+
+def _aws_credentials_key():
+    # credentials resolved by boto3 from the environment or the profile
+    return (
+        os.environ.get("AWS_PROFILE"),
+        _hash_secret(os.environ.get("AWS_ACCESS_KEY_ID")),
+        _hash_secret(os.environ.get("AWS_SESSION_TOKEN"))
+    )
+
+def _boto3_session():
+    # a session per client, the default session of boto3 keeps the credentials it resolved first
+    import boto3
+    return boto3.session.Session()
+
+def _boto3_config():
+    from botocore.config import Config
+    return Config(max_pool_connections=_registry.max_pool_connections, tcp_keepalive=True)
+
+def get_bedrock_client(region: str | None = None):
+    """
+    Get the shared boto3 Bedrock client for the region and the AWS credentials.
+    """
+    key = ("bedrock", region, _aws_credentials_key())
+    return _registry.get(key, lambda: _boto3_session().client(service_name="bedrock", region_name=region, config=_boto3_config()))
+
+def get_s3_client(region: str | None = None):
+    """
+    Get the shared boto3 S3 client for the region and the AWS credentials.
+    A client is shared rather than a resource, since boto3 clients are thread safe and resources are not.
+    """
+    key = ("s3", region, _aws_credentials_key())
+    return _registry.get(key, lambda: _boto3_session().client("s3", region_name=region, config=_boto3_config()))
@@ -1,8 +1,12 @@
 import os
-from openai import OpenAI, AzureOpenAI
+import importlib.util
+from typing import Any, Dict, Tuple, Type
 
 from langbatch.errors import SetupError
-from langbatch.openai import OpenAIChatCompletionBatch, OpenAIEmbeddingBatch
+from langbatch.ChatCompletionBatch import ChatCompletionBatch
+from langbatch.ShardedBatch import ShardedBatch
+
+# The provider modules and their SDKs are imported only when a batch of the provider is created
 
 def get_args(required_args: dict, kwargs: dict):
     extracted_args = {}
@@ -19,10 +23,27 @@ def get_args(required_args: dict, kwargs: dict):
 
     return extracted_args, missed_args
 
-def chat_completion_batch(file: str, provider: str, model: str = None, **kwargs):
+def chat_completion_batch(file: str, provider: str, model: str = None, shard: bool = False, **kwargs):
+    batch_type, batch_kwargs = chat_completion_batch_type(provider, model, **kwargs)
+    # With shard=True, the file is split within the provider limits and run as a ShardedBatch
+    if shard:
+        return ShardedBatch(file, batch_type, batch_kwargs)
+    return batch_type(file, **batch_kwargs)
+
+def chat_completion_batch_type(provider: str, model: str = None, **kwargs) -> Tuple[Type[ChatCompletionBatch], Dict[str, Any]]:
+    """
+    Get the chat completion batch class and its init arguments (clients, model, etc.) for the provider.
+    Used to create batches of the provider from requests, ex. by RoutingBatchDispatcher.
+
+    Usage:
+    ```python
+    batch_type, batch_kwargs = chat_completion_batch_type("anthropic")
+    batch = batch_type.create(data, request_kwargs, batch_kwargs)
+    ```
+    """
     if provider == "anthropic":
         try:
-            from anthropic import Anthropic
+            from langbatch.clients import get_anthropic_client
             from langbatch.anthropic import AnthropicChatCompletionBatch
         except ImportError:
             raise SetupError("Anthropic dependencies not installed. Install with 'pip install langbatch[Anthropic]'")
@@ -30,23 +51,30 @@ def chat_completion_batch(file: str, provider: str, model: str = None, **kwargs)
         if len(kwargs) == 0 or "client" not in kwargs:
             api_key = os.getenv("ANTHROPIC_API_KEY")
             if api_key:
-                anthropic_client = Anthropic(api_key=api_key)
-                return AnthropicChatCompletionBatch(file, anthropic_client)
+                anthropic_client = get_anthropic_client(api_key=api_key)
+                cache_prompt_prefix = kwargs.get("cache_prompt_prefix", False)
+                return AnthropicChatCompletionBatch, {"client": anthropic_client, "cache_prompt_prefix": cache_prompt_prefix}
             else:
                 raise SetupError("Anthropic API key not found")
         else:
-            return AnthropicChatCompletionBatch(file, **kwargs)
+            return AnthropicChatCompletionBatch, kwargs
     elif provider == "openai":
+        from langbatch.clients import get_openai_client
+        from langbatch.openai import OpenAIChatCompletionBatch
+
         if len(kwargs) == 0 or "client" not in kwargs:
             api_key = os.getenv("OPENAI_API_KEY")
             if api_key:
-                openai_client = OpenAI(api_key=api_key)
-                return OpenAIChatCompletionBatch(file, openai_client)
+                openai_client = get_openai_client(api_key=api_key)
+                return OpenAIChatCompletionBatch, {"client": openai_client}
             else:
                 raise SetupError("OpenAI API key not found")
         else:
-            return OpenAIChatCompletionBatch(file, **kwargs)
+            return OpenAIChatCompletionBatch, kwargs
     elif provider == "azure":
+        from langbatch.clients import get_azure_openai_client
+        from langbatch.openai import OpenAIChatCompletionBatch
+
         required_args = {
             "AZURE_API_BASE":"azure_endpoint",
             "AZURE_API_KEY":"api_key",
@@ -64,10 +92,12 @@ def chat_completion_batch(file: str, provider: str, model: str = None, **kwargs)
         if len(missed_args) > 0:
             raise SetupError(f"Azure OpenAI requires the following: {missed_args}")
         else:
-            azure_client = AzureOpenAI(**extracted_args)
-            return OpenAIChatCompletionBatch(file, azure_client)
+            azure_client = get_azure_openai_client(**extracted_args)
+            return OpenAIChatCompletionBatch, {"client": azure_client}
     elif provider == "vertex_ai":
         try:
+            if importlib.util.find_spec("vertexai") is None:
+                raise ImportError("vertexai")
             from langbatch.vertexai import (
                 VertexAIChatCompletionBatch,
                 VertexAIClaudeChatCompletionBatch,
@@ -87,11 +117,11 @@ def chat_completion_batch(file: str, provider: str, model: str = None, **kwargs)
         else:
             if model:
                 if model.startswith("gemini"):
-                    return VertexAIChatCompletionBatch(file, model, **extracted_args)
+                    return VertexAIChatCompletionBatch, {"model": model, **extracted_args}
                 elif model.startswith("claude"):
-                    return VertexAIClaudeChatCompletionBatch(file, model, **extracted_args)
+                    return VertexAIClaudeChatCompletionBatch, {"model": model, **extracted_args}
                 elif model.startswith("llama"):
-                    return VertexAILlamaChatCompletionBatch(file, model, **extracted_args)
+                    return VertexAILlamaChatCompletionBatch, {"model": model, **extracted_args}
                 else:
                     raise SetupError(f"Invalid model for VertexAI: {model}")
             else:
@@ -117,9 +147,9 @@ def chat_completion_batch(file: str, provider: str, model: str = None, **kwargs)
         else:
             if model:
                 if model.startswith("us.anthropic.claude"):
-                    return BedrockClaudeChatCompletionBatch(file, model, **extracted_args)
+                    return BedrockClaudeChatCompletionBatch, {"model": model, **extracted_args}
                 elif model.startswith("us.amazon.nova"):
-                    return BedrockNovaChatCompletionBatch(file, model, **extracted_args)
+                    return BedrockNovaChatCompletionBatch, {"model": model, **extracted_args}
                 else:
                     raise SetupError(f"Invalid model for Bedrock: {model}")
             else:
@@ -127,16 +157,23 @@ def chat_completion_batch(file: str, provider: str, model: str = None, **kwargs)
     else:
         raise SetupError(f"Invalid provider: {provider}")
     
-def embedding_batch(file: str, provider: str, model: str = None, **kwargs):
+def embedding_batch(file: str, provider: str, model: str = None, shard: bool = False, **kwargs):
     if provider == "openai":
+        from langbatch.clients import get_openai_client
+        from langbatch.openai import OpenAIEmbeddingBatch
+
         if len(kwargs) == 0 or "client" not in kwargs:
             api_key = os.getenv("OPENAI_API_KEY")
             if api_key:
-                openai_client = OpenAI(api_key=api_key)
-                return OpenAIEmbeddingBatch(file, openai_client)
+                openai_client = get_openai_client(api_key=api_key)
+                batch_kwargs = {"client": openai_client}
             else:
                 raise SetupError("OpenAI API key not found")
         else:
-            return OpenAIEmbeddingBatch(file, **kwargs)
+            batch_kwargs = kwargs
+
+        if shard:
+            return ShardedBatch(file, OpenAIEmbeddingBatch, batch_kwargs)
+        return OpenAIEmbeddingBatch(file, **batch_kwargs)
     else:
         raise SetupError(f"Invalid provider: {provider}")
\ No newline at end of file
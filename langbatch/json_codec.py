@@ -0,0 +1,235 @@
+"""
+JSON codec used for all the batch file, results file and request payload I/O in langbatch.
+
+Uses orjson or msgspec when installed and falls back to the standard library json module.
+The backend can be forced with the LANGBATCH_JSON_BACKEND environment variable or with `set_backend`.
+"""
+
+import os
+import json
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+class JSONBackend(ABC):
+    """
+    Abstract class for JSON backends.
+    Implementations should provide a way to encode objects to bytes and decode bytes or str to objects.
+
+    Usage:
+    ```python
+    class MyJSONBackend(JSONBackend):
+        name = "my_json"
+
+        def dumps(self, obj: Any) -> bytes:
+            # Custom encode logic
+
+        def loads(self, data: bytes | str) -> Any:
+            # Custom decode logic
+
+    set_backend(MyJSONBackend())
+    ```
+    """
+    name: str = ""
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        """
+        Encode the object to compact JSON bytes.
+        """
+        pass
+
+    @abstractmethod
+    def loads(self, data: bytes | str) -> Any:
+        """
+        Decode JSON bytes or str to an object.
+        """
+        pass
+
+class StdlibJSONBackend(JSONBackend):
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: bytes | str) -> Any:
+        return json.loads(data)
+
+class OrjsonBackend(JSONBackend):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._orjson.dumps(obj)
+        except TypeError:
+            # orjson is stricter than json for some inputs (ex. non str dict keys, big integers)
+            return _stdlib_backend.dumps(obj)
+
+    def loads(self, data: bytes | str) -> Any:
+        return self._orjson.loads(data)
+
+class MsgspecBackend(JSONBackend):
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._encoder.encode(obj)
+        except TypeError:
+            return _stdlib_backend.dumps(obj)
+
+    def loads(self, data: bytes | str) -> Any:
+        return self._decoder.decode(data)
+
+_stdlib_backend = StdlibJSONBackend()
+
+_backends = {
+    "orjson": OrjsonBackend,
+    "msgspec": MsgspecBackend,
+    "json": StdlibJSONBackend,
+}
+
+def _load_backend(name: str) -> JSONBackend:
+    if name not in _backends:
+        raise ValueError(f"Invalid JSON backend: {name}. Available backends: {list(_backends.keys())}")
+    return _backends[name]()
+
+def _default_backend() -> JSONBackend:
+    name = os.environ.get("LANGBATCH_JSON_BACKEND")
+    if name:
+        try:
+            return _load_backend(name)
+        except ImportError:
+            logger.warning(f"JSON backend {name} is not installed, falling back to the default backend. Run: pip install langbatch[fast-json]")
+
+    for name in ["orjson", "msgspec"]:
+        try:
+            return _load_backend(name)
+        except ImportError:
+            continue
+    return _stdlib_backend
+
+_backend: JSONBackend = _default_backend()
+
+def get_backend() -> JSONBackend:
+    """
+    Get the JSON backend in use.
+    """
+    return _backend
+
+def set_backend(backend: str | JSONBackend) -> None:
+    """
+    Set the JSON backend used by langbatch.
+
+    Args:
+        backend (str | JSONBackend): One of "orjson", "msgspec", "json" or a JSONBackend instance.
+
+    Usage:
+    ```python
+    from langbatch.json_codec import set_backend
+
+    set_backend("json")
+    ```
+    """
+    global _backend
+    _backend = backend if isinstance(backend, JSONBackend) else _load_backend(backend)
+
+def dumps(obj: Any) -> str:
+    """
+    Encode the object to a compact JSON string.
+    """
+    return _backend.dumps(obj).decode("utf-8")
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    Encode the object to compact JSON bytes.
+    """
+    return _backend.dumps(obj)
+
+def loads(data: bytes | str) -> Any:
+    """
+    Decode JSON bytes or str to an object.
+    """
+    return _backend.loads(data)
+
+def read_jsonl(file: str | Path) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily read the objects from a jsonl file. Blank lines are skipped.
+    """
+    with open(file, "rb") as reader:
+        for line in reader:
+            if line.strip():
+                yield _backend.loads(line)
+
+def write_jsonl(
+        file: str | Path,
+        objs: Iterable[Any],
+        mode: str = "w",
+        progress: Callable[[int, int], None] | None = None,
+        progress_every: int = 100000
+    ) -> int:
+    """
+    Write the objects to a jsonl file, one object per line.
+    The objects are encoded and written one at a time, so `objs` can be a generator over a source larger than the memory.
+
+    Args:
+        file (str | Path): The path to the jsonl file.
+        objs (Iterable[Any]): The objects to write.
+        mode (str, optional): "w" to overwrite the file, "a" to append to it. Defaults to "w".
+        progress (Callable[[int, int], None], optional): Called with the running count of the objects and bytes written,
+            every `progress_every` objects and once all the objects are written. Defaults to None.
+        progress_every (int, optional): Number of objects between the progress calls. Defaults to 100000.
+
+    Returns:
+        int: The number of objects written.
+    """
+    count = size = 0
+    with open(file, mode + "b") as writer:
+        for obj in objs:
+            line = _backend.dumps(obj) + b"\n"
+            writer.write(line)
+            count += 1
+            size += len(line)
+            if progress is not None and count % progress_every == 0:
+                progress(count, size)
+    if progress is not None:
+        progress(count, size)
+    return count
+
+def write_jsonl_bytes(file: str | Path, lines: Iterable[bytes | str], mode: str = "w") -> int:
+    """
+    Write objects already encoded as JSON bytes to a jsonl file as is, one object per line.
+    JSON strings, ex. from Redis clients with `decode_responses=True`, are encoded to UTF-8 bytes.
+    Objects encoded over multiple lines, ex. pretty printed JSON, are re-encoded to a single line.
+
+    Args:
+        file (str | Path): The path to the jsonl file.
+        lines (Iterable[bytes | str]): The JSON encoded objects to write.
+        mode (str, optional): "w" to overwrite the file, "a" to append to it. Defaults to "w".
+
+    Returns:
+        int: The number of objects written.
+    """
+    count = 0
+    with open(file, mode + "b") as writer:
+        for line in lines:
+            if isinstance(line, str):
+                line = line.encode()
+            line = line.strip()
+            if b"\n" in line:
+                line = _backend.dumps(_backend.loads(line))
+            writer.write(line)
+            writer.write(b"\n")
+            count += 1
+    return count
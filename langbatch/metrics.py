@@ -0,0 +1,357 @@
+"""
+Metrics and tracing hooks of the batch pipeline, with exporters for Prometheus, OpenTelemetry or a callback.
+"""
+
+import math
+import time
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# name -> (type, description) of the metrics reported by the BatchHandler and the BatchDispatcher
+METRICS: Dict[str, Tuple[str, str]] = {
+    "langbatch_queue_depth": ("gauge", "Number of batches in the handler queue, by state"),
+    "langbatch_dispatch_latency_seconds": ("histogram", "Time to get the requests from the request queue, create the batch and dispatch it"),
+    "langbatch_batch_requests": ("histogram", "Number of requests in the created batches"),
+    "langbatch_batch_bytes": ("histogram", "Size of the batch files of the created batches in bytes"),
+    "langbatch_batch_status_seconds": ("histogram", "Time spent by the batches in each status, by provider and status"),
+    "langbatch_poll_seconds": ("histogram", "Latency of the batch status calls, by provider"),
+    "langbatch_start_seconds": ("histogram", "Time to start a batch, by provider"),
+    "langbatch_conversion_seconds": ("histogram", "Time to convert the requests of a batch to the provider format, by provider"),
+    "langbatch_upload_seconds": ("histogram", "Time to upload the requests of a batch to the provider, by provider"),
+    "langbatch_batches_total": ("counter", "Number of batches by provider and event: started, start_failed, completed, cancelled"),
+    "langbatch_retries_total": ("counter", "Number of batch retries, by provider and status of the retried batch"),
+    "langbatch_redriven_requests_total": ("counter", "Number of failed requests re-driven in new batches, by attempt"),
+}
+
+DEFAULT_BUCKETS: Dict[str, List[float]] = {
+    "seconds": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 24 * 3600],
+    "requests": [1, 10, 100, 1000, 5000, 10000, 50000, 100000],
+    "bytes": [2 ** 10, 2 ** 16, 2 ** 20, 2 ** 24, 2 ** 26, 2 ** 28, 2 ** 30],
+}
+
+class Metrics:
+    """
+    Metrics is the base class of the metrics exporters. The base class does not export anything,
+    so it is used when no exporter is given.
+
+    Implement `increment`, `observe` and `set_gauge`, and optionally `span`, to export to other systems.
+
+    Usage:
+    ```python
+    class StatsdMetrics(Metrics):
+        def __init__(self, client):
+            self.client = client
+
+        def increment(self, name, value=1, labels=None):
+            self.client.incr(name, value, tags=labels)
+
+        def observe(self, name, value, labels=None):
+            self.client.histogram(name, value, tags=labels)
+
+        def set_gauge(self, name, value, labels=None):
+            self.client.gauge(name, value, tags=labels)
+
+    batch_handler = BatchHandler(batch_process_func=process_batch, metrics=StatsdMetrics(client))
+    ```
+    """
+
+    def increment(self, name: str, value: float = 1, labels: Dict[str, str] | None = None):
+        """
+        Increment a counter.
+        """
+        pass
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        """
+        Record a value of a histogram.
+        """
+        pass
+
+    def set_gauge(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        """
+        Set the value of a gauge.
+        """
+        pass
+
+    @contextmanager
+    def span(self, name: str, attributes: Dict[str, Any] | None = None) -> Iterator[None]:
+        """
+        Trace an operation of the pipeline.
+        """
+        yield
+
+    @contextmanager
+    def timer(self, name: str, labels: Dict[str, str] | None = None) -> Iterator[None]:
+        """
+        Record the duration of the block in seconds in a histogram.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, labels)
+
+class CallbackMetrics(Metrics):
+    """
+    CallbackMetrics calls a function with every metric event,
+    a dict with "type" ("counter", "histogram", "gauge" or "span"), "name", "value" and "labels".
+    The value of a span is its duration in seconds, and its labels are the span attributes.
+
+    Usage:
+    ```python
+    def on_metric(event):
+        print(event["type"], event["name"], event["value"], event["labels"])
+
+    batch_handler = BatchHandler(batch_process_func=process_batch, metrics=CallbackMetrics(on_metric))
+    ```
+    """
+
+    def __init__(self, callback: Callable[[Dict[str, Any]], None]):
+        self.callback = callback
+
+    def _emit(self, type: str, name: str, value: float, labels: Dict[str, Any] | None):
+        try:
+            self.callback({"type": type, "name": name, "value": value, "labels": labels or {}})
+        except:
+            logger.error(f"Error in metrics callback for {name}", exc_info=True)
+
+    def increment(self, name: str, value: float = 1, labels: Dict[str, str] | None = None):
+        self._emit("counter", name, value, labels)
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        self._emit("histogram", name, value, labels)
+
+    def set_gauge(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        self._emit("gauge", name, value, labels)
+
+    @contextmanager
+    def span(self, name: str, attributes: Dict[str, Any] | None = None) -> Iterator[None]:
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._emit("span", name, time.perf_counter() - start_time, attributes)
+
+class PrometheusMetrics(Metrics):
+    """
+    PrometheusMetrics keeps the metrics in memory and renders them in the Prometheus text format,
+    to be served on an HTTP endpoint scraped by Prometheus.
+
+    Usage:
+    ```python
+    metrics = PrometheusMetrics()
+    batch_handler = BatchHandler(batch_process_func=process_batch, metrics=metrics)
+    batch_dispatcher = BatchDispatcher(batch_handler, request_queue, metrics=metrics)
+
+    # Serve the metrics on http://localhost:9090/metrics
+    metrics.serve(9090)
+
+    # Or render them in an existing web app
+    text = metrics.render()
+    ```
+    """
+
+    def __init__(self, buckets: Dict[str, List[float]] = {}):
+        """
+        Initialize the PrometheusMetrics.
+
+        Args:
+            buckets (Dict[str, List[float]], optional): Histogram buckets by metric name.
+                Defaults to buckets by the unit suffix of the metric name: _seconds, _requests or _bytes.
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple, float]] = defaultdict(dict)
+        self._gauges: Dict[str, Dict[Tuple, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[Tuple, Dict[str, Any]]] = defaultdict(dict)
+        self._server = None
+
+    @staticmethod
+    def _labels_key(labels: Dict[str, str] | None) -> Tuple:
+        return tuple(sorted((labels or {}).items()))
+
+    def _get_buckets(self, name: str) -> List[float]:
+        if name in self.buckets:
+            return self.buckets[name]
+        return DEFAULT_BUCKETS.get(name.rsplit("_", 1)[-1], DEFAULT_BUCKETS["seconds"])
+
+    def increment(self, name: str, value: float = 1, labels: Dict[str, str] | None = None):
+        key = self._labels_key(labels)
+        with self._lock:
+            self._counters[name][key] = self._counters[name].get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        key = self._labels_key(labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                buckets = self._get_buckets(name)
+                histogram = {"buckets": buckets, "counts": [0] * len(buckets), "count": 0, "sum": 0.0}
+                self._histograms[name][key] = histogram
+
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    def set_gauge(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        with self._lock:
+            self._gauges[name][self._labels_key(labels)] = value
+
+    @staticmethod
+    def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+        items = key + extra
+        if not items:
+            return ""
+        def escape(value: Any) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in items) + "}"
+
+    @staticmethod
+    def _format_value(value: float) -> str:
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+    def _header(self, name: str, type: str) -> List[str]:
+        description = METRICS.get(name, (type, name))[1]
+        return [f"# HELP {name} {description}", f"# TYPE {name} {type}"]
+
+    def render(self) -> str:
+        """
+        Render the metrics in the Prometheus text format.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.extend(self._header(name, "counter"))
+                for key, value in series.items():
+                    lines.append(f"{name}{self._format_labels(key)} {self._format_value(value)}")
+
+            for name, series in sorted(self._gauges.items()):
+                lines.extend(self._header(name, "gauge"))
+                for key, value in series.items():
+                    lines.append(f"{name}{self._format_labels(key)} {self._format_value(value)}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.extend(self._header(name, "histogram"))
+                for key, histogram in series.items():
+                    for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                        lines.append(f"{name}_bucket{self._format_labels(key, (('le', self._format_value(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{self._format_labels(key, (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {self._format_value(histogram['sum'])}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9090, addr: str = ""):
+        """
+        Serve the metrics on the /metrics path of an HTTP server running in a background thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((addr, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"Serving metrics on port {self._server.server_address[1]}")
+
+    def shutdown(self):
+        """
+        Stop the HTTP server started with `serve`.
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class OpenTelemetryMetrics(Metrics):
+    """
+    OpenTelemetryMetrics records the metrics with an OpenTelemetry meter and the spans with an OpenTelemetry tracer,
+    exported by the providers configured in the application.
+
+    Usage:
+    ```python
+    from opentelemetry import metrics, trace
+
+    batch_handler = BatchHandler(
+        batch_process_func=process_batch,
+        metrics=OpenTelemetryMetrics(metrics.get_meter("my-service"), trace.get_tracer("my-service"))
+    )
+    ```
+    """
+
+    def __init__(self, meter: Any = None, tracer: Any = None):
+        """
+        Initialize the OpenTelemetryMetrics.
+
+        Args:
+            meter (Meter, optional): The meter to record the metrics with. Defaults to the "langbatch" meter of the global meter provider.
+            tracer (Tracer, optional): The tracer to record the spans with. Defaults to the "langbatch" tracer of the global tracer provider.
+        """
+        try:
+            from opentelemetry import metrics as otel_metrics
+            from opentelemetry import trace as otel_trace
+        except ImportError:
+            raise ImportError("opentelemetry-api package is required for OpenTelemetryMetrics. Run: pip install langbatch[otel]")
+
+        self.meter = meter or otel_metrics.get_meter("langbatch")
+        self.tracer = tracer or otel_trace.get_tracer("langbatch")
+        self._instruments: Dict[str, Any] = {}
+        self._gauge_values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def _get_instrument(self, name: str, type: str):
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            description = METRICS.get(name, (type, ""))[1]
+            unit = "s" if name.endswith("_seconds") else "By" if name.endswith("_bytes") else "1"
+            if type == "counter":
+                instrument = self.meter.create_counter(name, unit=unit, description=description)
+            elif type == "histogram":
+                instrument = self.meter.create_histogram(name, unit=unit, description=description)
+            else:
+                # gauges are recorded as up down counters of the changes, supported by all versions of the API
+                instrument = self.meter.create_up_down_counter(name, unit=unit, description=description)
+            self._instruments[name] = instrument
+        return instrument
+
+    def increment(self, name: str, value: float = 1, labels: Dict[str, str] | None = None):
+        self._get_instrument(name, "counter").add(value, labels or {})
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        self._get_instrument(name, "histogram").record(value, labels or {})
+
+    def set_gauge(self, name: str, value: float, labels: Dict[str, str] | None = None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            change = value - self._gauge_values.get(key, 0)
+            self._gauge_values[key] = value
+        if change:
+            self._get_instrument(name, "gauge").add(change, labels or {})
+
+    @contextmanager
+    def span(self, name: str, attributes: Dict[str, Any] | None = None) -> Iterator[None]:
+        with self.tracer.start_as_current_span(name, attributes=attributes or {}):
+            yield
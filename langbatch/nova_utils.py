@@ -1,7 +1,8 @@
 from typing import Any, Dict, List, Optional
 import time
-from langbatch.schemas import AnthropicChatCompletionRequest
 import json
+from langbatch.schemas import AnthropicChatCompletionRequest, validate_request_body
+from langbatch import json_codec
 
 def convert_content_nova(content: Any) -> List[Dict[str, Any]]:
     if isinstance(content, str):
@@ -28,7 +29,7 @@ def convert_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             converted_part = {
                 "toolResult": {
                     "toolUseId": message["tool_call_id"],
-                    "content": [{"json": json.loads(message["content"])}]
+                    "content": [{"json": json_codec.loads(message["content"])}]
                 }
             }
             tool_responses[message["tool_call_id"]] = converted_part
@@ -43,7 +44,7 @@ def convert_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                     "toolUse": {
                         "toolUseId": tool_call["id"],
                         "name": tool_call["function"]["name"],
-                        "input": json.loads(tool_call["function"]["arguments"])
+                        "input": json_codec.loads(tool_call["function"]["arguments"])
                     }
                 }
                 converted_tool_calls.append(converted_tool_call)
@@ -98,7 +99,7 @@ def convert_tools_nova(tools: Optional[List[Dict[str, Any]]]) -> Optional[Dict[s
     return {"tools": converted_tools, "toolChoice": {"auto": {}}} if converted_tools else None
 
 def convert_request_nova(req: dict) -> dict:
-    request = AnthropicChatCompletionRequest(**req["body"])
+    request = validate_request_body(AnthropicChatCompletionRequest, req["body"])
     
     messages = []
     system_content = None
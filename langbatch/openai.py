@@ -1,29 +1,45 @@
-from typing import Any, Dict, Optional
-import tempfile
-from pathlib import Path
-
-import jsonlines
-from openai import OpenAI, AzureOpenAI
+import asyncio
+from typing import Any, Dict, List, Optional
+import httpx
+from openai import OpenAI, AzureOpenAI, AsyncOpenAI, AsyncAzureOpenAI
+from langbatch import json_codec
 from langbatch.Batch import Batch
+from langbatch.clients import get_openai_client, get_async_openai_client
 from langbatch.schemas import OpenAIChatCompletionRequest, OpenAIEmbeddingRequest
 from langbatch.ChatCompletionBatch import ChatCompletionBatch
 from langbatch.EmbeddingBatch import EmbeddingBatch
 from langbatch.errors import BatchStateError
 
+def _get_client_key(client: OpenAI | AzureOpenAI | AsyncOpenAI | AsyncAzureOpenAI | None):
+    if client is None:
+        return None
+    return (type(client), str(client.base_url), client.api_key, client.organization, client.project)
+
 class OpenAIBatch(Batch):
     """
     OpenAIBatch is a base class for OpenAI batch classes.
     Implements the Batch class for OpenAI API.
     """
     _url: str = "/v1/chat/completions"
+    _provider: str = "openai"
+    _max_requests: int = 50000
+    _max_bytes: int = 200 * 1024 * 1024
 
-    def __init__(self, file: str, client: Optional[OpenAI | AzureOpenAI] = None) -> None:
+    def __init__(
+            self, 
+            file: str, 
+            client: Optional[OpenAI | AzureOpenAI] = None, 
+            async_client: Optional[AsyncOpenAI | AsyncAzureOpenAI] = None
+        ) -> None:
         """
         Initialize the OpenAIBatch class.
 
         Args:
             file (str): The path to the jsonl file in OpenAI batchformat.
-            client (OpenAI, optional): The OpenAI client to use. Defaults to OpenAI().
+            client (OpenAI, optional): The OpenAI client to use. Defaults to the shared OpenAI client from the client registry,
+                configured from the environment variables like OpenAI().
+            async_client (AsyncOpenAI, optional): The async OpenAI client used by the async methods (`astart`, `aget_status`, etc.). 
+                Defaults to the shared AsyncOpenAI client with the same configuration as `client`.
 
         Usage:
         ```python
@@ -35,10 +51,37 @@ class OpenAIBatch(Batch):
             base_url="https://api.provider.com/v1"
         )
         batch = OpenAIBatch("path/to/file.jsonl", client = client)
+
+        # With custom Azure OpenAI clients
+        batch = OpenAIBatch(
+            "path/to/file.jsonl", 
+            client = AzureOpenAI(...), 
+            async_client = AsyncAzureOpenAI(...)
+        )
         ```
         """
         super().__init__(file)
-        self._client = client or OpenAI()
+        self._client = client or get_openai_client()
+        self._async_client = async_client
+        if isinstance(self._client, AzureOpenAI):
+            self._provider = "azure_openai"
+
+    def _get_async_client(self) -> AsyncOpenAI | AsyncAzureOpenAI | None:
+        """
+        Get the async client. For OpenAI clients, the shared async client of the running event loop 
+        with the same configuration is used. Returns None for Azure OpenAI clients without an async client, 
+        the async methods then run the synchronous methods in a thread.
+        """
+        if self._async_client is None and type(self._client) is OpenAI:
+            return get_async_openai_client(
+                api_key=self._client.api_key,
+                organization=self._client.organization,
+                project=self._client.project,
+                base_url=self._client.base_url,
+                timeout=self._client.timeout,
+                max_retries=self._client.max_retries
+            )
+        return self._async_client
 
     @classmethod
     def _get_init_args(cls, meta_data) -> Dict[str, Any]:
@@ -49,7 +92,7 @@ class OpenAIBatch(Batch):
     
     def _upload_batch_file(self):
         # Upload the batch file to OpenAI
-        with open(self._file, "rb") as file:
+        with self._record_timing("upload"), open(self._file, "rb") as file:
             batch_input_file  = self._client.files.create(file=file, purpose="batch")
             return batch_input_file.id
 
@@ -61,12 +104,36 @@ class OpenAIBatch(Batch):
         )
         self.platform_batch_id = batch.id
 
+    async def _aupload_batch_file(self, client: AsyncOpenAI | AsyncAzureOpenAI):
+        with self._record_timing("upload"), open(self._file, "rb") as file:
+            batch_input_file = await client.files.create(file=file, purpose="batch")
+            return batch_input_file.id
+
+    async def _acreate_batch(self, client: AsyncOpenAI | AsyncAzureOpenAI, input_file_id):
+        batch = await client.batches.create(
+            input_file_id=input_file_id,
+            endpoint=self._url,
+            completion_window= "24h"
+        )
+        self.platform_batch_id = batch.id
+
     def start(self):
-        if self.platform_batch_id is not None:
+        if self.platform_batch_id is not None or self.realtime_results_file is not None:
             raise BatchStateError("Batch already started")
         
         batch_input_file_id = self._upload_batch_file()
         self._create_batch(batch_input_file_id)
+
+    async def astart(self):
+        client = self._get_async_client()
+        if client is None:
+            return await super().astart()
+
+        if self.platform_batch_id is not None or self.realtime_results_file is not None:
+            raise BatchStateError("Batch already started")
+
+        batch_input_file_id = await self._aupload_batch_file(client)
+        await self._acreate_batch(client, batch_input_file_id)
     
     def cancel(self):
         """
@@ -88,14 +155,95 @@ class OpenAIBatch(Batch):
             return True
         else:
             return False
+
+    async def acancel(self) -> bool:
+        client = self._get_async_client()
+        if client is None:
+            return await super().acancel()
+
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        batch = await client.batches.cancel(self.platform_batch_id)
+        return batch.status == "cancelling" or batch.status == "cancelled"
         
     def get_status(self):
+        if self.realtime_results_file is not None:
+            return "completed"
+
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
         
         batch = self._client.batches.retrieve(self.platform_batch_id)
         return batch.status
 
+    async def aget_status(self) -> str:
+        if self.realtime_results_file is not None:
+            return "completed"
+
+        client = self._get_async_client()
+        if client is None:
+            return await super().aget_status()
+
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        batch = await client.batches.retrieve(self.platform_batch_id)
+        return batch.status
+
+    @classmethod
+    def _list_statuses(cls, batches: List[Batch]) -> Dict[str, str]:
+        statuses = {}
+        for client, group in cls._group_by_client(batches, lambda batch: batch._client, _get_client_key):
+            wanted = {batch.platform_batch_id: batch.id for batch in group}
+            cutoff = cls._status_list_cutoff(group)
+
+            page = client.batches.list(limit=cls._status_list_page_size)
+            pages = 1
+            while True:
+                items = [(item.id, item.status, item.created_at) for item in page.data]
+                done = cls._collect_listed_statuses(wanted, items, statuses, cutoff)
+                if done or pages >= cls._max_status_list_pages or not page.has_next_page():
+                    break
+                page = page.get_next_page()
+                pages += 1
+        return statuses
+
+    @classmethod
+    async def _alist_statuses(cls, batches: List[Batch]) -> Dict[str, str]:
+        statuses = {}
+        for client, group in cls._group_by_client(batches, lambda batch: batch._get_async_client(), _get_client_key):
+            if client is None:
+                statuses.update(await asyncio.to_thread(cls._list_statuses, group))
+                continue
+
+            wanted = {batch.platform_batch_id: batch.id for batch in group}
+            cutoff = cls._status_list_cutoff(group)
+
+            page = await client.batches.list(limit=cls._status_list_page_size)
+            pages = 1
+            while True:
+                items = [(item.id, item.status, item.created_at) for item in page.data]
+                done = cls._collect_listed_statuses(wanted, items, statuses, cutoff)
+                if done or pages >= cls._max_status_list_pages or not page.has_next_page():
+                    break
+                page = await page.get_next_page()
+                pages += 1
+        return statuses
+
+    def _write_results_file(self, file_response: bytes, error_file_response: bytes | None):
+        file_path = self._create_results_file_path()
+        with open(file_path, "wb") as file:
+            file.write(file_response)
+
+            if error_file_response is not None:
+                # Error file is already in jsonl format, append it to the results file as is
+                if file_response and not file_response.endswith(b"\n"):
+                    file.write(b"\n")
+                file.write(error_file_response)
+
+        return file_path
+
     def _download_results_file(self):
         batch_object = self._client.batches.retrieve(self.platform_batch_id)
 
@@ -105,34 +253,60 @@ class OpenAIBatch(Batch):
             file_response = self._client.files.content(output_file_id).content
         else:
             return None  # Handle case where there's no output file
-        
-        file_path = self._create_results_file_path()
-        with open(file_path, "wb") as file:
-            file.write(file_response)
 
+        error_file_response = None
         error_file_id = batch_object.error_file_id
         if error_file_id is not None:
             error_file_response = self._client.files.content(error_file_id).content
-            error_file_path = Path(tempfile.gettempdir()) / f"{self.id}_errors.jsonl"
-            with open(error_file_path, "wb") as file:
-                file.write(error_file_response)
 
-            error_requests = []
-            with jsonlines.open(error_file_path) as reader:
-                for obj in reader:
-                    error_requests.append(obj)
+        return self._write_results_file(file_response, error_file_response)
 
-            with jsonlines.open(file_path, mode="a") as writer:
-                writer.write_all(error_requests)
+    async def _adownload_results_file(self):
+        client = self._get_async_client()
+        if client is None:
+            return await super()._adownload_results_file()
 
-        return file_path
+        batch_object = await client.batches.retrieve(self.platform_batch_id)
+
+        output_file_id = batch_object.output_file_id
+        if output_file_id is None:
+            return None
+
+        file_response = (await client.files.content(output_file_id)).content
+
+        error_file_response = None
+        error_file_id = batch_object.error_file_id
+        if error_file_id is not None:
+            error_file_response = (await client.files.content(error_file_id)).content
+
+        return await asyncio.to_thread(self._write_results_file, file_response, error_file_response)
     
+    async def _asend_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        # Endpoint path relative to the base url of the client, ex. /chat/completions
+        path = self._url.removeprefix("/v1")
+        client = self._get_async_client()
+        if client is None:
+            response = await asyncio.to_thread(self._client.post, path, body=request["body"], cast_to=httpx.Response)
+        else:
+            response = await client.post(path, body=request["body"], cast_to=httpx.Response)
+
+        return {
+            "id": None,
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": response.status_code,
+                "request_id": response.headers.get("x-request-id"),
+                "body": json_codec.loads(response.content)
+            },
+            "error": None
+        }
+
     def _get_errors(self):
         batch_object = self._client.batches.retrieve(self.platform_batch_id)
         return batch_object.errors
-    
-    def is_retryable_failure(self) -> bool:
-        errors = self._get_errors()
+
+    @staticmethod
+    def _is_retryable_error(errors) -> bool:
         if errors:
             error = errors.data[0]['code']
 
@@ -142,6 +316,17 @@ class OpenAIBatch(Batch):
                 return False
         else:
             return False
+    
+    def is_retryable_failure(self) -> bool:
+        return self._is_retryable_error(self._get_errors())
+
+    async def ais_retryable_failure(self) -> bool:
+        client = self._get_async_client()
+        if client is None:
+            return await super().ais_retryable_failure()
+
+        batch_object = await client.batches.retrieve(self.platform_batch_id)
+        return self._is_retryable_error(batch_object.errors)
 
     def retry(self):
         if self.platform_batch_id is None:
@@ -151,6 +336,17 @@ class OpenAIBatch(Batch):
 
         self._create_batch(batch.input_file_id)
 
+    async def aretry(self):
+        client = self._get_async_client()
+        if client is None:
+            return await super().aretry()
+
+        if self.platform_batch_id is None:
+            raise BatchStateError("Batch not started")
+
+        batch = await client.batches.retrieve(self.platform_batch_id)
+        await self._acreate_batch(client, batch.input_file_id)
+
 class OpenAIChatCompletionBatch(OpenAIBatch, ChatCompletionBatch):
     """
     OpenAIChatCompletionBatch is a class for OpenAI chat completion batches.
@@ -163,27 +359,35 @@ class OpenAIChatCompletionBatch(OpenAIBatch, ChatCompletionBatch):
     ```
     """
     _url: str = "/v1/chat/completions"
+    _request_schema = OpenAIChatCompletionRequest
 
-    def _validate_request(self, request):
-        OpenAIChatCompletionRequest(**request)
-
-    # Override the upload batch file method to fix requests for Azure OpenAI
+    # Override the upload batch file methods to fix requests for Azure OpenAI
     def _upload_batch_file(self):
         if isinstance(self._client, AzureOpenAI):
-            requests = self._get_requests()
-
-            modified_requests = []
-            for request in requests:
-                modified_requests.append(self._fix_request_for_azure(request))
-
-            with jsonlines.open(self._file, mode="w") as writer:
-                writer.write_all(modified_requests)
+            with self._record_timing("conversion"):
+                self._fix_batch_file_for_azure()
 
         # Upload the batch file to OpenAI
-        with open(self._file, "rb") as file:
+        with self._record_timing("upload"), open(self._file, "rb") as file:
             batch_input_file  = self._client.files.create(file=file, purpose="batch")
             return batch_input_file.id
 
+    async def _aupload_batch_file(self, client: AsyncOpenAI | AsyncAzureOpenAI):
+        if isinstance(client, AsyncAzureOpenAI):
+            with self._record_timing("conversion"):
+                await asyncio.to_thread(self._fix_batch_file_for_azure)
+
+        return await super()._aupload_batch_file(client)
+
+    def _fix_batch_file_for_azure(self):
+        requests = self._get_requests()
+
+        modified_requests = []
+        for request in requests:
+            modified_requests.append(self._fix_request_for_azure(request))
+
+        json_codec.write_jsonl(self._file, modified_requests)
+
     def _fix_request_for_azure(self, request):
         """
         Azure OpenAI does not support passing None for content field in messages.
@@ -207,6 +411,7 @@ class OpenAIEmbeddingBatch(OpenAIBatch, EmbeddingBatch):
     ```
     """
     _url: str = "/v1/embeddings"
-
-    def _validate_request(self, request):
-        OpenAIEmbeddingRequest(**request)
\ No newline at end of file
+    _request_schema = OpenAIEmbeddingRequest
+    _max_inputs_per_request: int = 2048
+    _max_tokens_per_request: int = 300000
+    _max_tokens_per_input: int = 8192
\ No newline at end of file
@@ -1,8 +1,11 @@
+import time
+import asyncio
 import logging
+import threading
 from typing import List, Any
 from collections import deque
 from abc import ABC, abstractmethod
-import json
+from langbatch import json_codec
 
 class RequestQueue(ABC):
     """
@@ -51,18 +54,119 @@ class RequestQueue(ABC):
     def __len__(self):
         pass
 
+    def get_raw_requests(self, count: int) -> List[bytes]:
+        """
+        Get requests from the queue encoded as JSON bytes.
+        Used by `BatchDispatcher` to write "full" requests to the batch file without decoding them.
+        Queues storing encoded requests should return them as is.
+        """
+        return [json_codec.dumps_bytes(request) for request in self.get_requests(count)]
+
+    def oldest_request_time(self) -> float | None:
+        """
+        Get the time the oldest request in the queue was added, as a unix timestamp.
+        Returns None when the queue is empty or when the queue does not track the time requests are added.
+        """
+        return None
+
+    async def wait_for_requests(self, count: int, timeout: float) -> bool:
+        """
+        Wait until the queue has at least `count` requests or the timeout expires.
+        Used by `BatchDispatcher` to create batches as soon as the queue reaches the queue threshold.
+
+        Queues without notifications for added requests wait for the whole timeout.
+
+        Args:
+            count (int): The number of requests to wait for.
+            timeout (float): The maximum time to wait in seconds.
+
+        Returns:
+            bool: Whether the queue has at least `count` requests.
+        """
+        await asyncio.sleep(timeout)
+        return await asyncio.to_thread(len, self) >= count
+
 class InMemoryRequestQueue(RequestQueue):
+    """
+    InMemoryRequestQueue is a request queue that keeps the requests in memory.
+    Requests can be added from any thread, waiting dispatchers are notified as soon as the queue has enough requests.
+
+    Usage:
+    ```python
+    request_queue = InMemoryRequestQueue()
+    request_queue.add_requests([
+        [
+            {"role": "user", "content": "How can I learn Python?"}
+        ]
+    ])
+
+    # Wait for 1000 requests, up to 10 minutes
+    has_requests = await request_queue.wait_for_requests(1000, timeout=600)
+    ```
+    """
     def __init__(self):
         self.queue = deque()
+        self._added_times = deque() # [time added, number of requests still in the queue] of each add_requests call
+        self._waiters = [] # (event loop, event, count) of each wait_for_requests call
+        self._lock = threading.Lock()
 
     def add_requests(self, requests: List[Any]):
-        self.queue.extend(requests)
+        with self._lock:
+            self.queue.extend(requests)
+            if len(requests) > 0:
+                self._added_times.append([time.time(), len(requests)])
+            self._notify_waiters()
         logging.info(f"Added {len(requests)} requests to queue")
 
     def get_requests(self, count: int) -> List[Any]:
-        if count > len(self.queue):
-            count = len(self.queue)
-        return [self.queue.popleft() for _ in range(count)]
+        with self._lock:
+            if count > len(self.queue):
+                count = len(self.queue)
+            requests = [self.queue.popleft() for _ in range(count)]
+
+            while count > 0:
+                added = self._added_times[0]
+                taken = min(count, added[1])
+                added[1] -= taken
+                count -= taken
+                if added[1] == 0:
+                    self._added_times.popleft()
+
+        return requests
+
+    def oldest_request_time(self) -> float | None:
+        with self._lock:
+            return self._added_times[0][0] if self._added_times else None
+
+    def _notify_waiters(self):
+        # called with the lock held, the events are set in the event loops of the waiters
+        # since requests can be added from other threads
+        waiters = []
+        for waiter in self._waiters:
+            loop, event, count = waiter
+            if len(self.queue) >= count:
+                loop.call_soon_threadsafe(event.set)
+            else:
+                waiters.append(waiter)
+        self._waiters = waiters
+
+    async def wait_for_requests(self, count: int, timeout: float) -> bool:
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event, count)
+        with self._lock:
+            if len(self.queue) >= count:
+                return True
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
 
     def __len__(self):
         return len(self.queue)
@@ -71,6 +175,13 @@ class RedisRequestQueue(RequestQueue):
     """
     RedisRequestQueue is a request queue that uses a Redis list to store requests.
 
+    Added requests are announced on the `<queue_name>:added` Pub/Sub channel, waiting dispatchers 
+    check the queue length only when requests are added. No Redis server configuration is needed, 
+    unlike keyspace notifications. Producers pushing to the list directly, without `add_requests`, 
+    are picked up when the wait of the dispatcher times out.
+    The time each request is added is kept in the `<queue_name>:added_times` list, popped together with the requests,
+    for the time threshold of the dispatcher. Requests pushed directly are not timed, only the requests added with `add_requests`.
+
     Usage:
     ```python
     import os
@@ -102,14 +213,27 @@ class RedisRequestQueue(RequestQueue):
             
         self.redis_client = redis_client
         self.queue_name = queue_name
+        self.channel = f"{queue_name}:added"
+        self.times_name = f"{queue_name}:added_times"
 
     def add_requests(self, requests: List[Any]):
         count = len(requests)
-        for request in requests:
-            self.redis_client.rpush(self.queue_name, str(json.dumps(request)))
+        if count > 0:
+            # the requests and their add times are pushed in a transaction, to keep the two lists aligned
+            pipeline = self.redis_client.pipeline(transaction=True)
+            pipeline.rpush(self.queue_name, *[json_codec.dumps_bytes(request) for request in requests])
+            pipeline.rpush(self.times_name, *[time.time()] * count)
+            pipeline.publish(self.channel, count)
+            pipeline.execute()
         logging.debug(f"Added {count} requests to queue.")
 
     def get_requests(self, count: int) -> List[Any]:
+        results = [json_codec.loads(item) for item in self.get_raw_requests(count)]
+
+        logging.debug(f"Retrieved {len(results)} requests from queue.")
+        return results
+
+    def get_raw_requests(self, count: int) -> List[bytes]:
         size = len(self)
         if count > size:
             count = size
@@ -117,14 +241,47 @@ class RedisRequestQueue(RequestQueue):
         if count == 0:
             return []
     
-        items = self.redis_client.lpop(self.queue_name, count=count)
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.lpop(self.queue_name, count=count)
+        pipeline.lpop(self.times_name, count=count)
+        items, _ = pipeline.execute()
         if items is None:
             return []
-        
-        results = [json.loads(item.decode('utf-8')) for item in items]
 
-        logging.debug(f"Retrieved {len(results)} requests from queue.")
-        return results
+        # clients created with decode_responses=True return str
+        return [item.encode() if isinstance(item, str) else item for item in items]
+
+    def oldest_request_time(self) -> float | None:
+        oldest = self.redis_client.lindex(self.times_name, 0)
+        return float(oldest) if oldest is not None else None
+
+    async def wait_for_requests(self, count: int, timeout: float) -> bool:
+        cancelled = threading.Event()
+        try:
+            return await asyncio.to_thread(self._wait_for_requests, count, timeout, cancelled)
+        finally:
+            cancelled.set()
+
+    def _wait_for_requests(self, count: int, timeout: float, cancelled: threading.Event) -> bool:
+        deadline = time.monotonic() + timeout
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            # subscribed before checking the length, so requests added in between are not missed
+            pubsub.subscribe(self.channel)
+            if len(self) >= count:
+                return True
+
+            while True:
+                remaining = deadline - time.monotonic()
+                if cancelled.is_set() or remaining <= 0:
+                    return False
+                # the length is checked again only when requests are added,
+                # waiting in short steps to stop soon after the waiting task is cancelled
+                message = pubsub.get_message(timeout=min(remaining, 1.0))
+                if message is not None and len(self) >= count:
+                    return True
+        finally:
+            pubsub.close()
 
     def __len__(self):
         length = self.redis_client.llen(self.queue_name)
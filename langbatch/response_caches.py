@@ -0,0 +1,195 @@
+import time
+import sqlite3
+import logging
+import importlib
+from abc import ABC, abstractmethod
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List
+
+from langbatch import json_codec
+from langbatch.batch_storages import get_default_data_path
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache(ABC):
+    """
+    Abstract class for response caches.
+    Implementations should provide a way to get and set responses by the hash of the request body.
+
+    Used in `Batch.create`, `Batch.create_from_requests` and `BatchDispatcher` to skip
+    the requests that are already answered, and populated when the results of a batch are read.
+
+    Usage:
+    ```python
+    # Using default SQLiteResponseCache
+    cache = SQLiteResponseCache(ttl=3600 * 24 * 7, max_entries=1000000)
+    batch = OpenAIChatCompletionBatch.create(data, request_kwargs, response_cache=cache)
+
+    # With custom response cache
+    class MyCustomResponseCache(ResponseCache):
+        def get(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+            # Custom get logic
+
+        def set(self, responses: Dict[str, Dict[str, Any]]):
+            # Custom set logic
+
+    batch = OpenAIChatCompletionBatch.create(data, request_kwargs, response_cache=MyCustomResponseCache())
+    ```
+
+    Batches save a reference to their cache, the class and the init arguments from `get_config`, 
+    and recreate the cache when loaded. Caches without a config are not recreated for the loaded batches.
+    """
+
+    @abstractmethod
+    def get(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the cached responses for the given keys.
+
+        Args:
+            keys (List[str]): The hashes of the request bodies.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The cached responses by key. Keys without a cached response are omitted.
+        """
+        pass
+
+    @abstractmethod
+    def set(self, responses: Dict[str, Dict[str, Any]]):
+        """
+        Add responses to the cache.
+
+        Args:
+            responses (Dict[str, Dict[str, Any]]): The responses in OpenAI batch results format by the hash of the request body.
+        """
+        pass
+
+    def get_config(self) -> Dict[str, Any] | None:
+        """
+        Get the JSON serializable init arguments to recreate the cache with, when loading the batches using it.
+
+        Returns:
+            Dict[str, Any] | None: The init arguments, or None if the cache can not be recreated.
+        """
+        return None
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Response cache that stores the responses in a SQLite database.
+    Supports time based expiry and evicting the least recently used responses when the cache grows beyond `max_entries`.
+
+    Usage:
+    ```python
+    cache = SQLiteResponseCache()
+
+    # With expiry and size limit
+    cache = SQLiteResponseCache("./data/response_cache.db", ttl=3600 * 24, max_entries=100000)
+    ```
+    """
+    _chunk_size: int = 500
+
+    def __init__(self, path: str | Path | None = None, ttl: int | None = None, max_entries: int | None = None):
+        """
+        Initialize the SQLiteResponseCache.
+
+        Args:
+            path (str | Path, optional): The path to the SQLite database file. Defaults to 'response_cache.db' in the default data path.
+            ttl (int, optional): Time in seconds after which a cached response expires. Defaults to None (never expires).
+            max_entries (int, optional): Maximum number of responses to keep in the cache. Defaults to None (no limit).
+        """
+        self.path = Path(path) if path else get_default_data_path() / "response_cache.db"
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response BLOB NOT NULL, created_at REAL NOT NULL, last_accessed REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_accessed ON responses (last_accessed)")
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"path": str(self.path), "ttl": self.ttl, "max_entries": self.max_entries}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are created per operation, so that the cache can be used
+        # from the worker threads of BatchHandler and BatchDispatcher
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def get(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        responses = {}
+        now = time.time()
+        min_created_at = now - self.ttl if self.ttl else 0
+        keys = list(dict.fromkeys(keys))
+        with closing(self._connect()) as connection, connection:
+            for i in range(0, len(keys), self._chunk_size):
+                chunk = keys[i:i + self._chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(
+                    f"SELECT key, response FROM responses WHERE key IN ({placeholders}) AND created_at >= ?",
+                    (*chunk, min_created_at)
+                ).fetchall()
+                for key, response in rows:
+                    responses[key] = json_codec.loads(response)
+
+                found_keys = [row[0] for row in rows]
+                if found_keys:
+                    connection.execute(
+                        f"UPDATE responses SET last_accessed = ? WHERE key IN ({','.join('?' * len(found_keys))})",
+                        (now, *found_keys)
+                    )
+
+        return responses
+
+    def set(self, responses: Dict[str, Dict[str, Any]]):
+        if not responses:
+            return
+
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, last_accessed) VALUES (?, ?, ?, ?)",
+                [(key, json_codec.dumps_bytes(response), now, now) for key, response in responses.items()]
+            )
+            self._evict(connection, now)
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        if self.ttl:
+            connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+
+        if self.max_entries:
+            connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def __len__(self):
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+def get_response_cache_reference(response_cache: ResponseCache) -> Dict[str, Any] | None:
+    """
+    Get the reference saved in the batch meta data to recreate the response cache with.
+    """
+    config = response_cache.get_config()
+    if config is None:
+        logger.warning(f"{type(response_cache).__name__} has no config, it is not saved with the batch")
+        return None
+    return {"class": f"{type(response_cache).__module__}.{type(response_cache).__qualname__}", "config": config}
+
+def load_response_cache(reference: Dict[str, Any]) -> ResponseCache | None:
+    """
+    Recreate the response cache from the reference saved in the batch meta data.
+    Failing to recreate the cache does not fail loading the batch, the loaded batch does not populate the cache then.
+    """
+    try:
+        module_name, class_name = reference["class"].rsplit(".", 1)
+        cache_class = getattr(importlib.import_module(module_name), class_name)
+        return cache_class(**reference["config"])
+    except Exception:
+        logger.warning(f"Error loading the response cache {reference.get('class')}", exc_info=True)
+        return None
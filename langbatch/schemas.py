@@ -1,6 +1,7 @@
-from typing import Dict, List, Union, Iterable, Optional
+from functools import lru_cache
+from typing import Any, Dict, Generic, List, Type, TypeVar, Union, Iterable, Optional
 from typing_extensions import Literal
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 
 from openai.types.chat_model import ChatModel
 from openai.types.chat import completion_create_params
@@ -74,4 +75,37 @@ class VertexAILlamaChatCompletionRequest(BaseModel):
     temperature: Optional[float] = None
     tool_choice: Optional[Literal["none", "auto"]] = None
     tools: Optional[Iterable[ChatCompletionToolParam]] = None
-    top_p: Optional[float] = None
\ No newline at end of file
+    top_p: Optional[float] = None
+
+RequestBody = TypeVar("RequestBody", bound=BaseModel)
+
+class BatchRequest(BaseModel, Generic[RequestBody]):
+    """
+    A single line of an OpenAI compatible batch file, with the body validated against a request schema.
+    """
+    custom_id: str
+    body: RequestBody
+
+@lru_cache(maxsize=None)
+def get_request_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    """
+    Get the TypeAdapter for a batch file line with the given body schema.
+    Adapters are built once per schema and reused for every request.
+    """
+    return TypeAdapter(BatchRequest[schema])
+
+@lru_cache(maxsize=None)
+def get_body_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    """
+    Get the TypeAdapter for a request body with the given schema.
+    """
+    return TypeAdapter(schema)
+
+def validate_request_body(schema: Type[BaseModel], body: Any) -> BaseModel:
+    """
+    Validate a request body against the schema.
+    Bodies that are already validated are returned as is, so a request is never validated twice.
+    """
+    if isinstance(body, schema):
+        return body
+    return get_body_adapter(schema).validate_python(body)
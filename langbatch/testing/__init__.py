@@ -0,0 +1,14 @@
+"""
+Testing utilities for the batch pipeline: an in-process mock of the provider batch APIs and a load test harness.
+Not imported by `langbatch`, so they are only loaded when used.
+
+Usage:
+```python
+from langbatch.testing import MockProvider, run_load_test
+```
+"""
+
+from langbatch.testing.mock_providers import MockProvider
+from langbatch.testing.load_testing import run_load_test
+
+__all__ = ["MockProvider", "run_load_test"]
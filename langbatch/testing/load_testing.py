@@ -0,0 +1,144 @@
+"""
+Load test harness running the batch pipeline, from the request queue through the batch dispatcher and batch handler
+to the processed results, against the in-process MockProvider.
+"""
+
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Type
+
+from langbatch.Batch import Batch
+from langbatch.BatchDispatcher import BatchDispatcher
+from langbatch.BatchHandler import BatchHandler
+from langbatch.batch_queues import FileBatchQueue
+from langbatch.batch_storages import FileBatchStorage
+from langbatch.request_queues import InMemoryRequestQueue, RequestQueue
+from langbatch.testing.mock_providers import MockProvider
+
+logger = logging.getLogger(__name__)
+
+def generate_requests(count: int) -> List[List[Dict[str, str]]]:
+    """
+    Generate deterministic chat completion requests (messages) for load tests.
+    """
+    return [[{"role": "user", "content": f"Load test request {i}"}] for i in range(count)]
+
+async def run_load_test(
+        provider: MockProvider,
+        batch_type: Type[Batch],
+        num_requests: int = 10000,
+        queue_threshold: int = 1000,
+        request_kwargs: Dict = {"model": "gpt-4o-mini"},
+        request_queue: RequestQueue | None = None,
+        dispatcher_kwargs: Dict = {},
+        handler_kwargs: Dict = {},
+        interval: float = 0.1,
+        timeout: float = 600,
+        data_dir: str | None = None
+    ) -> Dict[str, Any]:
+    """
+    Run the batch pipeline end to end against the mock provider and measure its throughput.
+
+    Requests are added to the request queue, batched by a BatchDispatcher and run by a BatchHandler
+    with the mock clients of the provider. The run ends when the results of all the requests are processed or on timeout.
+
+    Args:
+        provider (MockProvider): The mock provider, with the latency, completion times and failure rates to test with.
+        batch_type (Type[Batch]): The batch class, ex. OpenAIChatCompletionBatch or AnthropicChatCompletionBatch.
+        num_requests (int, optional): Number of requests. Defaults to 10000.
+        queue_threshold (int, optional): Number of requests per batch. Defaults to 1000.
+        request_kwargs (Dict, optional): Request parameters of the batches. Defaults to {"model": "gpt-4o-mini"}.
+        request_queue (RequestQueue, optional): The request queue. Defaults to an InMemoryRequestQueue.
+        dispatcher_kwargs (Dict, optional): Additional arguments for the BatchDispatcher.
+        handler_kwargs (Dict, optional): Additional arguments for the BatchHandler.
+        interval (float, optional): Time in seconds between the cycles of the dispatcher and the handler. Defaults to 0.1.
+        timeout (float, optional): Maximum duration of the run in seconds. Defaults to 600.
+        data_dir (str, optional): Directory for the batch storage and batch queue. Defaults to a temporary directory.
+
+    Returns:
+        Dict[str, Any]: Report of the run with the number of requests, batches, successful and unsuccessful results,
+            "elapsed" and "time_to_first_result" in seconds, "throughput" in processed requests per second,
+            "completed" (False on timeout) and "api_calls" with the number of calls to each mock endpoint.
+
+    Usage:
+    ```python
+    provider = MockProvider(latency=0.005, completion_time=lambda rng: rng.uniform(0.5, 2), request_failure_rate=0.01)
+    report = asyncio.run(run_load_test(provider, OpenAIChatCompletionBatch, num_requests=50000, queue_threshold=5000))
+    print(report["throughput"])
+    ```
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_path = Path(data_dir or temp_dir)
+        lock = threading.Lock()
+        stats = {"batches": 0, "successful_results": 0, "unsuccessful_results": 0, "first_result_at": None}
+        all_processed = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def process_batch(batch: Batch):
+            successful_results, unsuccessful_results = batch.get_results()
+            with lock:
+                stats["batches"] += 1
+                stats["successful_results"] += len(successful_results or [])
+                stats["unsuccessful_results"] += len(unsuccessful_results or [])
+                if stats["first_result_at"] is None:
+                    stats["first_result_at"] = time.perf_counter()
+                if stats["successful_results"] + stats["unsuccessful_results"] >= num_requests:
+                    loop.call_soon_threadsafe(all_processed.set)
+
+        batch_handler = BatchHandler(
+            batch_process_func=process_batch,
+            batch_type=batch_type,
+            batch_queue=FileBatchQueue(data_path / "batch_queue.json"),
+            batch_storage=FileBatchStorage(data_path / "batches"),
+            wait_time=interval,
+            batch_kwargs=provider.client_kwargs(batch_type),
+            **handler_kwargs
+        )
+        request_queue = request_queue or InMemoryRequestQueue()
+        batch_dispatcher = BatchDispatcher(
+            batch_handler=batch_handler,
+            queue=request_queue,
+            queue_threshold=queue_threshold,
+            time_threshold=interval,
+            time_interval=interval,
+            request_kwargs=request_kwargs,
+            **dispatcher_kwargs
+        )
+
+        async def wait_until_processed():
+            await all_processed.wait()
+            # Let the handler finish processing the last batch before stopping it
+            while batch_handler.queues["processing"]:
+                await asyncio.sleep(interval / 10)
+
+        start_time = time.perf_counter()
+        await asyncio.to_thread(request_queue.add_requests, generate_requests(num_requests))
+        tasks = [asyncio.create_task(batch_dispatcher.run()), asyncio.create_task(batch_handler.run())]
+        try:
+            await asyncio.wait_for(wait_until_processed(), timeout=timeout)
+            completed = True
+        except asyncio.TimeoutError:
+            logger.warning(f"Load test timed out after {timeout} seconds")
+            completed = False
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - start_time
+
+        processed = stats["successful_results"] + stats["unsuccessful_results"]
+        return {
+            "requests": num_requests,
+            "batches": stats["batches"],
+            "successful_results": stats["successful_results"],
+            "unsuccessful_results": stats["unsuccessful_results"],
+            "completed": completed,
+            "elapsed": elapsed,
+            "time_to_first_result": stats["first_result_at"] - start_time if stats["first_result_at"] else None,
+            "throughput": processed / elapsed if elapsed > 0 else 0.0,
+            "api_calls": dict(provider.calls)
+        }
@@ -0,0 +1,644 @@
+"""
+In-process mock of the batch APIs of the providers, for testing and load testing the batch pipeline without provider accounts.
+"""
+
+import re
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from collections import Counter
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from langbatch import json_codec
+
+logger = logging.getLogger(__name__)
+
+class MockProviderTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    httpx transport that answers the requests of the provider clients with the MockProvider, without any network calls.
+    Supports both sync and async clients.
+    """
+    def __init__(self, provider: "MockProvider"):
+        self.provider = provider
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        latency = self.provider._sample_latency()
+        if latency > 0:
+            time.sleep(latency)
+        return self.provider._handle_request(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        latency = self.provider._sample_latency()
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return self.provider._handle_request(request)
+
+class MockProvider:
+    """
+    In-process mock provider implementing the OpenAI files and batches endpoints, the Anthropic message batches endpoints,
+    the real-time chat completion, embedding and messages endpoints, and stubs of the Bedrock and S3 clients used by BedrockBatch.
+
+    Batches complete after a sampled completion time, and batches and requests fail at the given rates.
+    All the random choices are made with a seeded random generator, so runs are deterministic.
+
+    Usage:
+    ```python
+    provider = MockProvider(
+        latency=0.01,
+        completion_time=lambda rng: rng.uniform(1, 5),
+        failure_rate=0.1,
+        request_failure_rate=0.01,
+        seed=42
+    )
+
+    batch = OpenAIChatCompletionBatch(
+        "path/to/file.jsonl",
+        client=provider.openai_client(),
+        async_client=provider.async_openai_client()
+    )
+    batch.start()
+
+    batch = AnthropicChatCompletionBatch(
+        "path/to/file.jsonl",
+        client=provider.anthropic_client(),
+        async_client=provider.async_anthropic_client()
+    )
+
+    # Bedrock batches use the shared boto3 clients, replace them with the stubs
+    batch = BedrockClaudeChatCompletionBatch("path/to/file.jsonl", model, input_bucket, output_bucket, region, service_role)
+    batch._client = provider.bedrock_client()
+    batch._s3_client = provider.s3_client()
+    ```
+    """
+    base_url: str = "http://mock-provider"
+
+    def __init__(
+            self,
+            latency: float | Callable[[random.Random], float] = 0.0,
+            completion_time: float | Callable[[random.Random], float] = 1.0,
+            failure_rate: float = 0.0,
+            request_failure_rate: float = 0.0,
+            failure_code: str = "token_limit_exceeded",
+            seed: int = 0,
+            clock: Callable[[], float] = time.monotonic
+        ):
+        """
+        Initialize the MockProvider.
+
+        Args:
+            latency (float | Callable, optional): Latency of each API call in seconds,
+                or a function sampling it from the random generator. Defaults to 0.
+            completion_time (float | Callable, optional): Time in seconds from the creation of a batch to its completion,
+                or a function sampling it from the random generator. Ex. `lambda rng: rng.expovariate(1 / 600)`. Defaults to 1.
+            failure_rate (float, optional): Fraction of the batches that fail instead of completing. Defaults to 0.
+                Anthropic message batches do not fail as a whole, all their requests error instead.
+            request_failure_rate (float, optional): Fraction of the requests that fail in completed batches
+                and in real-time calls. Defaults to 0.
+            failure_code (str, optional): Error code of the failed OpenAI batches. Defaults to "token_limit_exceeded".
+            seed (int, optional): Seed of the random generator. Defaults to 0.
+            clock (Callable, optional): Clock used for the completion of the batches. Defaults to time.monotonic.
+        """
+        self.latency = latency
+        self.completion_time = completion_time
+        self.failure_rate = failure_rate
+        self.request_failure_rate = request_failure_rate
+        self.failure_code = failure_code
+        self.clock = clock
+
+        self.calls: Counter = Counter() # API call name -> number of calls
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.objects: Dict[Tuple[str, str], bytes] = {} # (bucket, key) -> content of the S3 stub
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._routes = [
+            ("POST", r"/v1/files", self._create_file),
+            ("GET", r"/v1/files/(?P<file_id>[^/]+)/content", self._get_file_content),
+            ("POST", r"/v1/batches", self._create_openai_batch),
+            ("GET", r"/v1/batches", self._list_openai_batches),
+            ("GET", r"/v1/batches/(?P<batch_id>[^/]+)", self._retrieve_openai_batch),
+            ("POST", r"/v1/batches/(?P<batch_id>[^/]+)/cancel", self._cancel_openai_batch),
+            ("POST", r"/v1/chat/completions", self._create_chat_completion),
+            ("POST", r"/v1/embeddings", self._create_embedding),
+            ("POST", r"/v1/messages/batches", self._create_anthropic_batch),
+            ("GET", r"/v1/messages/batches", self._list_anthropic_batches),
+            ("GET", r"/v1/messages/batches/(?P<batch_id>[^/]+)", self._retrieve_anthropic_batch),
+            ("POST", r"/v1/messages/batches/(?P<batch_id>[^/]+)/cancel", self._cancel_anthropic_batch),
+            ("GET", r"/v1/messages/batches/(?P<batch_id>[^/]+)/results", self._get_anthropic_results),
+            ("POST", r"/v1/messages", self._create_message),
+        ]
+
+    # Clients
+    def transport(self) -> MockProviderTransport:
+        return MockProviderTransport(self)
+
+    def openai_client(self):
+        from openai import OpenAI
+        return OpenAI(api_key="mock", base_url=f"{self.base_url}/v1", max_retries=0, http_client=httpx.Client(transport=self.transport()))
+
+    def async_openai_client(self):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key="mock", base_url=f"{self.base_url}/v1", max_retries=0, http_client=httpx.AsyncClient(transport=self.transport()))
+
+    def anthropic_client(self):
+        from anthropic import Anthropic
+        return Anthropic(api_key="mock", base_url=self.base_url, max_retries=0, http_client=httpx.Client(transport=self.transport()))
+
+    def async_anthropic_client(self):
+        from anthropic import AsyncAnthropic
+        return AsyncAnthropic(api_key="mock", base_url=self.base_url, max_retries=0, http_client=httpx.AsyncClient(transport=self.transport()))
+
+    def bedrock_client(self, region: str = "us-east-1") -> "MockBedrockClient":
+        return MockBedrockClient(self, region)
+
+    def s3_client(self) -> "MockS3Client":
+        return MockS3Client(self)
+
+    def client_kwargs(self, batch_type: type) -> Dict[str, Any]:
+        """
+        Get the batch kwargs with the mock clients for the batch class.
+        """
+        from langbatch.openai import OpenAIBatch
+        if issubclass(batch_type, OpenAIBatch):
+            return {"client": self.openai_client(), "async_client": self.async_openai_client()}
+
+        try:
+            from langbatch.anthropic import AnthropicBatch
+            if issubclass(batch_type, AnthropicBatch):
+                return {"client": self.anthropic_client(), "async_client": self.async_anthropic_client()}
+        except ImportError:
+            pass
+
+        raise ValueError(f"No mock clients for batch class {batch_type.__name__}")
+
+    # Sampling
+    def _sample(self, value: float | Callable[[random.Random], float]) -> float:
+        if callable(value):
+            with self._lock:
+                return value(self._rng)
+        return value
+
+    def _sample_latency(self) -> float:
+        return self._sample(self.latency)
+
+    def _random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _new_batch(self, provider: str, requests: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        batch = {
+            "provider": provider,
+            "requests": requests,
+            "created_at": int(time.time()),
+            "completes_at": self.clock() + self._sample(self.completion_time),
+            "failed": self._random() < self.failure_rate,
+            "cancelled": False,
+            "results": None,
+            **kwargs
+        }
+        with self._lock:
+            self.batches[kwargs["id"]] = batch
+        return batch
+
+    def _is_done(self, batch: Dict[str, Any]) -> bool:
+        return batch["cancelled"] or self.clock() >= batch["completes_at"]
+
+    def _list_page(self, provider: str, after: str | None, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Get a page of the batches of the provider, newest first, after the batch with the given id.
+        """
+        with self._lock:
+            batches = [batch for batch in reversed(list(self.batches.values())) if batch["provider"] == provider]
+        if after is not None:
+            ids = [batch["id"] for batch in batches]
+            batches = batches[ids.index(after) + 1:] if after in ids else []
+        return batches[:limit], len(batches) > limit
+
+    # Request routing
+    def _handle_request(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        for method, pattern, handler in self._routes:
+            match = re.fullmatch(pattern, path)
+            if request.method == method and match:
+                with self._lock:
+                    self.calls[handler.__name__.lstrip("_")] += 1
+                return handler(request, **match.groupdict())
+
+        logger.warning(f"Mock provider has no route for {request.method} {path}")
+        return httpx.Response(404, json={"error": {"type": "not_found_error", "message": f"No route for {request.method} {path}"}})
+
+    @staticmethod
+    def _not_found(name: str) -> httpx.Response:
+        return httpx.Response(404, json={"error": {"type": "not_found_error", "message": f"{name} not found"}})
+
+    # Responses, override to customize the generated responses
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "Mock response"},
+                "logprobs": None,
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+        }
+
+    def embedding(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input")
+        inputs = inputs if isinstance(inputs, list) else [inputs]
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": [0.0] * 8} for i in range(len(inputs))],
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        }
+
+    def message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model"),
+            "content": [{"type": "text", "text": "Mock response"}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 10, "output_tokens": 2}
+        }
+
+    # OpenAI
+    def _create_file(self, request: httpx.Request) -> httpx.Response:
+        fields = _parse_multipart(request)
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self._lock:
+            self.files[file_id] = fields["file"]
+        return httpx.Response(200, json=self._file_object(file_id, fields.get("purpose", b"batch").decode()))
+
+    def _file_object(self, file_id: str, purpose: str) -> Dict[str, Any]:
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(self.files[file_id]),
+            "created_at": int(time.time()),
+            "filename": f"{file_id}.jsonl",
+            "purpose": purpose,
+            "status": "processed"
+        }
+
+    def _get_file_content(self, request: httpx.Request, file_id: str) -> httpx.Response:
+        if file_id not in self.files:
+            return self._not_found("File")
+        return httpx.Response(200, content=self.files[file_id])
+
+    def _create_openai_batch(self, request: httpx.Request) -> httpx.Response:
+        body = json_codec.loads(request.content)
+        input_file = self.files.get(body["input_file_id"])
+        if input_file is None:
+            return self._not_found("File")
+
+        requests = [json_codec.loads(line) for line in input_file.splitlines() if line.strip()]
+        batch = self._new_batch(
+            "openai",
+            requests,
+            id=f"batch_{uuid.uuid4().hex}",
+            input_file_id=body["input_file_id"],
+            endpoint=body["endpoint"]
+        )
+        return httpx.Response(200, json=self._openai_batch_object(batch))
+
+    def _openai_batch_object(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        errors = None
+        output_file_id = error_file_id = None
+        if batch["cancelled"]:
+            status = "cancelled"
+        elif not self._is_done(batch):
+            status = "in_progress"
+        elif batch["failed"]:
+            status = "failed"
+            errors = {"object": "list", "data": [{"code": self.failure_code, "message": "Mock batch failure", "line": None, "param": None}]}
+        else:
+            status = "completed"
+            output_file_id, error_file_id = self._write_openai_results(batch)
+
+        failed = len(batch["results"][1]) if batch["results"] else 0
+        return {
+            "id": batch["id"],
+            "object": "batch",
+            "endpoint": batch["endpoint"],
+            "errors": errors,
+            "input_file_id": batch["input_file_id"],
+            "completion_window": "24h",
+            "status": status,
+            "output_file_id": output_file_id,
+            "error_file_id": error_file_id,
+            "created_at": batch["created_at"],
+            "request_counts": {
+                "total": len(batch["requests"]),
+                "completed": len(batch["requests"]) - failed if status == "completed" else 0,
+                "failed": failed
+            },
+            "metadata": None
+        }
+
+    def _write_openai_results(self, batch: Dict[str, Any]) -> Tuple[str | None, str | None]:
+        with self._lock:
+            if batch["results"] is not None:
+                return batch["results"][2], batch["results"][3]
+
+            outputs, errors = [], []
+            for i, request in enumerate(batch["requests"]):
+                if self._rng.random() < self.request_failure_rate:
+                    errors.append({
+                        "id": f"batch_req_{i}",
+                        "custom_id": request["custom_id"],
+                        "response": None,
+                        "error": {"code": "server_error", "message": "Mock request failure"}
+                    })
+                    continue
+
+                body = self.embedding(request["body"]) if batch["endpoint"].endswith("embeddings") else self.chat_completion(request["body"])
+                outputs.append({
+                    "id": f"batch_req_{i}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body},
+                    "error": None
+                })
+
+            output_file_id = error_file_id = None
+            if outputs:
+                output_file_id = f"file-{uuid.uuid4().hex}"
+                self.files[output_file_id] = b"".join(json_codec.dumps_bytes(output) + b"\n" for output in outputs)
+            if errors:
+                error_file_id = f"file-{uuid.uuid4().hex}"
+                self.files[error_file_id] = b"".join(json_codec.dumps_bytes(error) + b"\n" for error in errors)
+            batch["results"] = (outputs, errors, output_file_id, error_file_id)
+
+        return output_file_id, error_file_id
+
+    def _retrieve_openai_batch(self, request: httpx.Request, batch_id: str) -> httpx.Response:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return self._not_found("Batch")
+        return httpx.Response(200, json=self._openai_batch_object(batch))
+
+    def _list_openai_batches(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        batches, has_more = self._list_page("openai", params.get("after"), int(params.get("limit", 20)))
+        data = [self._openai_batch_object(batch) for batch in batches]
+        return httpx.Response(200, json={
+            "object": "list",
+            "data": data,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None,
+            "has_more": has_more
+        })
+
+    def _cancel_openai_batch(self, request: httpx.Request, batch_id: str) -> httpx.Response:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return self._not_found("Batch")
+        if not self._is_done(batch):
+            batch["cancelled"] = True
+        return httpx.Response(200, json=self._openai_batch_object(batch))
+
+    def _realtime_failure(self) -> httpx.Response | None:
+        if self._random() < self.request_failure_rate:
+            return httpx.Response(500, json={"error": {"type": "api_error", "message": "Mock request failure"}})
+        return None
+
+    def _create_chat_completion(self, request: httpx.Request) -> httpx.Response:
+        return self._realtime_failure() or httpx.Response(200, json=self.chat_completion(json_codec.loads(request.content)))
+
+    def _create_embedding(self, request: httpx.Request) -> httpx.Response:
+        return self._realtime_failure() or httpx.Response(200, json=self.embedding(json_codec.loads(request.content)))
+
+    # Anthropic
+    def _create_anthropic_batch(self, request: httpx.Request) -> httpx.Response:
+        body = json_codec.loads(request.content)
+        batch = self._new_batch("anthropic", body["requests"], id=f"msgbatch_{uuid.uuid4().hex}")
+        return httpx.Response(200, json=self._anthropic_batch_object(batch))
+
+    def _anthropic_batch_object(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        done = self._is_done(batch)
+        request_counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        if done:
+            for result in self._get_anthropic_result_lines(batch):
+                request_counts[result["result"]["type"]] += 1
+        else:
+            request_counts["processing"] = len(batch["requests"])
+
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if done else "in_progress",
+            "request_counts": request_counts,
+            "created_at": batch["created_at"],
+            "expires_at": batch["created_at"] + 24 * 3600,
+            "ended_at": int(time.time()) if done else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch['id']}/results" if done else None
+        }
+
+    def _get_anthropic_result_lines(self, batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+        with self._lock:
+            if batch["results"] is None:
+                results = []
+                for request in batch["requests"]:
+                    if batch["cancelled"]:
+                        result = {"type": "canceled"}
+                    elif batch["failed"] or self._rng.random() < self.request_failure_rate:
+                        result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "Mock request failure"}}}
+                    else:
+                        result = {"type": "succeeded", "message": self.message(request["params"])}
+                    results.append({"custom_id": request["custom_id"], "result": result})
+                batch["results"] = results
+        return batch["results"]
+
+    def _retrieve_anthropic_batch(self, request: httpx.Request, batch_id: str) -> httpx.Response:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return self._not_found("Message batch")
+        return httpx.Response(200, json=self._anthropic_batch_object(batch))
+
+    def _list_anthropic_batches(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        batches, has_more = self._list_page("anthropic", params.get("after_id"), int(params.get("limit", 20)))
+        data = [self._anthropic_batch_object(batch) for batch in batches]
+        return httpx.Response(200, json={
+            "data": data,
+            "first_id": data[0]["id"] if data else None,
+            "last_id": data[-1]["id"] if data else None,
+            "has_more": has_more
+        })
+
+    def _cancel_anthropic_batch(self, request: httpx.Request, batch_id: str) -> httpx.Response:
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return self._not_found("Message batch")
+        if not self._is_done(batch):
+            batch["cancelled"] = True
+        return httpx.Response(200, json=self._anthropic_batch_object(batch))
+
+    def _get_anthropic_results(self, request: httpx.Request, batch_id: str) -> httpx.Response:
+        batch = self.batches.get(batch_id)
+        if batch is None or not self._is_done(batch):
+            return self._not_found("Message batch results")
+        content = b"".join(json_codec.dumps_bytes(result) + b"\n" for result in self._get_anthropic_result_lines(batch))
+        return httpx.Response(200, content=content, headers={"content-type": "application/binary"})
+
+    def _create_message(self, request: httpx.Request) -> httpx.Response:
+        return self._realtime_failure() or httpx.Response(200, json=self.message(json_codec.loads(request.content)))
+
+    # Bedrock
+    def _create_bedrock_job(self, **kwargs) -> Dict[str, Any]:
+        input_bucket, input_prefix = _parse_s3_uri(kwargs["inputDataConfig"]["s3InputDataConfig"]["s3Uri"])
+        output_bucket, output_prefix = _parse_s3_uri(kwargs["outputDataConfig"]["s3OutputDataConfig"]["s3Uri"])
+        content = self.objects[(input_bucket, f"{input_prefix}input.jsonl")]
+        requests = [json_codec.loads(line) for line in content.splitlines() if line.strip()]
+
+        job_id = uuid.uuid4().hex[:12]
+        batch = self._new_batch(
+            "bedrock",
+            requests,
+            id=f"arn:aws:bedrock:mock:000000000000:model-invocation-job/{job_id}",
+            model=kwargs["modelId"],
+            output_key=(output_bucket, f"{output_prefix}{job_id}/input.jsonl.out")
+        )
+        return {"jobArn": batch["id"]}
+
+    def _get_bedrock_job(self, job_arn: str) -> Dict[str, Any]:
+        batch = self.batches[job_arn]
+        if batch["cancelled"]:
+            status = "Stopped"
+        elif not self._is_done(batch):
+            status = "InProgress"
+        elif batch["failed"]:
+            status = "Failed"
+        else:
+            status = "Completed"
+            self._write_bedrock_results(batch)
+
+        job = {"jobArn": job_arn, "modelId": batch["model"], "status": status}
+        if status == "Failed":
+            job["message"] = "Mock batch failure"
+        return job
+
+    def _write_bedrock_results(self, batch: Dict[str, Any]):
+        with self._lock:
+            if batch["results"] is not None:
+                return
+
+            lines = []
+            for request in batch["requests"]:
+                record = {"recordId": request["recordId"], "modelInput": request["modelInput"]}
+                if self._rng.random() < self.request_failure_rate:
+                    record["error"] = {"errorCode": 500, "errorMessage": "Mock request failure"}
+                elif "nova" in batch["model"]:
+                    record["modelOutput"] = {
+                        "output": {"message": {"role": "assistant", "content": [{"text": "Mock response"}]}},
+                        "stopReason": "end_turn",
+                        "usage": {"inputTokens": 10, "outputTokens": 2, "totalTokens": 12}
+                    }
+                else:
+                    record["modelOutput"] = self.message(request["modelInput"])
+                lines.append(record)
+
+            batch["results"] = lines
+            self.objects[batch["output_key"]] = b"".join(json_codec.dumps_bytes(line) + b"\n" for line in lines)
+
+class MockBedrockClient:
+    """
+    Stub of the boto3 Bedrock client methods used by BedrockBatch.
+    """
+    def __init__(self, provider: MockProvider, region: str = "us-east-1"):
+        self.provider = provider
+        self.meta = SimpleNamespace(region_name=region)
+
+    def _get_credentials(self) -> None:
+        # all the mock clients list the jobs of the provider, without credentials
+        return None
+
+    def create_model_invocation_job(self, **kwargs) -> Dict[str, Any]:
+        self.provider.calls["create_model_invocation_job"] += 1
+        time.sleep(self.provider._sample_latency())
+        return self.provider._create_bedrock_job(**kwargs)
+
+    def get_model_invocation_job(self, jobIdentifier: str) -> Dict[str, Any]:
+        self.provider.calls["get_model_invocation_job"] += 1
+        time.sleep(self.provider._sample_latency())
+        return self.provider._get_bedrock_job(jobIdentifier)
+
+    def list_model_invocation_jobs(self, maxResults: int = 1000, nextToken: str | None = None, submitTimeAfter=None, **kwargs) -> Dict[str, Any]:
+        self.provider.calls["list_model_invocation_jobs"] += 1
+        time.sleep(self.provider._sample_latency())
+        batches, has_more = self.provider._list_page("bedrock", nextToken, maxResults)
+        jobs = []
+        for batch in batches:
+            job = self.provider._get_bedrock_job(batch["id"])
+            job["submitTime"] = datetime.fromtimestamp(batch["created_at"], tz=timezone.utc)
+            if submitTimeAfter is None or job["submitTime"] > submitTimeAfter:
+                jobs.append(job)
+
+        response = {"invocationJobSummaries": jobs}
+        if has_more:
+            response["nextToken"] = batches[-1]["id"]
+        return response
+
+    def stop_model_invocation_job(self, jobIdentifier: str) -> Dict[str, Any]:
+        self.provider.calls["stop_model_invocation_job"] += 1
+        batch = self.provider.batches[jobIdentifier]
+        if not self.provider._is_done(batch):
+            batch["cancelled"] = True
+        return {}
+
+class MockS3Client:
+    """
+    Stub of the boto3 S3 client methods used by BedrockBatch, storing the objects in the MockProvider.
+    """
+    def __init__(self, provider: MockProvider):
+        self.provider = provider
+
+    def upload_file(self, filename: str, bucket: str, key: str):
+        with open(filename, "rb") as file:
+            self.provider.objects[(bucket, key)] = file.read()
+
+    def download_file(self, bucket: str, key: str, filename: str):
+        content = self.provider.objects.get((bucket, key))
+        if content is None:
+            from botocore.exceptions import ClientError
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "GetObject")
+
+        with open(filename, "wb") as file:
+            file.write(content)
+
+def _parse_s3_uri(uri: str) -> Tuple[str, str]:
+    bucket, _, prefix = uri.removeprefix("s3://").partition("/")
+    return bucket, prefix
+
+def _parse_multipart(request: httpx.Request) -> Dict[str, bytes]:
+    """
+    Parse the fields of a multipart/form-data request body, as sent by the file upload of the OpenAI client.
+    """
+    boundary = request.headers["content-type"].split("boundary=")[-1].strip('"').encode()
+    fields = {}
+    for part in request.content.split(b"--" + boundary):
+        headers, separator, value = part.partition(b"\r\n\r\n")
+        if not separator:
+            continue
+        name = re.search(rb'name="([^"]+)"', headers)
+        if name:
+            fields[name.group(1).decode()] = value.removesuffix(b"\r\n")
+    return fields
@@ -1,8 +1,12 @@
 import os
+import time
+import json
+import asyncio
+import hashlib
 import logging
 from pathlib import Path
+from typing import Any, Dict
 import base64
-import httpx
 
 def get_data_path():
     # Default data path, can be overridden by environment variable
@@ -36,8 +40,48 @@ def get_data_path():
         raise PermissionError(f"Unable to write to default data path: {data_path}. Error: {e}")
 
 def get_web_image(image_url: str):
+    import httpx # imported on first use, to keep the import of langbatch fast
+
     response = httpx.get(image_url)
     response.raise_for_status()
     image_media_type = response.headers.get("content-type")
     image_data = base64.b64encode(response.content).decode("utf-8")
-    return image_media_type, image_data
\ No newline at end of file
+    return image_media_type, image_data
+
+def hash_request_body(body: Dict[str, Any]) -> str:
+    """
+    Get a deterministic hash of a request body.
+    Bodies are canonicalized (sorted keys, compact separators) before hashing,
+    so bodies with the same content have the same hash irrespective of the key order.
+    """
+    canonical_body = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical_body.encode("utf-8")).hexdigest()
+
+class RateLimiter:
+    """
+    Async rate limiter spacing out calls evenly to stay within the given number of requests per minute.
+
+    Usage:
+    ```python
+    rate_limiter = RateLimiter(requests_per_minute=500)
+
+    async def send(request):
+        await rate_limiter.acquire()
+        ...
+    ```
+    """
+    def __init__(self, requests_per_minute: int | None = None):
+        self.interval = 60 / requests_per_minute if requests_per_minute else 0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
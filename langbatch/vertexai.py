@@ -3,13 +3,10 @@ import logging
 import json
 from typing import Any, Dict
 
-import jsonlines
-from vertexai.preview.batch_prediction import BatchPredictionJob
-
+from langbatch import json_codec
 from langbatch.Batch import Batch
 from langbatch.ChatCompletionBatch import ChatCompletionBatch
-from langbatch.bigquery_utils import write_data_to_bigquery, read_data_from_bigquery, create_table
-from langbatch.schemas import VertexAIChatCompletionRequest, VertexAILlamaChatCompletionRequest, AnthropicChatCompletionRequest
+from langbatch.schemas import VertexAIChatCompletionRequest, VertexAILlamaChatCompletionRequest, AnthropicChatCompletionRequest, validate_request_body
 from langbatch.claude_utils import convert_request, convert_message
 from langbatch.errors import BatchStartError, BatchStateError
 
@@ -25,12 +22,20 @@ vertexai_state_map = {
     'JOB_STATE_PAUSED': 'paused',
 }
 
+# The Vertex AI and BigQuery SDKs take seconds to import, they are imported on first use
+
+def _batch_prediction_job():
+    from vertexai.preview.batch_prediction import BatchPredictionJob
+    return BatchPredictionJob
+
 class VertexAIBatch(Batch):
     """
     VertexAIBatch is a class for Vertex AI batch processing.
     Implements the Batch class for Vertex AI API.
     """
+    _keep_validated_requests: bool = True # the requests are converted to the provider format when starting the batch
     _url: str = "/v1/chat/completions"
+    _provider: str = "vertexai"
     _field_name: str = "request"
     _publisher: str = "google"
 
@@ -84,6 +89,7 @@ class VertexAIBatch(Batch):
         return meta_data
 
     def _create_table(self, dataset_id: str):
+        from langbatch.bigquery_utils import create_table
         return create_table(self.gcp_project, dataset_id, self.id, self._field_name)
 
     @abstractmethod
@@ -91,7 +97,7 @@ class VertexAIBatch(Batch):
         pass
 
     def _prepare_data(self):
-        requests = self._get_requests()
+        requests = self._get_validated_requests()
         data = []
         for request in requests:
             data.append(self._convert_request(request))
@@ -101,15 +107,18 @@ class VertexAIBatch(Batch):
         if self.platform_batch_id is None:
             self._create_table(self.bigquery_input_dataset)
 
-        data = self._prepare_data()
-        status = write_data_to_bigquery(self.gcp_project, self.bigquery_input_dataset, self.id, data, self._field_name)
+        with self._record_timing("conversion"):
+            data = self._prepare_data()
+        with self._record_timing("upload"):
+            from langbatch.bigquery_utils import write_data_to_bigquery
+            status = write_data_to_bigquery(self.gcp_project, self.bigquery_input_dataset, self.id, data, self._field_name)
         if not status:
             raise BatchStartError("Error writing data to BigQuery")
         
         return f"bq://{self.gcp_project}.{self.bigquery_input_dataset}.{self.id}"
 
     def _create_batch(self, input_dataset, output_dataset):
-        job = BatchPredictionJob.submit(
+        job = _batch_prediction_job().submit(
             f"publishers/{self._publisher}/models/{self.model}",
             input_dataset,
             output_uri_prefix = output_dataset
@@ -118,7 +127,7 @@ class VertexAIBatch(Batch):
         self.platform_batch_id = job.name
 
     def start(self):
-        if self.platform_batch_id is not None:
+        if self.platform_batch_id is not None or self.realtime_results_file is not None:
             raise BatchStateError("Batch already started")
         
         input_dataset = self._upload_batch_file()
@@ -127,10 +136,13 @@ class VertexAIBatch(Batch):
         self._create_batch(input_dataset, output_dataset)
     
     def get_status(self):
+        if self.realtime_results_file is not None:
+            return "completed"
+
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
         
-        job = BatchPredictionJob(self.platform_batch_id)
+        job = _batch_prediction_job()(self.platform_batch_id)
         return vertexai_state_map[str(job.state.name)]
 
     @abstractmethod
@@ -138,6 +150,7 @@ class VertexAIBatch(Batch):
         pass
 
     def _download_results_file(self):
+        from langbatch.bigquery_utils import read_data_from_bigquery
         data = read_data_from_bigquery(self.gcp_project, self.bigquery_output_dataset, self.id)
         responses = []
         for element in data:
@@ -146,13 +159,12 @@ class VertexAIBatch(Batch):
                 responses.append(response)
 
         file_path = self._create_results_file_path()
-        with jsonlines.open(file_path, mode='w') as writer:
-            writer.write_all(responses)
+        json_codec.write_jsonl(file_path, responses)
 
         return file_path
 
     def _get_errors(self):
-        job = BatchPredictionJob(self.platform_batch_id)
+        job = _batch_prediction_job()(self.platform_batch_id)
         job_object = job.to_dict()
         if 'error' in job_object:
             return job_object['error']['message']
@@ -175,7 +187,7 @@ class VertexAIBatch(Batch):
         if self.platform_batch_id is None:
             raise BatchStateError("Batch not started")
         
-        job = BatchPredictionJob(self.platform_batch_id)
+        job = _batch_prediction_job()(self.platform_batch_id)
         input_dataset = job._gca_resource.input_config.bigquery_source.input_uri
         output_dataset = job._gca_resource.output_config.bigquery_destination.output_uri
 
@@ -193,6 +205,7 @@ class VertexAIChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
     ```
     """
     _url: str = "/v1/chat/completions"
+    _request_schema = VertexAIChatCompletionRequest
 
     def _convert_request(self, req: dict) -> str:
         custom_schema = {
@@ -201,24 +214,25 @@ class VertexAIChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
             "tools": [],
             "generationConfig": {}
         }
-        request = json.loads(VertexAIChatCompletionRequest(**req["body"]).model_dump_json())
+        request = validate_request_body(VertexAIChatCompletionRequest, req["body"])
+        messages = list(request.messages)
 
         # Track tool responses to match with tool calls
         tool_responses = {}
         
         # First pass - collect tool responses
-        for message in request["messages"]:
+        for message in messages:
             if message["role"] == "tool":
                 tool_call_id = message["tool_call_id"]
                 if tool_call_id:
                     tool_responses[tool_call_id] = {
-                        "response": json.loads(message["content"])
+                        "response": json_codec.loads(message["content"])
                     }
         
         # Second pass - process messages
-        for message in request["messages"]:
+        for message in messages:
             role = message["role"]
-            content = message["content"]
+            content = message.get("content")
 
             function_calls = []
             tool_responses_cache = []
@@ -227,7 +241,7 @@ class VertexAIChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
                     function_calls.append({
                         "functionCall": {
                             "name": tool_call["function"]["name"],
-                            "args": json.loads(tool_call["function"]["arguments"])
+                            "args": json_codec.loads(tool_call["function"]["arguments"])
                         }
                     })
                     # If we have a response for this tool call, add it in the next message
@@ -260,8 +274,8 @@ class VertexAIChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
                     })
 
         # Convert tools
-        if request["tools"]:
-            for tool in request["tools"]:
+        if request.tools:
+            for tool in request.tools:
                 function = tool.get("function", {})
                 
                 custom_schema["tools"].append({
@@ -274,37 +288,38 @@ class VertexAIChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
 
         # Convert generation config
         gen_config = custom_schema["generationConfig"]
-        if request.get("temperature"):
-            gen_config["temperature"] = request["temperature"]
-        if request.get("top_p"):
-            gen_config["topP"] = request["top_p"]
-        if request.get("max_tokens"):
-            gen_config["maxOutputTokens"] = request["max_tokens"]
-        if request.get("n"):
-            gen_config["candidateCount"] = request["n"]
-        if request.get("presence_penalty"):
-            gen_config["presencePenalty"] = request["presence_penalty"]
-        if request.get("frequency_penalty"):
-            gen_config["frequencyPenalty"] = request["frequency_penalty"]
-        if request.get("stop"):
-            gen_config["stopSequences"] = request["stop"] if isinstance(request["stop"], list) else [request["stop"]] if request["stop"] else None
-        if request.get("seed"):
-            gen_config["seed"] = request["seed"]
-
-        if request.get("response_format"):
+        if request.temperature:
+            gen_config["temperature"] = request.temperature
+        if request.top_p:
+            gen_config["topP"] = request.top_p
+        if request.max_tokens:
+            gen_config["maxOutputTokens"] = request.max_tokens
+        if request.n:
+            gen_config["candidateCount"] = request.n
+        if request.presence_penalty:
+            gen_config["presencePenalty"] = request.presence_penalty
+        if request.frequency_penalty:
+            gen_config["frequencyPenalty"] = request.frequency_penalty
+        if request.stop:
+            gen_config["stopSequences"] = request.stop if isinstance(request.stop, list) else [request.stop]
+        if request.seed:
+            gen_config["seed"] = request.seed
+
+        response_format = request.response_format
+        if response_format:
             mime_type_map = {
                 "json_object": "application/json",
                 "text": "text/plain",
                 "json_schema": "application/json"
             }
 
-            gen_config["responseMimeType"] = mime_type_map[request["response_format"]["type"]]
+            gen_config["responseMimeType"] = mime_type_map[response_format["type"]]
 
-            if request["response_format"]["type"] == "json_schema" and request["response_format"]["json_schema"]:
-                gen_config["responseSchema"] = request["response_format"]["json_schema"]
+            if response_format["type"] == "json_schema" and response_format["json_schema"]:
+                gen_config["responseSchema"] = response_format["json_schema"]
 
                 # Check for single enum property to use text/x.enum mime type
-                data = json.loads(request["response_format"]["json_schema"]["schema"])
+                data = json_codec.loads(response_format["json_schema"]["schema"])
                 concrete_types = ["string", "number", "integer", "boolean"]
                 if data.get("type") in concrete_types and len(data.get("enum", [])) == 0:
                     gen_config["responseMimeType"] = "text/x.enum"
@@ -315,17 +330,17 @@ class VertexAIChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
 
         return { 
             "custom_id": req["custom_id"],
-            "request": json.dumps(custom_schema, indent=2)
+            "request": json_codec.dumps(custom_schema)
         }
 
     def _convert_response(self, response):
         # Parse the input JSON
-        response_data = json.loads(response["response"])
+        response_data = json_codec.loads(response["response"])
 
         status = response["status"]
         if status != "":
             if "Bad Request: " in status:
-                error_data = json.loads(status.split("Bad Request: ")[1])
+                error_data = json_codec.loads(status.split("Bad Request: ")[1])
             else:
                 error_data = {
                     "message": status,
@@ -412,13 +427,11 @@ class VertexAIChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
 
         return output
 
-    def _validate_request(self, request):
-        VertexAIChatCompletionRequest(**request)
-
 class VertexAIClaudeChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
     _url: str = "/v1/chat/completions"
     _publisher: str = "anthropic"
     _field_name: str = "request"
+    _request_schema = AnthropicChatCompletionRequest
 
     def _convert_request(self, req: dict) -> str:
         request = convert_request(req)
@@ -427,16 +440,16 @@ class VertexAIClaudeChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
 
         return {
             "custom_id": req["custom_id"],
-            "request": json.dumps(request, indent=2)
+            "request": json_codec.dumps(request)
         }
 
     def _convert_response(self, response):
-        response_data = json.loads(response["response"])
+        response_data = json_codec.loads(response["response"])
 
         status = response["status"]
         if status != "":
             if "Bad Request: " in status:
-                error_data = json.loads(status.split("Bad Request: ")[1])
+                error_data = json_codec.loads(status.split("Bad Request: ")[1])
             else:
                 error_data = {
                     "message": status,
@@ -462,16 +475,14 @@ class VertexAIClaudeChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
 
         return output
 
-    def _validate_request(self, request):
-        AnthropicChatCompletionRequest(**request)
-
 class VertexAILlamaChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
     _url: str = "/v1/chat/completions"
     _publisher: str = "meta"
     _field_name: str = "body"
+    _request_schema = VertexAILlamaChatCompletionRequest
 
     def _convert_request(self, req: dict) -> str:
-        request = VertexAILlamaChatCompletionRequest(**req["body"])
+        request = validate_request_body(VertexAILlamaChatCompletionRequest, req["body"])
 
         request.model = f"meta/{self.model}"
 
@@ -481,7 +492,7 @@ class VertexAILlamaChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
         }
 
     def _convert_response(self, response):
-        response_data = json.loads(response["response"])
+        response_data = json_codec.loads(response["response"])
         res = {
             "request_id": response["custom_id"],
             "status_code": 200,
@@ -495,7 +506,4 @@ class VertexAILlamaChatCompletionBatch(VertexAIBatch, ChatCompletionBatch):
             "error": response["error"]
         }
 
-        return output
-
-    def _validate_request(self, request):
-        VertexAILlamaChatCompletionRequest(**request)
\ No newline at end of file
+        return output
\ No newline at end of file